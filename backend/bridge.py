@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
-import configparser
+import argparse
+import json
+import multiprocessing
 import os
 import sys
+import threading
 import time
+from collections import OrderedDict
+from dataclasses import asdict, replace
 
 try:
     from backend.logger import log
@@ -18,12 +23,202 @@ except ImportError:
         logging.basicConfig(level=logging.INFO)
 
 try:
-    from backend import utils
+    from backend import (
+        inotify, ipc, kde_wallpaper, metrics, precompute, render, rotation, scheduler,
+        state, utils,
+    )
 except ImportError:
+    import inotify
+    import ipc
+    import kde_wallpaper
+    import metrics
+    import precompute
+    import render
+    import rotation
+    import scheduler
+    import state
     import utils
 
 
-class GnomeEngine:
+class PipelineMixin:
+    """
+    两个引擎共用的生成流程：根据配置差异跳过不需要的阶段。
+    - 只改了 flavor：沿用上次的壁纸，不重新获取/取色
+    - 改了 colorMode：重新获取壁纸 (深浅色壁纸可能不同)，调色板来自缓存
+    - 输出没有变化且模式未变：不刷新 UI
+    """
+
+    applied = None  # 上次成功应用的 AppConfig
+    last_wall = None
+    PREVIEW_MEMO_SIZE = 64
+    # 这些配置变化后需要重新安排壁纸轮换
+    ROTATION_FIELDS = {
+        "rotation_interval", "rotation_shuffle", "wallpaper_folder", "recursive_scan",
+        "color_mode", "flavor",
+    }
+
+    def init_pipeline(self):
+        self.started_at = time.monotonic()
+        # 进程内取色的结果不会写入调色板缓存，这里在内存中保留最近的预览
+        self._previews = OrderedDict()
+        self._previews_lock = threading.Lock()
+        # 壁纸轮换，由 main() 启动 (见 rotation.py)
+        self.rotation = rotation.Rotation(self)
+
+    def run_pipeline(self, config, refetch=False, force=False):
+        with metrics.generation() as gen:
+            wall = self._run_stages(config, refetch, force)
+        if wall:
+            self._record_run(gen, wall, config)
+
+    def run_rotation(self, path):
+        """
+        [轮换] 切换到 path：写入预热时渲染好的输出，设置壁纸后立即刷新 UI。
+        没有预热结果时走完整流程。随后由壁纸变化触发的更新会因壁纸未变而跳过。
+        """
+        config = utils.load_config()
+        mode = config.color_mode
+        with metrics.generation() as gen:
+            with metrics.span("fetch"):
+                wall = utils.wallpaper_for_apply(path, mode)
+            prepared = self.rotation.take(path, wall, mode, config.flavor)
+            if prepared is not None:
+                with metrics.span("swap"):
+                    result = render.commit_outputs(prepared)
+            else:
+                log.info(f"Rotation target {path} was not prewarmed, generating now")
+                with metrics.span("generate"):
+                    result = utils.run_matugen(wall, mode, config.flavor)
+            self.set_wallpaper(path)
+            self.rotation.switched(path)
+            if not result:
+                # 壁纸照常切换，之后的壁纸变化事件会再走一遍完整流程
+                log.error(f"Failed to generate theme for rotation target {path}")
+                return
+            self.applied = config
+            self.last_wall = wall
+            utils.save_state(wall)
+            if result.changed:
+                with metrics.span("refresh"):
+                    self.refresh_ui(mode)
+        log.info(f"Rotated to {path} ({'prewarmed' if prepared else 'cold'})")
+        self._record_run(gen, wall, config)
+
+    def _record_run(self, gen, wall, config):
+        metrics.record(metrics.PIPELINE, gen.total_ms)
+        log.info(
+            "Pipeline finished in %.1f ms", gen.total_ms,
+            extra={"stage": metrics.PIPELINE, "duration_ms": gen.total_ms, "stages": gen.spans},
+        )
+        metrics.check_budget(gen)
+        state.record_run(gen.spans, gen.total_ms, gen.started)
+        state.record_apply(
+            wall,
+            config.color_mode,
+            config.flavor,
+            utils.get_cached_source(wall),
+            asdict(config),
+        )
+
+    def _run_stages(self, config, refetch, force):
+        """执行需要的阶段，应用了新主题时返回壁纸路径"""
+        changes = config.diff(self.applied)
+        if self.applied is not None and changes & self.ROTATION_FIELDS:
+            self.rotation.config_changed()
+        wall = self.last_wall
+        if refetch or force or wall is None or changes & {"color_mode", "current_wallpaper"}:
+            with metrics.span("fetch"):
+                wall = utils.get_current_wallpaper(config.color_mode)
+        if not wall:
+            return None
+        if not force and wall == self.last_wall and not changes & {"color_mode", "flavor"}:
+            log.debug("Nothing relevant changed, skipping update")
+            return None
+
+        if wall != self.last_wall:
+            utils.save_state(wall)  # 缓存给前端用
+        with metrics.span("generate"):
+            result = utils.run_matugen(wall, config.color_mode, config.flavor)
+        if not result:
+            return None
+        self.applied = config
+        self.last_wall = wall
+        if result.changed or "color_mode" in changes:
+            with metrics.span("refresh"):
+                self.refresh_ui(config.color_mode)
+        else:
+            log.info("Theme outputs unchanged, skipping UI refresh")
+        return wall
+
+    # --- IPC (见 ipc.py)，在 IPC 线程中执行 ---
+
+    def ipc_handlers(self):
+        return {
+            "preview": self.ipc_preview,
+            "apply": self.ipc_apply,
+            "status": self.ipc_status,
+            "rotate": lambda request: {"wallpaper": self.rotation.skip()},
+            "stats": lambda request: metrics.snapshot(),
+        }
+
+    def ipc_preview(self, request):
+        """preview(path, mode, flavor) -> 调色板 JSON 字符串，使用服务进程中已预热的缓存"""
+        path = request["path"]
+        mode = request.get("mode", "dark")
+        flavor = request.get("flavor", "tonal-spot")
+        key = utils.palette_cache_key(path, mode, flavor)
+        # 调色板缓存中是应用时 matugen 的结果，优先于内存中的进程内取色结果
+        cached = utils.get_cached_palette(path, mode, flavor)
+        with self._previews_lock:
+            if cached is not None:
+                self._previews.pop(key, None)
+                return cached
+            if key in self._previews:
+                self._previews.move_to_end(key)
+                return self._previews[key]
+
+        # 预览中的取色、解码等阶段单独统计 (preview:*)，不与换色流程的样本混在一起
+        with metrics.span("preview"), metrics.background("preview:"):
+            # 客户端断开 (例如预览已被新的选择取代) 时终止 matugen
+            palette = utils.preview_palette(path, mode, flavor, cancel=request.get("cancel"))
+        if key and palette:
+            with self._previews_lock:
+                self._previews[key] = palette
+                while len(self._previews) > self.PREVIEW_MEMO_SIZE:
+                    self._previews.popitem(last=False)
+        return palette
+
+    def ipc_apply(self, request):
+        """apply(colorMode, flavor, wallpaperFolder, currentWallpaper)：保存配置并安排一次更新"""
+        values = {
+            key: str(request[key])
+            for key in ("colorMode", "flavor", "wallpaperFolder", "currentWallpaper")
+            if request.get(key) is not None
+        }
+        if values.get("colorMode", "dark") not in ("dark", "light"):
+            raise ValueError(f"invalid colorMode: {values['colorMode']}")
+        if values:
+            utils.update_config(values)
+        if request.get("force"):
+            self.scheduler.request("ipc", force=True)
+        else:
+            self.scheduler.request("ipc")
+        return {"generation": self.scheduler.generation}
+
+    def ipc_status(self, request):
+        return {
+            "engine": self.scheduler.name,
+            "pid": os.getpid(),
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "generation": self.scheduler.generation,
+            "wallpaper": self.last_wall,
+            "config": asdict(self.applied) if self.applied else None,
+            "last_run": metrics.snapshot()["last"],
+            "rotation": self.rotation.status(),
+        }
+
+
+class GnomeEngine(PipelineMixin):
     def __init__(self):
         import gi
 
@@ -31,22 +226,30 @@ class GnomeEngine:
         from gi.repository import Gio, GLib
 
         self.Gio = Gio
+        self.GLib = GLib
         self.loop = GLib.MainLoop()
         self.settings_bg = Gio.Settings.new("org.gnome.desktop.background")
         self.settings_interface = Gio.Settings.new("org.gnome.desktop.interface")
         self.updating_ui = False  # 防止 UI 刷新触发循环更新
+        self.init_pipeline()
+        # 本进程写入 config.conf 后的 stat 签名 -> 调度代数；
+        # 由调度线程登记、主循环线程取出
+        self.own_writes = {}
+        self._own_writes_lock = threading.Lock()
+        # 合并短时间内的多次变化，生成工作放到后台线程，不阻塞主循环
+        self.scheduler = scheduler.UpdateScheduler(self.update, name="gnome")
 
         # 1. 监听配置文件变化 -> 触发 Matugen
         conf_file = Gio.File.new_for_path(str(utils.CONFIG_FILE))
         self.monitor = conf_file.monitor_file(Gio.FileMonitorFlags.NONE, None)
         self.monitor.connect("changed", self.on_config_changed)
 
-        # 2. 监听系统设置变化 -> 更新配置文件
+        # 2. 监听系统设置变化 -> 直接触发更新
         self.settings_bg.connect("changed::picture-uri", self.on_system_changed)
         self.settings_interface.connect("changed::color-scheme", self.on_system_changed)
 
     def on_system_changed(self, settings, key):
-        """系统设置变化时，同步状态到配置文件"""
+        """系统设置变化时，直接把新状态交给调度器；config.conf 由后台线程按需保存"""
         if self.updating_ui:
             return
 
@@ -56,49 +259,100 @@ class GnomeEngine:
         scheme = self.settings_interface.get_string("color-scheme")
         mode = "dark" if "dark" in scheme else "light"
 
-        # 获取当前壁纸路径 (用于触发配置变更)
+        # 获取当前壁纸路径
         uri = (
             self.settings_bg.get_string("picture-uri").replace("file://", "").strip("'")
         )
+        self.scheduler.request(key, mode=mode, wallpaper=uri)
 
+    def on_config_changed(self, file, other_file, event_type):
+        """配置文件变化时 (例如 GUI 保存设置)，运行 Matugen"""
+        # 过滤事件，避免重复触发 (CHANGES_DONE_HINT 通常是写入完成)
+        if event_type != self.Gio.FileMonitorEvent.CHANGES_DONE_HINT:
+            return
         try:
-            # 读取现有配置
-            config = configparser.ConfigParser()
-            config.read(utils.CONFIG_FILE)
-
-            if not config.has_section("General"):
-                config.add_section("General")
+            st = os.stat(utils.CONFIG_FILE)
+            signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            signature = None
+        with self._own_writes_lock:
+            generation = self.own_writes.pop(signature, None)
+        if generation is not None:
+            log.debug(f"Ignoring config write from generation {generation}")
+            return
+        self.scheduler.request("config")
 
-            # 强制更新配置文件 (即使值相同，写入操作也会更新 mtime，从而触发 on_config_changed)
-            # 注意：ConfigParser 默认行为可能不会写入未变更的值，但 open('w') 会刷新文件
-            config["General"]["colorMode"] = mode
-            config["General"]["currentWallpaper"] = uri
+    def _persist(self, mode, wallpaper):
+        """保存系统状态到 config.conf，并记下签名以忽略由此产生的文件事件"""
+        generation = self.scheduler.generation
 
-            # 确保目录存在
-            utils.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-
-            with open(utils.CONFIG_FILE, "w") as f:
-                config.write(f)
+        def expect(signature):
+            # 在 rename 之前登记，文件事件不会先于登记到达；
+            # 事件被合并或丢失的旧记录不会再被取出，一并丢弃
+            with self._own_writes_lock:
+                self.own_writes = {
+                    s: g for s, g in self.own_writes.items() if g >= generation
+                }
+                self.own_writes[signature] = generation
 
+        try:
+            utils.update_config(
+                {"colorMode": mode, "currentWallpaper": wallpaper}, on_write=expect
+            )
         except Exception as e:
             log.error(f"Failed to sync system changes to config: {e}")
 
-    def on_config_changed(self, file, other_file, event_type):
-        """配置文件变化时，运行 Matugen"""
-        # 过滤事件，避免重复触发 (CHANGES_DONE_HINT 通常是写入完成)
-        if event_type == self.Gio.FileMonitorEvent.CHANGES_DONE_HINT:
-            self.update()
-
-    def update(self):
-        mode, flavor, _ = utils.read_config()
-        wallpaper = utils.get_current_wallpaper(mode)
+    def update(self, state=None):
+        """在调度器线程中执行；GSettings 写入回到主循环完成"""
+        state = state or {}
+        if "rotate" in state:
+            self.run_rotation(state["rotate"])
+            if len(state) == 1:
+                return
+        config = utils.load_config()
+        if "mode" not in state:
+            self.run_pipeline(config, force=state.get("force", False))
+            return
+        mode, wallpaper = state["mode"], state.get("wallpaper", "")
+        # 关键路径只使用内存中的配置，写入 config.conf 推迟到主题应用之后
+        config = replace(config, color_mode=mode, current_wallpaper=wallpaper)
+        try:
+            # 系统设置变化意味着壁纸或深浅色可能变了，需要重新获取壁纸
+            self.run_pipeline(config, refetch=True, force=state.get("force", False))
+        finally:
+            self._persist(mode, wallpaper)
 
-        if wallpaper:
-            utils.save_state(wallpaper)  # 缓存给前端用
-            if utils.run_matugen(wallpaper, mode, flavor):
-                self.refresh_ui(mode)
+    # 等待主循环完成 UI 刷新的最长时间 (秒)
+    REFRESH_TIMEOUT = 5.0
 
     def refresh_ui(self, mode):
+        """
+        由调度器线程调用，真正的 GSettings 写入在主循环中完成。
+        等待其完成，使 apply_ui 计入本次 generation 的 refresh 耗时
+        """
+        done = threading.Event()
+        self.GLib.idle_add(self._refresh_idle, mode, done, metrics.current())
+        if not done.wait(self.REFRESH_TIMEOUT):
+            log.warning("GNOME UI refresh did not finish in time")
+
+    def set_wallpaper(self, path):
+        # 与随后的 refresh_ui 在同一轮主循环中完成
+        self.GLib.idle_add(self._set_wallpaper_idle, "file://" + path)
+
+    def _set_wallpaper_idle(self, uri):
+        self.settings_bg.set_string("picture-uri", uri)
+        self.settings_bg.set_string("picture-uri-dark", uri)
+        return False
+
+    def _refresh_idle(self, mode, done, gen=None):
+        try:
+            with metrics.attach(gen), metrics.span("apply_ui"):
+                self.apply_ui(mode)
+        finally:
+            done.set()
+        return False  # 只执行一次
+
+    def apply_ui(self, mode):
         """
         使用优化后的简洁逻辑刷新 GNOME UI
         """
@@ -125,44 +379,92 @@ class GnomeEngine:
 
     def start(self):
         log.info("🚀 GNOME Engine Started")
-        self.update()
+        self.scheduler.request("startup", force=True)
         self.loop.run()
 
 
-class KdeEngine:
+class KdeEngine(PipelineMixin):
+    # 没有 inotify 时的轮询间隔
+    POLL_INTERVAL = 2.0
+
     def __init__(self):
-        self.last_wall = None
-        self.last_mtime = 0
+        # 统计主循环被唤醒的次数，用于比较事件驱动与轮询的开销
+        self.wakeups = 0
+        self.init_pipeline()
+        self.scheduler = scheduler.UpdateScheduler(self.check, name="kde")
+
+    def _watch(self):
+        """返回监听 appletsrc 与 config.conf 的 inotify Watcher，不可用时返回 None"""
+        if not inotify.is_available():
+            return None
+        try:
+            watcher = inotify.Watcher()
+            watcher.add_file(kde_wallpaper.APPLETSRC)
+            utils.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+            watcher.add_file(utils.CONFIG_FILE)
+            return watcher
+        except OSError as e:
+            log.warning(f"inotify unavailable, falling back to polling: {e}")
+            return None
+
+    def check(self, state):
+        start = time.monotonic()
+        if "rotate" in state:
+            self.run_rotation(state["rotate"])
+            if len(state) == 1:
+                return
+        self.run_pipeline(
+            utils.load_config(),
+            refetch=state.get("wallpaper", False),
+            force=state.get("force", False),
+        )
+        log.info(
+            "Update handled in %.2fs (%.2f wakeups/min since start)",
+            time.monotonic() - start, self.wakeups_per_minute(),
+        )
+
+    def wakeups_per_minute(self):
+        minutes = max((time.monotonic() - self.started_at) / 60.0, 1e-6)
+        return self.wakeups / minutes
 
     def start(self):
         log.info("🚀 KDE Engine Started")
+        watcher = self._watch()
+        self.scheduler.request("startup", force=True)
+
+        if watcher is None:
+            log.info(f"Polling for changes every {self.POLL_INTERVAL}s")
         while True:
-            try:
-                mode, flavor, _ = utils.read_config()
-                # 检查配置变化
-                config_changed = False
-                if os.path.exists(utils.CONFIG_FILE):
-                    mtime = os.path.getmtime(utils.CONFIG_FILE)
-                    if mtime > self.last_mtime:
-                        self.last_mtime = mtime
-                        config_changed = True
-
-                # 检查壁纸变化
-                wall = utils.get_current_wallpaper(mode)
-
-                if wall and (wall != self.last_wall or config_changed):
-                    time.sleep(0.5)
-                    wall = utils.get_current_wallpaper(mode)  # 再确认一次
-                    if wall:
-                        utils.save_state(wall)
-                        if utils.run_matugen(wall, mode, flavor):
-                            self.refresh_ui()
-                            self.last_wall = wall
-            except Exception as e:
-                log.error(f"Loop error: {e}")
-            time.sleep(2.0)
-
-    def refresh_ui(self):
+            if watcher is not None:
+                # 阻塞直到 appletsrc 或 config.conf 被写入，空闲时没有任何唤醒
+                changed = watcher.wait()
+                # ~/.config 中其它文件的写入同样会唤醒进程，按 select 返回次数统计
+                self.wakeups = watcher.wakeups
+                if not changed:
+                    continue
+                wallpaper = str(kde_wallpaper.APPLETSRC) in changed
+            else:
+                time.sleep(self.POLL_INTERVAL)
+                self.wakeups += 1
+                wallpaper = True
+            if wallpaper:
+                self.scheduler.request("appletsrc", wallpaper=True)
+            else:
+                self.scheduler.request("config")
+
+    def set_wallpaper(self, path):
+        import subprocess
+
+        try:
+            subprocess.run(
+                ["plasma-apply-wallpaperimage", path],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            log.error(f"Failed to set KDE wallpaper: {e}")
+
+    def refresh_ui(self, mode=None):
         import subprocess
 
         try:
@@ -170,7 +472,8 @@ class KdeEngine:
                 ["plasma-apply-colorscheme", "MaterialYouAlt"],
                 stdout=subprocess.DEVNULL,
             )
-            time.sleep(0.5)
+            with metrics.span("refresh_sleep"):
+                time.sleep(0.5)
             subprocess.run(
                 ["plasma-apply-colorscheme", "MaterialYou"], stdout=subprocess.DEVNULL
             )
@@ -179,19 +482,118 @@ class KdeEngine:
             log.error(f"Failed to refresh KDE UI: {e}")
 
 
-if __name__ == "__main__":
+def print_stats(as_json=False, budget=None):
+    """--stats: 优先查询运行中的服务，服务未运行时使用数据库中的历史记录"""
+    try:
+        stats = ipc.request("stats")
+    except (OSError, RuntimeError, ValueError):
+        stats = metrics.from_runs(state.recent_runs(limit=metrics.WINDOW))
+    if budget is not None:
+        stats["budget_ms"] = budget
+
+    if as_json:
+        print(json.dumps(stats, indent=2))
+    else:
+        if stats["source"] == "history":
+            print(f"Service not running; showing the last {stats['window']} recorded runs.\n")
+        print(metrics.format_stats(stats))
+
+    # 超出预算时以非零状态退出，便于在脚本中检查
+    p95 = stats["stages"].get(metrics.PIPELINE, {}).get("p95", 0.0)
+    return 1 if stats.get("budget_ms") and p95 > stats["budget_ms"] else 0
+
+
+def run_precompute(args):
+    """precompute 子命令：批量计算文件夹中壁纸的调色板并写入缓存"""
+    config = utils.load_config()
+    folder = os.path.expanduser(args.folder or config.wallpaper_folder)
+    if not os.path.isdir(folder):
+        print(f"Not a folder: {folder}", file=sys.stderr)
+        return 2
+    stats = precompute.precompute(
+        folder,
+        args.modes,
+        args.flavors or [config.flavor],
+        workers=args.jobs,
+        recursive=args.recursive or config.recursive_scan,
+        progress=not args.json,
+    )
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(precompute.format_summary(stats))
+    return 1 if stats["failed"] else 0
+
+
+def _choice_list(choices, name):
+    def parse(value):
+        try:
+            return precompute.parse_list(value, choices, name)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+    return parse
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="MaterialYou-Service")
+    parser.add_argument(
+        "--stats", action="store_true", help="print pipeline stage latencies and exit"
+    )
+    parser.add_argument("--json", action="store_true", help="with --stats: print JSON")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        metavar="MS",
+        help="with --stats: exit with status 1 if the pipeline p95 exceeds MS",
+    )
+
+    commands = parser.add_subparsers(dest="command")
+    pre = commands.add_parser(
+        "precompute", help="compute and cache palettes for a whole wallpaper folder"
+    )
+    pre.add_argument(
+        "folder", nargs="?", help="wallpaper folder (default: the configured folder)"
+    )
+    pre.add_argument(
+        "--modes",
+        type=_choice_list(precompute.MODES, "modes"),
+        default=list(precompute.MODES),
+        help="comma-separated modes or 'all' (default: dark,light)",
+    )
+    pre.add_argument(
+        "--flavors",
+        type=_choice_list(precompute.FLAVORS, "flavors"),
+        help="comma-separated flavors or 'all' (default: the configured flavor)",
+    )
+    pre.add_argument(
+        "-j", "--jobs", type=int, metavar="N", help="worker processes (default: all cores)"
+    )
+    pre.add_argument(
+        "-r", "--recursive", action="store_true", help="include subfolders"
+    )
+    pre.add_argument("--json", action="store_true", help="print the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "precompute":
+        return run_precompute(args)
+    if args.stats:
+        return print_stats(args.json, args.budget)
+
     # 确保配置资源存在 (Matugen config 等)
     utils.init_resources()
 
     # 尝试获取锁，确保只有一个服务实例运行
     if not utils.acquire_lock():
         log.error("Service is already running (Lock file occupied). Exiting.")
-        sys.exit(0)
+        return 0
 
     utils.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 
     log.info("Starting Material You Autothemer Backend Service...")
-
     # 在桌面会话初始化期间等待环境变量准备就绪，避免误判
     desktop_tokens = ()
     for _ in range(10):
@@ -201,8 +603,19 @@ if __name__ == "__main__":
         time.sleep(1)
 
     if utils.is_kde_session():
-        KdeEngine().start()
+        engine = KdeEngine()
     else:
         if not desktop_tokens:
             log.info("Desktop environment not detected. Defaulting to GNOME backend.")
-        GnomeEngine().start()
+        engine = GnomeEngine()
+    # GUI 通过套接字请求预览/应用，服务未运行时 GUI 自行处理
+    ipc.Server(engine.ipc_handlers()).start()
+    engine.rotation.start()
+    engine.start()
+    return 0
+
+
+if __name__ == "__main__":
+    # precompute 的进程池使用 spawn，打包后的程序需要由此进入子进程
+    multiprocessing.freeze_support()
+    sys.exit(main())
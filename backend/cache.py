@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+通用磁盘缓存工具：文件指纹、原子写入、带 LRU 淘汰的内容缓存。
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+APP_NAME = "MaterialYou-Autothemer"
+CACHE_ROOT = Path.home() / ".cache" / APP_NAME
+
+
+def file_fingerprint(path):
+    """
+    基于 (真实路径, 大小, mtime, inode) 的快速指纹，不读取文件内容。
+    文件不存在时返回 None。
+    """
+    try:
+        real = os.path.realpath(path)
+        st = os.stat(real)
+    except (OSError, TypeError):
+        return None
+    raw = f"{real}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}\0{st.st_dev}"
+    return hashlib.sha1(raw.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def hash_bytes(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_file(path):
+    """读取文件内容计算 sha1，失败返回空字符串"""
+    try:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return ""
+
+
+def atomic_write(path, data, mode=None, before_replace=None):
+    """
+    写入临时文件后 rename，保证读者永远看不到写了一半的文件。
+    before_replace(os.stat_result) 在 rename 之前以临时文件的 stat 调用；
+    rename 不改变 inode、大小与 mtime，因此它们与最终文件一致。
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is None:
+            try:
+                mode = path.stat().st_mode & 0o7777
+            except OSError:
+                mode = 0o644
+        os.chmod(tmp, mode)
+        if before_replace is not None:
+            before_replace(os.stat(tmp))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class LruDiskCache:
+    """
+    以 key -> bytes 形式存放在目录中的缓存。
+    - 内存层：最近使用的少量条目常驻内存，命中只需一次字典查找
+    - 磁盘层：每个条目一个文件，mtime 作为最近使用时间
+    - 淘汰：超过条目数或总字节数时按 mtime 从旧到新删除；
+      on_evict(keys) 在淘汰或丢弃条目后调用 (不持有锁)，用于清理外部的元数据
+    """
+
+    # 命中时刷新 mtime 的最小间隔，避免每次读都产生一次写操作
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(
+        self, directory, max_entries=512, max_bytes=32 * 1024 * 1024,
+        memory_entries=64, suffix=".bin", on_evict=None,
+    ):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.suffix = suffix
+        self.on_evict = on_evict
+        self._memory = OrderedDict()
+        self._index = None  # key -> [size, last_used]
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    # 以 "." 开头的是尚未完成的临时文件
+                    if entry.name.startswith(".") or not entry.name.endswith(self.suffix):
+                        continue
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    key = entry.name[: -len(self.suffix)]
+                    self._index[key] = [st.st_size, st.st_mtime]
+        except OSError:
+            pass
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _touch_locked(self, key, path, size, last_used):
+        self._load_index()
+        meta = self._index.setdefault(key, [size, last_used])
+        now = time.time()
+        if now - meta[1] > self.TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+                meta[1] = now
+            except OSError:
+                pass
+
+    def path(self, key):
+        """条目存在时返回其文件路径 (并刷新最近使用时间)，否则返回 None"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            self._touch_locked(key, path, st.st_size, st.st_mtime)
+            return path
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+
+            self._touch_locked(key, path, len(data), time.time())
+            self._remember(key, data)
+            return data
+
+    def put(self, key, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self._lock:
+            try:
+                atomic_write(self._path(key), data, mode=0o644)
+            except OSError:
+                return False
+            self._load_index()
+            self._index[key] = [len(data), time.time()]
+            self._remember(key, data)
+            evicted = self._prune_locked()
+        self._evicted(evicted)
+        return True
+
+    def adopt(self, key, src_path):
+        """
+        把已写好的文件移动进缓存 (同一文件系统上为 rename)，避免大文件经过内存。
+        返回条目路径，失败返回 None。
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.chmod(src_path, 0o644)
+                os.replace(src_path, path)
+                size = os.path.getsize(path)
+            except OSError:
+                return None
+            self._load_index()
+            self._index[key] = [size, time.time()]
+            self._memory.pop(key, None)
+            evicted = self._prune_locked()
+            kept = key in self._index
+        self._evicted(evicted)
+        return path if kept else None
+
+    def temp_path(self, suffix=None):
+        """在缓存目录中创建一个临时文件路径，供 adopt() 使用"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            prefix=".tmp-", suffix=suffix or self.suffix, dir=str(self.directory)
+        )
+        os.close(fd)
+        return tmp
+
+    def discard(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._index is not None:
+                self._index.pop(key, None)
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+        self._evicted([key])
+
+    def _evicted(self, keys):
+        if keys and self.on_evict is not None:
+            self.on_evict(keys)
+
+    def _prune_locked(self):
+        """淘汰超出限制的条目，返回被淘汰的 key 列表"""
+        total = sum(meta[0] for meta in self._index.values())
+        if len(self._index) <= self.max_entries and total <= self.max_bytes:
+            return []
+        evicted = []
+        for key, meta in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if len(self._index) <= self.max_entries and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+            total -= meta[0]
+            del self._index[key]
+            self._memory.pop(key, None)
+            evicted.append(key)
+        return evicted
+
+    def prune(self):
+        with self._lock:
+            self._load_index()
+            evicted = self._prune_locked()
+        self._evicted(evicted)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+桌面环境检测。
+
+按代价从低到高依次尝试各个探测方式，记录命中的探测方式与耗时：
+    env        XDG_CURRENT_DESKTOP 等环境变量
+    persisted  上次在同一会话中的检测结果，用一次 DBus NameHasOwner 验证
+    dbus       检查 GNOME Shell / Plasma 的 DBus 名称是否有人持有
+    proc       扫描 /proc/*/comm (不 fork ps)
+    binaries   按已安装的程序猜测
+非环境变量得出的结果按会话 ID 保存在 desktop.json 中，服务下次启动时直接验证复用。
+"""
+import json
+import os
+import shutil
+import time
+
+try:
+    from backend import cache
+    from backend.logger import log
+except ImportError:
+    import cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+STATE_FILE = cache.CACHE_ROOT / "desktop.json"
+
+# 桌面 -> (用于验证的 DBus 名称, 进程名)
+SIGNATURES = {
+    "gnome": (("org.gnome.Shell",), ("gnome-shell", "gnome-session-b", "mutter")),
+    "kde": (
+        ("org.kde.plasmashell", "org.kde.KWin"),
+        ("plasmashell", "kwin_x11", "kwin_wayland", "ksmserver"),
+    ),
+}
+ENV_KEYS = ("XDG_CURRENT_DESKTOP", "XDG_SESSION_DESKTOP", "DESKTOP_SESSION", "GDMSESSION")
+
+_CACHE = None
+# 最近一次检测的记录: {"tokens", "probe", "timings": {probe: ms}}
+last_detection = {}
+
+
+def session_id():
+    """当前登录会话的标识，无法确定时返回 None"""
+    sid = os.environ.get("XDG_SESSION_ID")
+    if sid:
+        return f"xdg-{sid}"
+    try:
+        with open("/proc/self/sessionid", "r") as f:
+            value = f.read().strip()
+        # 4294967295 表示未设置审计会话
+        if value and value != "4294967295":
+            return f"audit-{value}"
+    except OSError:
+        pass
+    bus = os.environ.get("DBUS_SESSION_BUS_ADDRESS")
+    return f"bus-{cache.hash_bytes(bus)}" if bus else None
+
+
+# --- 探测方式 ---
+
+
+def _probe_env():
+    tokens = []
+    for key in ENV_KEYS:
+        value = os.environ.get(key)
+        if not value:
+            continue
+        for part in value.replace(";", ":").split(":"):
+            part = part.strip().lower()
+            if part and part not in tokens:
+                tokens.append(part)
+    return tokens
+
+
+def _bus():
+    try:
+        import dbus  # type: ignore
+
+        return dbus.SessionBus()
+    except Exception:
+        return None
+
+
+def _name_has_owner(bus, names):
+    try:
+        proxy = bus.get_object("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        for name in names:
+            if proxy.NameHasOwner(name, dbus_interface="org.freedesktop.DBus"):
+                return True
+    except Exception:
+        pass
+    return False
+
+
+def _probe_dbus():
+    bus = _bus()
+    if bus is None:
+        return []
+    return [desktop for desktop, (names, _) in SIGNATURES.items() if _name_has_owner(bus, names)]
+
+
+def _running_commands():
+    """读取 /proc/*/comm 得到正在运行的进程名集合"""
+    names = set()
+    try:
+        with os.scandir("/proc") as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    with open(f"/proc/{entry.name}/comm", "r") as f:
+                        names.add(f.read().strip().lower())
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return names
+
+
+def _probe_proc():
+    running = _running_commands()
+    return [
+        desktop
+        for desktop, (_, procs) in SIGNATURES.items()
+        if any(proc in running for proc in procs)
+    ]
+
+
+def _probe_binaries():
+    if os.environ.get("KDE_FULL_SESSION") == "true" or shutil.which("plasmashell"):
+        return ["kde"]
+    if os.environ.get("GNOME_DESKTOP_SESSION_ID") or shutil.which("gsettings"):
+        return ["gnome"]
+    return []
+
+
+def _validate(tokens):
+    """用一次廉价检查确认保存的结果仍然成立"""
+    desktops = [t for t in tokens if t in SIGNATURES]
+    if not desktops:
+        return False
+    bus = _bus()
+    if bus is not None:
+        return any(_name_has_owner(bus, SIGNATURES[d][0]) for d in desktops)
+    running = _running_commands()
+    return any(p in running for d in desktops for p in SIGNATURES[d][1])
+
+
+# --- 持久化 ---
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE, "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _probe_persisted():
+    sid = session_id()
+    if not sid:
+        return []
+    entry = _load_state().get(sid)
+    if not entry or not _validate(entry.get("tokens") or ()):
+        return []
+    return list(entry["tokens"])
+
+
+def _persist(tokens, probe):
+    sid = session_id()
+    if not sid:
+        return
+    # 只保留当前会话，旧会话的记录没有意义
+    state = {sid: {"tokens": tokens, "probe": probe, "time": int(time.time())}}
+    try:
+        cache.atomic_write(STATE_FILE, json.dumps(state))
+    except OSError as e:
+        log.debug(f"Failed to persist desktop detection: {e}")
+
+
+PROBES = (
+    ("env", _probe_env),
+    ("persisted", _probe_persisted),
+    ("dbus", _probe_dbus),
+    ("proc", _probe_proc),
+    ("binaries", _probe_binaries),
+)
+
+
+def detect(force_refresh=False):
+    """返回桌面环境标识元组 (小写)，例如 ("kde",)；检测不到时返回空元组"""
+    global _CACHE, last_detection
+    if _CACHE is not None and not force_refresh:
+        return _CACHE
+
+    timings = {}
+    tokens, hit = [], None
+    for name, probe in PROBES:
+        start = time.perf_counter()
+        tokens = probe()
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        if tokens:
+            hit = name
+            break
+
+    if hit in ("dbus", "proc"):
+        _persist(tokens, hit)
+
+    _CACHE = tuple(tokens)
+    last_detection = {"tokens": _CACHE, "probe": hit, "timings": timings}
+    detail = ", ".join(f"{k}={v}ms" for k, v in timings.items())
+    log.info(f"Desktop detection: {list(_CACHE) or 'unknown'} via {hit or 'none'} ({detail})")
+    return _CACHE
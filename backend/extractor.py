@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+进程内取色引擎 (可选依赖 numpy + Pillow)。
+
+流程与 matugen 一致：降采样像素 -> Wu 量化 -> WSMeans (Lab) 细化 ->
+Material Score 选出源色 -> 生成全部 flavor 的色调板 (见 hct.py)。
+用于 GUI 预览，避免每次点击都启动 matugen 进程；最终主题仍由 matugen 渲染。
+
+命令行对比 matugen 的输出与耗时:
+    python3 -m backend.extractor compare <image> [<image> ...]
+"""
+import json
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # 可选依赖
+    np = None
+    Image = None
+
+try:
+    from backend import hct
+    from backend.logger import log
+except ImportError:
+    import hct
+    import logging
+
+    log = logging.getLogger(__name__)
+
+# 参与量化的最大边长，约 1.6 万像素，统计上已足够
+SAMPLE_SIZE = 128
+MAX_COLORS = 128
+FALLBACK_COLOR = 0xFF4285F4
+
+_WU_SIDE = 33
+
+
+def is_available():
+    return np is not None and Image is not None
+
+
+# --- 像素读取 ---
+
+
+def load_pixels(image_path, max_side=SAMPLE_SIZE):
+    """读取图片并降采样，返回不透明像素的 (N, 3) uint8 数组"""
+    with Image.open(image_path) as img:
+        # JPEG 可以直接以 1/2、1/4、1/8 分辨率解码，省去大部分 IDCT 开销
+        img.draft("RGB", (max_side * 2, max_side * 2))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.BOX)
+        arr = np.asarray(img)
+    if arr.ndim == 3 and arr.shape[2] == 4:
+        arr = arr[arr[..., 3] == 255][:, :3]
+    return np.ascontiguousarray(arr.reshape(-1, 3), dtype=np.uint8)
+
+
+# --- 向量化色彩转换 ---
+
+
+def _linearized(rgb):
+    n = rgb.astype(np.float64) / 255.0
+    return np.where(n <= 0.040449936, n / 12.92, ((n + 0.055) / 1.055) ** 2.4) * 100.0
+
+
+def _lab_f(t):
+    return np.where(
+        t > 216.0 / 24389.0, np.cbrt(t), (24389.0 / 27.0 * t + 16.0) / 116.0
+    )
+
+
+def xyz_from_rgb(rgb):
+    return _linearized(rgb) @ np.asarray(hct.SRGB_TO_XYZ).T
+
+
+def lab_from_rgb(rgb):
+    xyz = xyz_from_rgb(rgb) / np.asarray(hct.WHITE_POINT_D65)
+    f = _lab_f(xyz)
+    return np.stack(
+        (116.0 * f[:, 1] - 16.0, 500.0 * (f[:, 0] - f[:, 1]), 200.0 * (f[:, 1] - f[:, 2])),
+        axis=1,
+    )
+
+
+def rgb_from_lab(lab):
+    fy = (lab[:, 0] + 16.0) / 116.0
+    fx = lab[:, 1] / 500.0 + fy
+    fz = fy - lab[:, 2] / 200.0
+    f = np.stack((fx, fy, fz), axis=1)
+    f3 = f ** 3
+    xyz = np.where(f3 > 216.0 / 24389.0, f3, (116.0 * f - 16.0) / (24389.0 / 27.0))
+    xyz = xyz * np.asarray(hct.WHITE_POINT_D65)
+    lin = np.clip(xyz @ np.asarray(hct.XYZ_TO_SRGB).T / 100.0, 0.0, None)
+    srgb = np.where(lin <= 0.0031308, lin * 12.92, 1.055 * lin ** (1.0 / 2.4) - 0.055)
+    return np.clip(np.round(srgb * 255.0), 0, 255).astype(np.uint8)
+
+
+def cam16_from_rgb(rgb, vc=hct.DEFAULT_VIEWING_CONDITIONS):
+    """
+    批量计算 CAM16，返回 (hue, chroma, jstar, astar, bstar) 五个数组。
+    后三个即 CAM16-UCS 坐标，可直接用欧氏距离比较感知色差。
+    """
+    xyz = xyz_from_rgb(np.asarray(rgb).reshape(-1, 3))
+    m16 = np.asarray(
+        (
+            (0.401288, 0.650173, -0.051461),
+            (-0.250268, 1.204414, 0.045854),
+            (-0.002079, 0.048952, 0.953127),
+        )
+    )
+    scaled = (xyz @ m16.T) * np.asarray(vc.rgb_d)
+    af = (vc.fl * np.abs(scaled) / 100.0) ** 0.42
+    adapted = np.sign(scaled) * 400.0 * af / (af + 27.13)
+    r_a, g_a, b_a = adapted[:, 0], adapted[:, 1], adapted[:, 2]
+
+    a = (11.0 * r_a - 12.0 * g_a + b_a) / 11.0
+    b = (r_a + g_a - 2.0 * b_a) / 9.0
+    u = (20.0 * r_a + 20.0 * g_a + 21.0 * b_a) / 20.0
+    p2 = (40.0 * r_a + 20.0 * g_a + b_a) / 20.0
+    hue = np.degrees(np.arctan2(b, a)) % 360.0
+
+    ac = np.clip(p2 * vc.nbb, 0.0, None)
+    j = 100.0 * (ac / vc.aw) ** (vc.c * vc.z)
+    hue_prime = np.where(hue < 20.14, hue + 360.0, hue)
+    e_hue = 0.25 * (np.cos(np.radians(hue_prime) + 2.0) + 3.8)
+    p1 = 50000.0 / 13.0 * e_hue * vc.nc * vc.ncb
+    t = p1 * np.hypot(a, b) / (u + 0.305)
+    alpha = t ** 0.9 * (1.64 - 0.29 ** vc.n) ** 0.73
+    chroma = alpha * np.sqrt(j / 100.0)
+    m = chroma * vc.fl_root
+    jstar = (1.0 + 100.0 * 0.007) * j / (1.0 + 0.007 * j)
+    mstar = np.log1p(0.0228 * m) / 0.0228
+    hue_rad = np.radians(hue)
+    return hue, chroma, jstar, mstar * np.cos(hue_rad), mstar * np.sin(hue_rad)
+
+
+# --- Wu 量化 ---
+
+
+def _volume(cube, moment):
+    r0, r1, g0, g1, b0, b1 = cube
+    return (
+        moment[r1, g1, b1] - moment[r1, g1, b0] - moment[r1, g0, b1] + moment[r1, g0, b0]
+        - moment[r0, g1, b1] + moment[r0, g1, b0] + moment[r0, g0, b1] - moment[r0, g0, b0]
+    )
+
+
+def _bottom(cube, axis, moment):
+    r0, r1, g0, g1, b0, b1 = cube
+    if axis == 0:
+        return -moment[r0, g1, b1] + moment[r0, g1, b0] + moment[r0, g0, b1] - moment[r0, g0, b0]
+    if axis == 1:
+        return -moment[r1, g0, b1] + moment[r1, g0, b0] + moment[r0, g0, b1] - moment[r0, g0, b0]
+    return -moment[r1, g1, b0] + moment[r1, g0, b0] + moment[r0, g1, b0] - moment[r0, g0, b0]
+
+
+def _top(cube, axis, positions, moment):
+    """对一组切分位置向量化计算 top()"""
+    r0, r1, g0, g1, b0, b1 = cube
+    p = positions
+    if axis == 0:
+        return moment[p, g1, b1] - moment[p, g1, b0] - moment[p, g0, b1] + moment[p, g0, b0]
+    if axis == 1:
+        return moment[r1, p, b1] - moment[r1, p, b0] - moment[r0, p, b1] + moment[r0, p, b0]
+    return moment[r1, g1, p] - moment[r1, g0, p] - moment[r0, g1, p] + moment[r0, g0, p]
+
+
+class _WuQuantizer:
+    def __init__(self, colors, counts):
+        side = _WU_SIDE
+        idx = (colors >> 3).astype(np.int64) + 1
+        flat = idx[:, 0] * side * side + idx[:, 1] * side + idx[:, 2]
+        size = side ** 3
+        c = colors.astype(np.float64)
+        w = counts.astype(np.float64)
+
+        def histogram(values):
+            h = np.bincount(flat, weights=values, minlength=size).reshape(side, side, side)
+            return h.cumsum(0).cumsum(1).cumsum(2)
+
+        self.weights = histogram(w)
+        self.moments_r = histogram(w * c[:, 0])
+        self.moments_g = histogram(w * c[:, 1])
+        self.moments_b = histogram(w * c[:, 2])
+        self.moments = histogram(w * (c * c).sum(axis=1))
+        self._moment_list = (self.moments_r, self.moments_g, self.moments_b, self.weights)
+
+    def _variance(self, cube):
+        dr = _volume(cube, self.moments_r)
+        dg = _volume(cube, self.moments_g)
+        db = _volume(cube, self.moments_b)
+        xx = _volume(cube, self.moments)
+        weight = _volume(cube, self.weights)
+        if weight == 0:
+            return 0.0
+        return xx - (dr * dr + dg * dg + db * db) / weight
+
+    def _maximize(self, cube, axis, first, last, whole):
+        if last <= first:
+            return -1, 0.0
+        positions = np.arange(first, last)
+        bottoms = [_bottom(cube, axis, m) for m in self._moment_list]
+        halves = [
+            b + _top(cube, axis, positions, m) for b, m in zip(bottoms, self._moment_list)
+        ]
+        half_r, half_g, half_b, half_w = halves
+        other_r = whole[0] - half_r
+        other_g = whole[1] - half_g
+        other_b = whole[2] - half_b
+        other_w = whole[3] - half_w
+        valid = (half_w != 0) & (other_w != 0)
+        if not valid.any():
+            return -1, 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            temp = (half_r ** 2 + half_g ** 2 + half_b ** 2) / half_w
+            temp += (other_r ** 2 + other_g ** 2 + other_b ** 2) / other_w
+        temp = np.where(valid, temp, -np.inf)
+        best = int(np.argmax(temp))
+        return int(positions[best]), float(temp[best])
+
+    def _cut(self, one):
+        whole = [_volume(one, m) for m in self._moment_list]
+        r0, r1, g0, g1, b0, b1 = one
+        cut_r, max_r = self._maximize(one, 0, r0 + 1, r1, whole)
+        cut_g, max_g = self._maximize(one, 1, g0 + 1, g1, whole)
+        cut_b, max_b = self._maximize(one, 2, b0 + 1, b1, whole)
+
+        if max_r >= max_g and max_r >= max_b:
+            if cut_r < 0:
+                return None
+            return (r0, cut_r, g0, g1, b0, b1), (cut_r, r1, g0, g1, b0, b1)
+        if max_g >= max_r and max_g >= max_b:
+            if cut_g < 0:
+                return None
+            return (r0, r1, g0, cut_g, b0, b1), (r0, r1, cut_g, g1, b0, b1)
+        if cut_b < 0:
+            return None
+        return (r0, r1, g0, g1, b0, cut_b), (r0, r1, g0, g1, cut_b, b1)
+
+    @staticmethod
+    def _vol(cube):
+        r0, r1, g0, g1, b0, b1 = cube
+        return (r1 - r0) * (g1 - g0) * (b1 - b0)
+
+    def quantize(self, max_colors):
+        cubes = [(0, _WU_SIDE - 1, 0, _WU_SIDE - 1, 0, _WU_SIDE - 1)]
+        variances = [0.0]
+        nxt = 0
+        while len(cubes) < max_colors:
+            result = self._cut(cubes[nxt])
+            if result is None:
+                variances[nxt] = 0.0
+            else:
+                one, two = result
+                cubes[nxt] = one
+                cubes.append(two)
+                variances[nxt] = self._variance(one) if self._vol(one) > 1 else 0.0
+                variances.append(self._variance(two) if self._vol(two) > 1 else 0.0)
+            nxt = max(range(len(variances)), key=variances.__getitem__)
+            if variances[nxt] <= 0.0:
+                break
+
+        results = []
+        for cube in cubes:
+            weight = _volume(cube, self.weights)
+            if weight > 0:
+                results.append(
+                    [
+                        round(_volume(cube, self.moments_r) / weight),
+                        round(_volume(cube, self.moments_g) / weight),
+                        round(_volume(cube, self.moments_b) / weight),
+                    ]
+                )
+        return np.asarray(results, dtype=np.uint8).reshape(-1, 3)
+
+
+# --- WSMeans 细化 ---
+
+
+def _wsmeans(colors, counts, starting, max_iterations=10):
+    """在 Lab 空间做带权 k-means，以 Wu 的结果作为初始中心"""
+    points = lab_from_rgb(colors)
+    weights = counts.astype(np.float64)
+    centers = lab_from_rgb(starting) if len(starting) else points[:1].copy()
+    k = len(centers)
+
+    assignment = np.zeros(len(points), dtype=np.int64)
+    prev_dist = np.full(len(points), np.inf)
+    for _ in range(max_iterations):
+        dist = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        nearest = dist.argmin(axis=1)
+        best = dist[np.arange(len(points)), nearest]
+        # 与 material-color-utilities 一致：移动距离小于 3 的点保持原簇
+        moved = (best < prev_dist) & (np.abs(np.sqrt(best) - np.sqrt(prev_dist)) > 3.0)
+        moved |= np.isinf(prev_dist)
+        assignment = np.where(moved, nearest, assignment)
+        prev_dist = dist[np.arange(len(points)), assignment]
+
+        totals = np.bincount(assignment, weights=weights, minlength=k)
+        sums = np.stack(
+            [np.bincount(assignment, weights=weights * points[:, i], minlength=k) for i in range(3)],
+            axis=1,
+        )
+        nonzero = totals > 0
+        centers[nonzero] = sums[nonzero] / totals[nonzero, None]
+        if not moved.any():
+            break
+
+    totals = np.bincount(assignment, weights=weights, minlength=k)
+    keep = totals > 0
+    return rgb_from_lab(centers[keep]), totals[keep]
+
+
+def quantize(pixels, max_colors=MAX_COLORS):
+    """Celebi 量化 (Wu + WSMeans)，返回 {argb: count}"""
+    if len(pixels) == 0:
+        return {}
+    packed = (
+        pixels[:, 0].astype(np.int64) << 16
+        | pixels[:, 1].astype(np.int64) << 8
+        | pixels[:, 2].astype(np.int64)
+    )
+    unique, counts = np.unique(packed, return_counts=True)
+    colors = np.stack(((unique >> 16) & 255, (unique >> 8) & 255, unique & 255), axis=1).astype(
+        np.uint8
+    )
+    starting = _WuQuantizer(colors, counts).quantize(max_colors)
+    centers, totals = _wsmeans(colors, counts, starting)
+
+    result = {}
+    for rgb, total in zip(centers.tolist(), totals.tolist()):
+        argb = hct.argb_from_rgb(*rgb)
+        result[argb] = result.get(argb, 0) + int(total)
+    return result
+
+
+# --- Material Score ---
+
+_TARGET_CHROMA = 48.0
+_WEIGHT_PROPORTION = 0.7
+_WEIGHT_CHROMA_ABOVE = 0.3
+_WEIGHT_CHROMA_BELOW = 0.1
+_CUTOFF_CHROMA = 5.0
+_CUTOFF_EXCITED_PROPORTION = 0.01
+
+
+def score(color_counts, desired=4, fallback=FALLBACK_COLOR, filter_colors=True):
+    """按 Material 规则给量化后的颜色打分，返回按优先级排序的 argb 列表"""
+    if not color_counts:
+        return [fallback]
+    argbs = np.fromiter(color_counts.keys(), dtype=np.int64)
+    population = np.fromiter(color_counts.values(), dtype=np.float64)
+    rgb = np.stack(((argbs >> 16) & 255, (argbs >> 8) & 255, argbs & 255), axis=1)
+    hues, chromas = cam16_from_rgb(rgb)[:2]
+
+    hue_population = np.bincount(
+        np.floor(hues).astype(np.int64) % 360, weights=population, minlength=360
+    )
+    proportions = hue_population / population.sum()
+    # 每个色相对 [-14, +15] 邻域的贡献，用环形卷积一次算完
+    kernel_offsets = np.arange(-14, 16)
+    excited = np.zeros(360)
+    for offset in kernel_offsets:
+        excited += np.roll(proportions, offset)
+
+    rounded_hues = np.round(hues).astype(np.int64) % 360
+    proportion = excited[rounded_hues]
+    keep = np.ones(len(argbs), dtype=bool)
+    if filter_colors:
+        keep = (chromas >= _CUTOFF_CHROMA) & (proportion > _CUTOFF_EXCITED_PROPORTION)
+
+    chroma_weight = np.where(chromas < _TARGET_CHROMA, _WEIGHT_CHROMA_BELOW, _WEIGHT_CHROMA_ABOVE)
+    scores = proportion * 100.0 * _WEIGHT_PROPORTION + (chromas - _TARGET_CHROMA) * chroma_weight
+    order = [i for i in np.argsort(-scores, kind="stable") if keep[i]]
+
+    chosen = []
+    for min_difference in range(90, 14, -1):
+        chosen = []
+        for i in order:
+            if all(hct.difference_degrees(hues[i], hues[j]) >= min_difference for j in chosen):
+                chosen.append(i)
+            if len(chosen) >= desired:
+                break
+        if len(chosen) >= desired:
+            break
+
+    if not chosen:
+        return [fallback]
+    return [int(argbs[i]) | 0xFF000000 for i in chosen]
+
+
+# --- 对外接口 ---
+
+
+def source_color(image_path):
+    pixels = load_pixels(image_path)
+    return score(quantize(pixels))[0]
+
+
+def extract(image_path, mode, flavor):
+    """
+    进程内生成调色板，返回与 `matugen --json hex` 结构一致的 JSON 字符串。
+    依赖缺失或失败时返回 None，调用方应退回 matugen。
+    """
+    if not is_available() or not image_path or not os.path.exists(image_path):
+        return None
+    try:
+        source = source_color(image_path)
+        data = hct.scheme_colors(source, flavor, mode)
+        data["image"] = image_path
+        return json.dumps(data)
+    except Exception as e:
+        log.warning(f"In-process extraction failed for {image_path}: {e}")
+        return None
+
+
+def _compare(paths, mode="dark", flavor="tonal-spot"):
+    """与 matugen 输出逐项比较 (CAM16-UCS 色差) 并报告耗时"""
+    try:
+        from backend import utils
+    except ImportError:
+        import utils
+
+    roles = ("primary", "secondary", "tertiary", "surface", "on_surface", "primary_container")
+    worst = 0.0
+    for path in paths:
+        t0 = time.perf_counter()
+        ours = extract(path, mode, flavor)
+        t1 = time.perf_counter()
+        utils.PALETTE_CACHE.discard(utils.palette_cache_key(path, mode, flavor) or "")
+        theirs = utils.run_matugen(path, mode, flavor, dry_run=True)
+        t2 = time.perf_counter()
+        if not ours or not theirs:
+            print(f"{path}: extraction failed (builtin={bool(ours)}, matugen={bool(theirs)})")
+            continue
+        a = json.loads(ours)["colors"]
+        b = json.loads(theirs).get("colors", {})
+        deltas = []
+        for role in roles:
+            va, vb = a.get(role, {}).get(mode), b.get(role, {})
+            vb = vb.get(mode) if isinstance(vb, dict) else vb
+            if not va or not isinstance(vb, str):
+                continue
+            rgb = [hct.rgb_from_argb(hct.argb_from_hex(v)) for v in (va, vb)]
+            ucs = np.stack(cam16_from_rgb(np.asarray(rgb))[2:], axis=1)
+            deltas.append(float(np.linalg.norm(ucs[0] - ucs[1])))
+        delta = max(deltas) if deltas else float("nan")
+        worst = max(worst, delta) if deltas else worst
+        print(
+            f"{os.path.basename(path)}: max ΔE(CAM16-UCS)={delta:.2f}  "
+            f"builtin={1000 * (t1 - t0):.1f} ms  matugen={1000 * (t2 - t1):.1f} ms"
+        )
+    return worst
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "compare":
+        print("Usage: python3 -m backend.extractor compare <image> [<image> ...]")
+        sys.exit(1)
+    if not is_available():
+        print("numpy and Pillow are required for the in-process extractor.")
+        sys.exit(1)
+    sys.exit(0 if _compare(sys.argv[2:]) < 5.0 else 1)
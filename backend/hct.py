@@ -0,0 +1,1006 @@
+#!/usr/bin/env python3
+"""
+Material 颜色科学的纯 Python 实现 (CAM16 / HCT / 动态配色方案)。
+算法移植自 material-color-utilities，与 matugen 使用的 material-colors 保持一致，
+供进程内预览取色使用；最终模板渲染仍以 matugen 为准。
+"""
+import math
+from functools import lru_cache
+
+# --- 基础色彩转换 ---
+
+SRGB_TO_XYZ = (
+    (0.41233895, 0.35762064, 0.18051042),
+    (0.2126, 0.7152, 0.0722),
+    (0.01932141, 0.11916382, 0.95034478),
+)
+XYZ_TO_SRGB = (
+    (3.2413774792388685, -1.5376652402851851, -0.49885366846268053),
+    (-0.9691452513005321, 1.8758853451067872, 0.04156585616912061),
+    (0.05562093689691305, -0.20395524564742123, 1.0571799111220335),
+)
+WHITE_POINT_D65 = (95.047, 100.0, 108.883)
+
+
+def clamp(lo, hi, value):
+    return lo if value < lo else hi if value > hi else value
+
+
+def sanitize_degrees(degrees):
+    degrees = degrees % 360.0
+    return degrees + 360.0 if degrees < 0 else degrees
+
+
+def difference_degrees(a, b):
+    return 180.0 - abs(abs(a - b) - 180.0)
+
+
+def argb_from_rgb(r, g, b):
+    return (255 << 24) | ((r & 255) << 16) | ((g & 255) << 8) | (b & 255)
+
+
+def rgb_from_argb(argb):
+    return (argb >> 16) & 255, (argb >> 8) & 255, argb & 255
+
+
+def hex_from_argb(argb):
+    return "#{:02x}{:02x}{:02x}".format(*rgb_from_argb(argb))
+
+
+def argb_from_hex(value):
+    value = value.strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(ch * 2 for ch in value)
+    return 0xFF000000 | int(value[:6], 16)
+
+
+def linearized(component):
+    normalized = component / 255.0
+    if normalized <= 0.040449936:
+        return normalized / 12.92 * 100.0
+    return ((normalized + 0.055) / 1.055) ** 2.4 * 100.0
+
+
+def delinearized(component):
+    normalized = component / 100.0
+    if normalized <= 0.0031308:
+        delinearized_value = normalized * 12.92
+    else:
+        delinearized_value = 1.055 * normalized ** (1.0 / 2.4) - 0.055
+    return int(clamp(0, 255, round(delinearized_value * 255.0)))
+
+
+def argb_from_linrgb(r, g, b):
+    return argb_from_rgb(delinearized(r), delinearized(g), delinearized(b))
+
+
+def _lab_f(t):
+    if t > 216.0 / 24389.0:
+        return t ** (1.0 / 3.0)
+    return (24389.0 / 27.0 * t + 16.0) / 116.0
+
+
+def _lab_invf(ft):
+    ft3 = ft * ft * ft
+    if ft3 > 216.0 / 24389.0:
+        return ft3
+    return (116.0 * ft - 16.0) / (24389.0 / 27.0)
+
+
+def y_from_lstar(lstar):
+    return 100.0 * _lab_invf((lstar + 16.0) / 116.0)
+
+
+def lstar_from_y(y):
+    return _lab_f(y / 100.0) * 116.0 - 16.0
+
+
+def xyz_from_argb(argb):
+    r, g, b = (linearized(c) for c in rgb_from_argb(argb))
+    return tuple(row[0] * r + row[1] * g + row[2] * b for row in SRGB_TO_XYZ)
+
+
+def lstar_from_argb(argb):
+    return lstar_from_y(xyz_from_argb(argb)[1])
+
+
+def argb_from_lstar(lstar):
+    component = delinearized(y_from_lstar(lstar))
+    return argb_from_rgb(component, component, component)
+
+
+def lab_from_argb(argb):
+    x, y, z = xyz_from_argb(argb)
+    fx = _lab_f(x / WHITE_POINT_D65[0])
+    fy = _lab_f(y / WHITE_POINT_D65[1])
+    fz = _lab_f(z / WHITE_POINT_D65[2])
+    return 116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)
+
+
+# --- CAM16 观察条件 ---
+
+
+class ViewingConditions:
+    def __init__(
+        self,
+        white_point=WHITE_POINT_D65,
+        adapting_luminance=200.0 / math.pi * y_from_lstar(50.0) / 100.0,
+        background_lstar=50.0,
+        surround=2.0,
+        discounting_illuminant=False,
+    ):
+        xw, yw, zw = white_point
+        r_w = xw * 0.401288 + yw * 0.650173 + zw * -0.051461
+        g_w = xw * -0.250268 + yw * 1.204414 + zw * 0.045854
+        b_w = xw * -0.002079 + yw * 0.048952 + zw * 0.953127
+
+        f = 0.8 + surround / 10.0
+        if f >= 0.9:
+            c = 0.59 + (0.69 - 0.59) * ((f - 0.9) * 10.0)
+        else:
+            c = 0.525 + (0.59 - 0.525) * ((f - 0.8) * 10.0)
+        if discounting_illuminant:
+            d = 1.0
+        else:
+            d = f * (1.0 - (1.0 / 3.6) * math.exp((-adapting_luminance - 42.0) / 92.0))
+        d = clamp(0.0, 1.0, d)
+
+        rgb_d = (
+            d * (100.0 / r_w) + 1.0 - d,
+            d * (100.0 / g_w) + 1.0 - d,
+            d * (100.0 / b_w) + 1.0 - d,
+        )
+        k = 1.0 / (5.0 * adapting_luminance + 1.0)
+        k4 = k ** 4
+        k4f = 1.0 - k4
+        fl = k4 * adapting_luminance + 0.1 * k4f * k4f * (5.0 * adapting_luminance) ** (1.0 / 3.0)
+        n = y_from_lstar(background_lstar) / white_point[1]
+        z = 1.48 + math.sqrt(n)
+        nbb = 0.725 / n ** 0.2
+
+        factors = [
+            (fl * rgb_d[i] * w / 100.0) ** 0.42 for i, w in enumerate((r_w, g_w, b_w))
+        ]
+        rgb_a = [400.0 * f_ / (f_ + 27.13) for f_ in factors]
+        aw = (2.0 * rgb_a[0] + rgb_a[1] + 0.05 * rgb_a[2]) * nbb
+
+        self.n = n
+        self.aw = aw
+        self.nbb = nbb
+        self.ncb = nbb
+        self.c = c
+        self.nc = f
+        self.rgb_d = rgb_d
+        self.fl = fl
+        self.fl_root = fl ** 0.25
+        self.z = z
+
+
+DEFAULT_VIEWING_CONDITIONS = ViewingConditions()
+
+
+def cam16_from_argb(argb, vc=DEFAULT_VIEWING_CONDITIONS):
+    """返回 (hue, chroma, j, m, s, jstar, astar, bstar)"""
+    x, y, z = xyz_from_argb(argb)
+    r_c = 0.401288 * x + 0.650173 * y - 0.051461 * z
+    g_c = -0.250268 * x + 1.204414 * y + 0.045854 * z
+    b_c = -0.002079 * x + 0.048952 * y + 0.953127 * z
+
+    adapted = []
+    for value, d in zip((r_c, g_c, b_c), vc.rgb_d):
+        scaled = d * value
+        af = (vc.fl * abs(scaled) / 100.0) ** 0.42
+        adapted.append(math.copysign(1.0, scaled) * 400.0 * af / (af + 27.13))
+    r_a, g_a, b_a = adapted
+
+    a = (11.0 * r_a + -12.0 * g_a + b_a) / 11.0
+    b = (r_a + g_a - 2.0 * b_a) / 9.0
+    u = (20.0 * r_a + 20.0 * g_a + 21.0 * b_a) / 20.0
+    p2 = (40.0 * r_a + 20.0 * g_a + b_a) / 20.0
+    hue = sanitize_degrees(math.degrees(math.atan2(b, a)))
+    hue_radians = math.radians(hue)
+
+    ac = p2 * vc.nbb
+    j = 100.0 * (ac / vc.aw) ** (vc.c * vc.z) if ac > 0 else 0.0
+    hue_prime = hue + 360.0 if hue < 20.14 else hue
+    e_hue = 0.25 * (math.cos(math.radians(hue_prime) + 2.0) + 3.8)
+    p1 = 50000.0 / 13.0 * e_hue * vc.nc * vc.ncb
+    t = p1 * math.hypot(a, b) / (u + 0.305)
+    alpha = t ** 0.9 * (1.64 - 0.29 ** vc.n) ** 0.73
+    chroma = alpha * math.sqrt(j / 100.0)
+    m = chroma * vc.fl_root
+    s = 50.0 * math.sqrt((alpha * vc.c) / (vc.aw + 4.0))
+    jstar = (1.0 + 100.0 * 0.007) * j / (1.0 + 0.007 * j)
+    mstar = 1.0 / 0.0228 * math.log1p(0.0228 * m)
+    return (
+        hue,
+        chroma,
+        j,
+        m,
+        s,
+        jstar,
+        mstar * math.cos(hue_radians),
+        mstar * math.sin(hue_radians),
+    )
+
+
+def _linrgb_from_jch(j, chroma, hue, vc=DEFAULT_VIEWING_CONDITIONS):
+    """CAM16 (J, C, h) -> 线性 sRGB (0..100)"""
+    if chroma == 0.0 or j == 0.0:
+        alpha = 0.0
+    else:
+        alpha = chroma / math.sqrt(j / 100.0)
+    t = (alpha / (1.64 - 0.29 ** vc.n) ** 0.73) ** (1.0 / 0.9)
+    h_rad = math.radians(hue)
+    e_hue = 0.25 * (math.cos(h_rad + 2.0) + 3.8)
+    ac = vc.aw * (j / 100.0) ** (1.0 / vc.c / vc.z)
+    p1 = e_hue * (50000.0 / 13.0) * vc.nc * vc.ncb
+    p2 = ac / vc.nbb
+    h_sin = math.sin(h_rad)
+    h_cos = math.cos(h_rad)
+    gamma = 23.0 * (p2 + 0.305) * t / (23.0 * p1 + 11.0 * t * h_cos + 108.0 * t * h_sin)
+    a = gamma * h_cos
+    b = gamma * h_sin
+    r_a = (460.0 * p2 + 451.0 * a + 288.0 * b) / 1403.0
+    g_a = (460.0 * p2 - 891.0 * a - 261.0 * b) / 1403.0
+    b_a = (460.0 * p2 - 220.0 * a - 6300.0 * b) / 1403.0
+
+    unadapted = []
+    for value, d in zip((r_a, g_a, b_a), vc.rgb_d):
+        base = max(0.0, 27.13 * abs(value) / (400.0 - abs(value)))
+        unadapted.append(
+            math.copysign(1.0, value) * (100.0 / vc.fl) * base ** (1.0 / 0.42) / d
+        )
+    r_f, g_f, b_f = unadapted
+    x = 1.86206786 * r_f - 1.01125463 * g_f + 0.14918677 * b_f
+    y = 0.38752654 * r_f + 0.62144744 * g_f - 0.00897398 * b_f
+    z = -0.01584150 * r_f - 0.03412294 * g_f + 1.04996444 * b_f
+    return tuple(row[0] * x + row[1] * y + row[2] * z for row in XYZ_TO_SRGB)
+
+
+def _find_result_by_j(hue, chroma, y):
+    """牛顿迭代求满足目标亮度 Y 的 J；超出 sRGB 色域时返回 None"""
+    j = math.sqrt(y) * 11.0
+    for iteration in range(5):
+        r, g, b = _linrgb_from_jch(j, chroma, hue)
+        if r < 0 or g < 0 or b < 0:
+            return None
+        fnj = SRGB_TO_XYZ[1][0] * r + SRGB_TO_XYZ[1][1] * g + SRGB_TO_XYZ[1][2] * b
+        if fnj <= 0:
+            return None
+        if iteration == 4 or abs(fnj - y) < 0.002:
+            if r > 100.01 or g > 100.01 or b > 100.01:
+                return None
+            return argb_from_linrgb(r, g, b)
+        j = j - (fnj - y) * j / (2.0 * fnj)
+    return None
+
+
+@lru_cache(maxsize=8192)
+def solve_to_argb(hue, chroma, lstar):
+    """HCT -> ARGB。色度超出色域时降低色度，保持色相与明度"""
+    if chroma < 0.0001 or lstar < 0.0001 or lstar > 99.9999:
+        return argb_from_lstar(lstar)
+    hue = sanitize_degrees(hue)
+    y = y_from_lstar(lstar)
+    exact = _find_result_by_j(hue, chroma, y)
+    if exact is not None:
+        return exact
+
+    low, high = 0.0, chroma
+    best = argb_from_lstar(lstar)
+    for _ in range(14):
+        mid = (low + high) / 2.0
+        found = _find_result_by_j(hue, mid, y)
+        if found is None:
+            high = mid
+        else:
+            low = mid
+            best = found
+    return best
+
+
+class Hct:
+    __slots__ = ("hue", "chroma", "tone", "argb")
+
+    def __init__(self, argb):
+        cam = cam16_from_argb(argb)
+        self.hue = cam[0]
+        self.chroma = cam[1]
+        self.tone = lstar_from_argb(argb)
+        self.argb = argb
+
+    @classmethod
+    def from_argb(cls, argb):
+        return cls(argb)
+
+    @classmethod
+    def from_hct(cls, hue, chroma, tone):
+        return cls(solve_to_argb(hue, chroma, tone))
+
+    def to_argb(self):
+        return self.argb
+
+
+# --- 色调板 ---
+
+
+class TonalPalette:
+    def __init__(self, hue, chroma):
+        self.hue = hue
+        self.chroma = chroma
+        self._cache = {}
+        self.key_color = Hct.from_hct(hue, chroma, 50.0)
+
+    @classmethod
+    def from_argb(cls, argb):
+        hct = Hct.from_argb(argb)
+        return cls(hct.hue, hct.chroma)
+
+    @classmethod
+    def from_hct(cls, hct):
+        return cls(hct.hue, hct.chroma)
+
+    def tone(self, tone):
+        argb = self._cache.get(tone)
+        if argb is None:
+            argb = solve_to_argb(self.hue, self.chroma, tone)
+            self._cache[tone] = argb
+        return argb
+
+    def get_hct(self, tone):
+        return Hct.from_argb(self.tone(tone))
+
+
+# --- 对比度 ---
+
+
+def ratio_of_ys(y1, y2):
+    lighter = max(y1, y2)
+    darker = min(y1, y2)
+    return (lighter + 5.0) / (darker + 5.0)
+
+
+def ratio_of_tones(a, b):
+    return ratio_of_ys(y_from_lstar(clamp(0.0, 100.0, a)), y_from_lstar(clamp(0.0, 100.0, b)))
+
+
+def contrast_lighter(tone, ratio):
+    if tone < 0.0 or tone > 100.0:
+        return -1.0
+    dark_y = y_from_lstar(tone)
+    light_y = ratio * (dark_y + 5.0) - 5.0
+    real = ratio_of_ys(light_y, dark_y)
+    if real < ratio and abs(real - ratio) > 0.04:
+        return -1.0
+    value = lstar_from_y(light_y) + 0.4
+    return -1.0 if value < 0 or value > 100 else value
+
+
+def contrast_darker(tone, ratio):
+    if tone < 0.0 or tone > 100.0:
+        return -1.0
+    light_y = y_from_lstar(tone)
+    dark_y = (light_y + 5.0) / ratio - 5.0
+    real = ratio_of_ys(light_y, dark_y)
+    if real < ratio and abs(real - ratio) > 0.04:
+        return -1.0
+    value = lstar_from_y(dark_y) - 0.4
+    return -1.0 if value < 0 or value > 100 else value
+
+
+def contrast_lighter_unsafe(tone, ratio):
+    value = contrast_lighter(tone, ratio)
+    return 100.0 if value < 0.0 else value
+
+
+def contrast_darker_unsafe(tone, ratio):
+    value = contrast_darker(tone, ratio)
+    return 0.0 if value < 0.0 else value
+
+
+def tone_prefers_light_foreground(tone):
+    return round(tone) < 60
+
+
+def foreground_tone(bg_tone, ratio):
+    lighter = contrast_lighter_unsafe(bg_tone, ratio)
+    darker = contrast_darker_unsafe(bg_tone, ratio)
+    lighter_ratio = ratio_of_tones(lighter, bg_tone)
+    darker_ratio = ratio_of_tones(darker, bg_tone)
+    if tone_prefers_light_foreground(bg_tone):
+        negligible = (
+            abs(lighter_ratio - darker_ratio) < 0.1
+            and lighter_ratio < ratio
+            and darker_ratio < ratio
+        )
+        if lighter_ratio >= ratio or lighter_ratio >= darker_ratio or negligible:
+            return lighter
+        return darker
+    if darker_ratio >= ratio or darker_ratio >= lighter_ratio:
+        return darker
+    return lighter
+
+
+# --- 色温与不喜欢色判定 (content / fidelity 方案使用) ---
+
+
+def is_disliked(hct):
+    return 90.0 <= round(hct.hue) <= 111.0 and round(hct.chroma) > 16 and round(hct.tone) < 65
+
+
+def fix_if_disliked(hct):
+    if is_disliked(hct):
+        return Hct.from_hct(hct.hue, hct.chroma, 70.0)
+    return hct
+
+
+def _raw_temperature(hct):
+    _, a, b = lab_from_argb(hct.argb)
+    hue = sanitize_degrees(math.degrees(math.atan2(b, a)))
+    chroma = math.hypot(a, b)
+    return -0.5 + 0.02 * chroma ** 1.07 * math.cos(math.radians(sanitize_degrees(hue - 50.0)))
+
+
+class TemperatureCache:
+    def __init__(self, source):
+        self.source = source
+        self.hcts_by_hue = [
+            Hct.from_hct(float(hue), source.chroma, source.tone) for hue in range(361)
+        ]
+        self.temps = {id(h): _raw_temperature(h) for h in self.hcts_by_hue}
+        self.temps[id(source)] = _raw_temperature(source)
+        by_temp = sorted(self.hcts_by_hue + [source], key=lambda h: self.temps[id(h)])
+        self.coldest = by_temp[0]
+        self.warmest = by_temp[-1]
+
+    def _temp(self, hct):
+        return self.temps[id(hct)]
+
+    def relative_temperature(self, hct):
+        rng = self._temp(self.warmest) - self._temp(self.coldest)
+        diff = self._temp(hct) - self._temp(self.coldest)
+        return 0.5 if rng == 0.0 else diff / rng
+
+    @staticmethod
+    def _is_between(angle, a, b):
+        if a < b:
+            return a <= angle <= b
+        return a <= angle or angle <= b
+
+    def complement(self):
+        coldest_hue = self.coldest.hue
+        coldest_temp = self._temp(self.coldest)
+        warmest_hue = self.warmest.hue
+        rng = self._temp(self.warmest) - coldest_temp
+        start_cold_to_warm = self._is_between(self.source.hue, coldest_hue, warmest_hue)
+        start_hue = warmest_hue if start_cold_to_warm else coldest_hue
+        end_hue = coldest_hue if start_cold_to_warm else warmest_hue
+        smallest_error = 1000.0
+        answer = self.hcts_by_hue[int(round(self.source.hue)) % 361]
+        complement_temp = 1.0 - self.relative_temperature(self.source)
+        for addend in range(361):
+            hue = sanitize_degrees(start_hue + addend)
+            if not self._is_between(hue, start_hue, end_hue):
+                continue
+            candidate = self.hcts_by_hue[int(round(hue)) % 361]
+            relative = 0.5 if rng == 0 else (self._temp(candidate) - coldest_temp) / rng
+            error = abs(complement_temp - relative)
+            if error < smallest_error:
+                smallest_error = error
+                answer = candidate
+        return answer
+
+    def analogous(self, count=5, divisions=12):
+        start_hue = int(round(self.source.hue)) % 360
+        start = self.hcts_by_hue[start_hue]
+        last_temp = self.relative_temperature(start)
+        all_colors = [start]
+
+        total = 0.0
+        for i in range(360):
+            hct = self.hcts_by_hue[(start_hue + i) % 360]
+            temp = self.relative_temperature(hct)
+            total += abs(temp - last_temp)
+            last_temp = temp
+
+        hue_addend = 1
+        temp_step = total / divisions
+        total_delta = 0.0
+        last_temp = self.relative_temperature(start)
+        hct = start
+        while len(all_colors) < divisions:
+            hct = self.hcts_by_hue[(start_hue + hue_addend) % 360]
+            temp = self.relative_temperature(hct)
+            total_delta += abs(temp - last_temp)
+            satisfied = total_delta >= len(all_colors) * temp_step
+            index_addend = 1
+            while satisfied and len(all_colors) < divisions:
+                all_colors.append(hct)
+                satisfied = total_delta >= (len(all_colors) + index_addend) * temp_step
+                index_addend += 1
+            last_temp = temp
+            hue_addend += 1
+            if hue_addend > 360:
+                while len(all_colors) < divisions:
+                    all_colors.append(hct)
+                break
+
+        answers = [self.source]
+        ccw = (count - 1) // 2
+        for i in range(1, ccw + 1):
+            answers.insert(0, all_colors[(-i) % len(all_colors)])
+        for i in range(1, count - ccw):
+            answers.append(all_colors[i % len(all_colors)])
+        return answers
+
+
+# --- 动态配色方案 ---
+
+SCHEME_VARIANTS = (
+    "tonal-spot",
+    "content",
+    "expressive",
+    "fidelity",
+    "fruit-salad",
+    "monochrome",
+    "neutral",
+    "rainbow",
+    "vibrant",
+)
+
+_VIBRANT_HUES = (0, 41, 61, 101, 131, 181, 251, 301, 360)
+_VIBRANT_SECONDARY = (18, 15, 10, 12, 15, 18, 15, 12, 12)
+_VIBRANT_TERTIARY = (35, 30, 20, 25, 30, 35, 30, 25, 25)
+_EXPRESSIVE_HUES = (0, 21, 51, 121, 151, 191, 271, 321, 360)
+_EXPRESSIVE_SECONDARY = (45, 95, 45, 20, 45, 90, 45, 45, 45)
+_EXPRESSIVE_TERTIARY = (120, 120, 20, 45, 20, 15, 20, 120, 120)
+
+
+def _rotated_hue(source_hue, hues, rotations):
+    for i in range(len(hues) - 1):
+        if hues[i] < source_hue < hues[i + 1]:
+            return sanitize_degrees(source_hue + rotations[i])
+    return source_hue
+
+
+def normalize_variant(flavor):
+    flavor = (flavor or "tonal-spot").lower()
+    if flavor.startswith("scheme-"):
+        flavor = flavor[len("scheme-"):]
+    return flavor if flavor in SCHEME_VARIANTS else "tonal-spot"
+
+
+class DynamicScheme:
+    def __init__(self, source_argb, variant="tonal-spot", is_dark=True, contrast_level=0.0):
+        self.source = Hct.from_argb(source_argb)
+        self.variant = normalize_variant(variant)
+        self.is_dark = is_dark
+        self.contrast_level = contrast_level
+        hue, chroma = self.source.hue, self.source.chroma
+        v = self.variant
+
+        if v == "content" or v == "fidelity":
+            primary = (hue, chroma)
+            secondary = (hue, max(chroma - 32.0, chroma * 0.5))
+            temps = TemperatureCache(self.source)
+            tertiary_hct = temps.complement() if v == "fidelity" else temps.analogous(3, 6)[2]
+            tertiary = TonalPalette.from_hct(fix_if_disliked(tertiary_hct))
+            neutral = (hue, chroma / 8.0)
+            neutral_variant = (hue, chroma / 8.0 + 4.0)
+        elif v == "expressive":
+            primary = (sanitize_degrees(hue + 240.0), 40.0)
+            secondary = (_rotated_hue(hue, _EXPRESSIVE_HUES, _EXPRESSIVE_SECONDARY), 24.0)
+            tertiary = (_rotated_hue(hue, _EXPRESSIVE_HUES, _EXPRESSIVE_TERTIARY), 32.0)
+            neutral = (sanitize_degrees(hue + 15.0), 8.0)
+            neutral_variant = (sanitize_degrees(hue + 15.0), 12.0)
+        elif v == "fruit-salad":
+            primary = (sanitize_degrees(hue - 50.0), 48.0)
+            secondary = (sanitize_degrees(hue - 50.0), 36.0)
+            tertiary = (hue, 36.0)
+            neutral = (hue, 10.0)
+            neutral_variant = (hue, 16.0)
+        elif v == "monochrome":
+            primary = secondary = tertiary = neutral = neutral_variant = (hue, 0.0)
+        elif v == "neutral":
+            primary = (hue, 12.0)
+            secondary = (hue, 8.0)
+            tertiary = (sanitize_degrees(hue + 60.0), 16.0)
+            neutral = (hue, 2.0)
+            neutral_variant = (hue, 2.0)
+        elif v == "rainbow":
+            primary = (hue, 48.0)
+            secondary = (hue, 16.0)
+            tertiary = (sanitize_degrees(hue + 60.0), 24.0)
+            neutral = (hue, 0.0)
+            neutral_variant = (hue, 0.0)
+        elif v == "vibrant":
+            primary = (hue, 200.0)
+            secondary = (_rotated_hue(hue, _VIBRANT_HUES, _VIBRANT_SECONDARY), 24.0)
+            tertiary = (_rotated_hue(hue, _VIBRANT_HUES, _VIBRANT_TERTIARY), 32.0)
+            neutral = (hue, 10.0)
+            neutral_variant = (hue, 12.0)
+        else:
+            primary = (hue, 36.0)
+            secondary = (hue, 16.0)
+            tertiary = (sanitize_degrees(hue + 60.0), 24.0)
+            neutral = (hue, 6.0)
+            neutral_variant = (hue, 8.0)
+
+        def palette(spec):
+            return spec if isinstance(spec, TonalPalette) else TonalPalette(*spec)
+
+        self.primary_palette = palette(primary)
+        self.secondary_palette = palette(secondary)
+        self.tertiary_palette = palette(tertiary)
+        self.neutral_palette = palette(neutral)
+        self.neutral_variant_palette = palette(neutral_variant)
+        self.error_palette = TonalPalette(25.0, 84.0)
+        self._tones = {}
+
+    @property
+    def is_fidelity(self):
+        return self.variant in ("fidelity", "content")
+
+    @property
+    def is_monochrome(self):
+        return self.variant == "monochrome"
+
+    def palettes(self):
+        return {
+            "primary": self.primary_palette,
+            "secondary": self.secondary_palette,
+            "tertiary": self.tertiary_palette,
+            "neutral": self.neutral_palette,
+            "neutral_variant": self.neutral_variant_palette,
+            "error": self.error_palette,
+        }
+
+    def get_tone(self, name):
+        tone = self._tones.get(name)
+        if tone is None:
+            tone = _DYNAMIC_COLORS[name].get_tone(self)
+            self._tones[name] = tone
+        return tone
+
+    def get_argb(self, name):
+        color = _DYNAMIC_COLORS[name]
+        return color.palette(self).tone(self.get_tone(name))
+
+    def to_dict(self):
+        return {name: self.get_argb(name) for name in _DYNAMIC_COLORS}
+
+
+def _find_desired_chroma_by_tone(hue, chroma, tone, by_decreasing_tone):
+    answer = tone
+    closest = Hct.from_hct(hue, chroma, tone)
+    if closest.chroma < chroma:
+        peak = closest.chroma
+        while closest.chroma < chroma:
+            answer += -1.0 if by_decreasing_tone else 1.0
+            potential = Hct.from_hct(hue, chroma, answer)
+            if peak > potential.chroma:
+                break
+            if abs(potential.chroma - chroma) < 0.4:
+                break
+            if abs(potential.chroma - chroma) < abs(closest.chroma - chroma):
+                closest = potential
+            peak = max(peak, potential.chroma)
+    return answer
+
+
+class _DynamicColor:
+    def __init__(
+        self, name, palette, tone, is_background=False, background=None,
+        second_background=None, contrast_curve=None, tone_delta_pair=None,
+    ):
+        self.name = name
+        self.palette = palette
+        self.tone = tone
+        self.is_background = is_background
+        self.background = background
+        self.second_background = second_background
+        self.contrast_curve = contrast_curve
+        self.tone_delta_pair = tone_delta_pair
+
+    @staticmethod
+    def _curve(curve, level):
+        low, normal, medium, high = curve
+        if level <= -1.0:
+            return low
+        if level < 0.0:
+            return low + (normal - low) * (level + 1.0)
+        if level < 0.5:
+            return normal + (medium - normal) * (level / 0.5)
+        if level < 1.0:
+            return medium + (high - medium) * ((level - 0.5) / 0.5)
+        return high
+
+    def get_tone(self, s):
+        decreasing = s.contrast_level < 0
+        if self.tone_delta_pair is not None:
+            role_a, role_b, delta, polarity, stay_together = self.tone_delta_pair(s)
+            bg_tone = s.get_tone(self.background(s))
+            a_is_nearer = (
+                polarity == "nearer"
+                or (polarity == "lighter" and not s.is_dark)
+                or (polarity == "darker" and s.is_dark)
+            )
+            nearer = _DYNAMIC_COLORS[role_a if a_is_nearer else role_b]
+            farther = _DYNAMIC_COLORS[role_b if a_is_nearer else role_a]
+            am_nearer = self.name == nearer.name
+            direction = 1.0 if s.is_dark else -1.0
+            n_contrast = self._curve(nearer.contrast_curve, s.contrast_level)
+            f_contrast = self._curve(farther.contrast_curve, s.contrast_level)
+
+            n_initial = nearer.tone(s)
+            n_tone = n_initial if ratio_of_tones(bg_tone, n_initial) >= n_contrast else foreground_tone(bg_tone, n_contrast)
+            f_initial = farther.tone(s)
+            f_tone = f_initial if ratio_of_tones(bg_tone, f_initial) >= f_contrast else foreground_tone(bg_tone, f_contrast)
+            if decreasing:
+                n_tone = foreground_tone(bg_tone, n_contrast)
+                f_tone = foreground_tone(bg_tone, f_contrast)
+
+            if (f_tone - n_tone) * direction < delta:
+                f_tone = clamp(0.0, 100.0, n_tone + delta * direction)
+                if (f_tone - n_tone) * direction < delta:
+                    n_tone = clamp(0.0, 100.0, f_tone - delta * direction)
+
+            if 50.0 <= n_tone < 60.0:
+                if direction > 0:
+                    n_tone = 60.0
+                    f_tone = max(f_tone, n_tone + delta * direction)
+                else:
+                    n_tone = 49.0
+                    f_tone = min(f_tone, n_tone + delta * direction)
+            elif 50.0 <= f_tone < 60.0:
+                if stay_together:
+                    if direction > 0:
+                        n_tone = 60.0
+                        f_tone = max(f_tone, n_tone + delta * direction)
+                    else:
+                        n_tone = 49.0
+                        f_tone = min(f_tone, n_tone + delta * direction)
+                else:
+                    f_tone = 60.0 if direction > 0 else 49.0
+            return n_tone if am_nearer else f_tone
+
+        answer = self.tone(s)
+        if self.background is None:
+            return answer
+        bg_tone = s.get_tone(self.background(s))
+        desired = self._curve(self.contrast_curve, s.contrast_level)
+        if ratio_of_tones(bg_tone, answer) < desired:
+            answer = foreground_tone(bg_tone, desired)
+        if decreasing:
+            answer = foreground_tone(bg_tone, desired)
+        if self.is_background and 50.0 <= answer < 60.0:
+            answer = 49.0 if ratio_of_tones(49.0, bg_tone) >= desired else 60.0
+
+        if self.second_background is not None:
+            bg_tone2 = s.get_tone(self.second_background(s))
+            upper = max(bg_tone, bg_tone2)
+            lower = min(bg_tone, bg_tone2)
+            if ratio_of_tones(upper, answer) >= desired and ratio_of_tones(lower, answer) >= desired:
+                return answer
+            light_option = contrast_lighter(upper, desired)
+            dark_option = contrast_darker(lower, desired)
+            available = [t for t in (light_option, dark_option) if t != -1]
+            if tone_prefers_light_foreground(bg_tone) or tone_prefers_light_foreground(bg_tone2):
+                return 100.0 if light_option < 0 else light_option
+            if len(available) == 1:
+                return available[0]
+            return 0.0 if dark_option < 0 else dark_option
+        return answer
+
+
+def _highest_surface(s):
+    return "surface_bright" if s.is_dark else "surface_dim"
+
+
+def _build_dynamic_colors():
+    colors = {}
+
+    def add(name, palette, tone, **kwargs):
+        colors[name] = _DynamicColor(name, palette, tone, **kwargs)
+
+    neutral = lambda s: s.neutral_palette  # noqa: E731
+    neutral_variant = lambda s: s.neutral_variant_palette  # noqa: E731
+    primary = lambda s: s.primary_palette  # noqa: E731
+    secondary = lambda s: s.secondary_palette  # noqa: E731
+    tertiary = lambda s: s.tertiary_palette  # noqa: E731
+    error = lambda s: s.error_palette  # noqa: E731
+
+    def dark_light(dark, light):
+        return lambda s: dark if s.is_dark else light
+
+    on_curve = (4.5, 7.0, 11.0, 21.0)
+    accent_curve = (3.0, 4.5, 7.0, 7.0)
+    container_curve = (1.0, 1.0, 3.0, 4.5)
+
+    add("background", neutral, dark_light(6.0, 98.0), is_background=True)
+    add("on_background", neutral, dark_light(90.0, 10.0),
+        background=lambda s: "background", contrast_curve=(3.0, 3.0, 4.5, 7.0))
+    add("surface", neutral, dark_light(6.0, 98.0), is_background=True)
+    add("surface_dim", neutral, dark_light(6.0, 87.0), is_background=True)
+    add("surface_bright", neutral, dark_light(24.0, 98.0), is_background=True)
+    add("surface_container_lowest", neutral, dark_light(4.0, 100.0), is_background=True)
+    add("surface_container_low", neutral, dark_light(10.0, 96.0), is_background=True)
+    add("surface_container", neutral, dark_light(12.0, 94.0), is_background=True)
+    add("surface_container_high", neutral, dark_light(17.0, 92.0), is_background=True)
+    add("surface_container_highest", neutral, dark_light(22.0, 90.0), is_background=True)
+    add("on_surface", neutral, dark_light(90.0, 10.0),
+        background=_highest_surface, contrast_curve=on_curve)
+    add("surface_variant", neutral_variant, dark_light(30.0, 90.0), is_background=True)
+    add("on_surface_variant", neutral_variant, dark_light(80.0, 30.0),
+        background=_highest_surface, contrast_curve=(3.0, 4.5, 7.0, 11.0))
+    add("inverse_surface", neutral, dark_light(90.0, 20.0))
+    add("inverse_on_surface", neutral, dark_light(20.0, 95.0),
+        background=lambda s: "inverse_surface", contrast_curve=on_curve)
+    add("outline", neutral_variant, dark_light(60.0, 50.0),
+        background=_highest_surface, contrast_curve=(1.5, 3.0, 4.5, 7.0))
+    add("outline_variant", neutral_variant, dark_light(30.0, 80.0),
+        background=_highest_surface, contrast_curve=container_curve)
+    add("shadow", neutral, lambda s: 0.0)
+    add("scrim", neutral, lambda s: 0.0)
+    add("surface_tint", primary, dark_light(80.0, 40.0), is_background=True)
+
+    # --- primary ---
+    def primary_tone(s):
+        if s.is_monochrome:
+            return 100.0 if s.is_dark else 0.0
+        return 80.0 if s.is_dark else 40.0
+
+    def primary_container_tone(s):
+        if s.is_fidelity:
+            return s.source.tone
+        if s.is_monochrome:
+            return 85.0 if s.is_dark else 25.0
+        return 30.0 if s.is_dark else 90.0
+
+    def on_primary_container_tone(s):
+        if s.is_fidelity:
+            return foreground_tone(s.get_tone("primary_container"), 4.5)
+        if s.is_monochrome:
+            return 0.0 if s.is_dark else 100.0
+        return 90.0 if s.is_dark else 10.0
+
+    primary_pair = lambda s: ("primary_container", "primary", 10.0, "nearer", False)  # noqa: E731
+    add("primary", primary, primary_tone, is_background=True, background=_highest_surface,
+        contrast_curve=accent_curve, tone_delta_pair=primary_pair)
+    add("on_primary", primary,
+        lambda s: (10.0 if s.is_dark else 90.0) if s.is_monochrome else (20.0 if s.is_dark else 100.0),
+        background=lambda s: "primary", contrast_curve=on_curve)
+    add("primary_container", primary, primary_container_tone, is_background=True,
+        background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=primary_pair)
+    add("on_primary_container", primary, on_primary_container_tone,
+        background=lambda s: "primary_container", contrast_curve=on_curve)
+    add("inverse_primary", primary, dark_light(40.0, 80.0),
+        background=lambda s: "inverse_surface", contrast_curve=accent_curve)
+
+    # --- secondary ---
+    def secondary_container_tone(s):
+        initial = 30.0 if s.is_dark else 90.0
+        if s.is_monochrome:
+            return 30.0 if s.is_dark else 85.0
+        if not s.is_fidelity:
+            return initial
+        return _find_desired_chroma_by_tone(
+            s.secondary_palette.hue, s.secondary_palette.chroma, initial, not s.is_dark
+        )
+
+    def on_secondary_container_tone(s):
+        if not s.is_fidelity:
+            return 90.0 if s.is_dark else 10.0
+        return foreground_tone(s.get_tone("secondary_container"), 4.5)
+
+    secondary_pair = lambda s: ("secondary_container", "secondary", 10.0, "nearer", False)  # noqa: E731
+    add("secondary", secondary, dark_light(80.0, 40.0), is_background=True,
+        background=_highest_surface, contrast_curve=accent_curve, tone_delta_pair=secondary_pair)
+    add("on_secondary", secondary,
+        lambda s: (10.0 if s.is_dark else 100.0) if s.is_monochrome else (20.0 if s.is_dark else 100.0),
+        background=lambda s: "secondary", contrast_curve=on_curve)
+    add("secondary_container", secondary, secondary_container_tone, is_background=True,
+        background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=secondary_pair)
+    add("on_secondary_container", secondary, on_secondary_container_tone,
+        background=lambda s: "secondary_container", contrast_curve=on_curve)
+
+    # --- tertiary ---
+    def tertiary_container_tone(s):
+        if s.is_monochrome:
+            return 60.0 if s.is_dark else 49.0
+        if not s.is_fidelity:
+            return 30.0 if s.is_dark else 90.0
+        proposed = s.tertiary_palette.get_hct(s.source.tone)
+        return fix_if_disliked(proposed).tone
+
+    def on_tertiary_container_tone(s):
+        if s.is_monochrome:
+            return 0.0 if s.is_dark else 100.0
+        if not s.is_fidelity:
+            return 90.0 if s.is_dark else 10.0
+        return foreground_tone(s.get_tone("tertiary_container"), 4.5)
+
+    tertiary_pair = lambda s: ("tertiary_container", "tertiary", 10.0, "nearer", False)  # noqa: E731
+    add("tertiary", tertiary,
+        lambda s: (90.0 if s.is_dark else 25.0) if s.is_monochrome else (80.0 if s.is_dark else 40.0),
+        is_background=True, background=_highest_surface, contrast_curve=accent_curve,
+        tone_delta_pair=tertiary_pair)
+    add("on_tertiary", tertiary,
+        lambda s: (10.0 if s.is_dark else 90.0) if s.is_monochrome else (20.0 if s.is_dark else 100.0),
+        background=lambda s: "tertiary", contrast_curve=on_curve)
+    add("tertiary_container", tertiary, tertiary_container_tone, is_background=True,
+        background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=tertiary_pair)
+    add("on_tertiary_container", tertiary, on_tertiary_container_tone,
+        background=lambda s: "tertiary_container", contrast_curve=on_curve)
+
+    # --- error ---
+    error_pair = lambda s: ("error_container", "error", 10.0, "nearer", False)  # noqa: E731
+    add("error", error, dark_light(80.0, 40.0), is_background=True,
+        background=_highest_surface, contrast_curve=accent_curve, tone_delta_pair=error_pair)
+    add("on_error", error, dark_light(20.0, 100.0),
+        background=lambda s: "error", contrast_curve=on_curve)
+    add("error_container", error, dark_light(30.0, 90.0), is_background=True,
+        background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=error_pair)
+    add("on_error_container", error, dark_light(90.0, 10.0),
+        background=lambda s: "error_container", contrast_curve=on_curve)
+
+    # --- fixed ---
+    for role, palette, mono in (
+        ("primary", primary, (40.0, 30.0, 100.0, 90.0)),
+        ("secondary", secondary, (80.0, 70.0, 10.0, 25.0)),
+        ("tertiary", tertiary, (40.0, 30.0, 100.0, 90.0)),
+    ):
+        pair = (lambda r: lambda s: (f"{r}_fixed", f"{r}_fixed_dim", 10.0, "lighter", True))(role)
+        defaults = (90.0, 80.0, 10.0, 30.0)
+
+        def fixed_tone(index, mono=mono, defaults=defaults):
+            return lambda s: mono[index] if s.is_monochrome else defaults[index]
+
+        add(f"{role}_fixed", palette, fixed_tone(0), is_background=True,
+            background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=pair)
+        add(f"{role}_fixed_dim", palette, fixed_tone(1), is_background=True,
+            background=_highest_surface, contrast_curve=container_curve, tone_delta_pair=pair)
+        add(f"on_{role}_fixed", palette, fixed_tone(2),
+            background=(lambda r: lambda s: f"{r}_fixed_dim")(role),
+            second_background=(lambda r: lambda s: f"{r}_fixed")(role),
+            contrast_curve=on_curve)
+        add(f"on_{role}_fixed_variant", palette, fixed_tone(3),
+            background=(lambda r: lambda s: f"{r}_fixed_dim")(role),
+            second_background=(lambda r: lambda s: f"{r}_fixed")(role),
+            contrast_curve=(3.0, 4.5, 7.0, 11.0))
+
+    return colors
+
+
+_DYNAMIC_COLORS = _build_dynamic_colors()
+COLOR_NAMES = tuple(_DYNAMIC_COLORS)
+PALETTE_TONES = (0, 5, 10, 15, 20, 25, 30, 35, 40, 50, 60, 70, 80, 90, 95, 98, 99, 100)
+
+
+def scheme_colors(source_argb, flavor="tonal-spot", mode="dark", contrast_level=0.0):
+    """
+    生成与 matugen `--json hex` 相同结构的颜色字典:
+    {"colors": {name: {"light", "dark", "default"}}, "palettes": {...}}
+    """
+    dark = DynamicScheme(source_argb, flavor, True, contrast_level)
+    light = DynamicScheme(source_argb, flavor, False, contrast_level)
+    dark_colors = dark.to_dict()
+    light_colors = light.to_dict()
+
+    colors = {}
+    for name in COLOR_NAMES:
+        entry = {
+            "dark": hex_from_argb(dark_colors[name]),
+            "light": hex_from_argb(light_colors[name]),
+        }
+        entry["default"] = entry["dark"] if mode == "dark" else entry["light"]
+        colors[name] = entry
+    source_hex = hex_from_argb(source_argb)
+    colors["source_color"] = {"dark": source_hex, "light": source_hex, "default": source_hex}
+
+    palettes = {
+        name: {str(t): hex_from_argb(p.tone(float(t))) for t in PALETTE_TONES}
+        for name, p in dark.palettes().items()
+    }
+    return {"colors": colors, "mode": mode, "palettes": palettes}
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+模板 hook 并行执行器。
+
+matugen 串行执行每个模板的 hook，一个卡住的 hook 会拖慢之后的所有目标。
+这里把 hook 收集起来按依赖关系组成 DAG，互不依赖的 hook 在有界线程池中并发运行：
+- 每个 hook 独立进程组，超时后整组 kill
+- stdin 关闭，stdout/stderr 被捕获，不会卡在交互输入上
+- 依赖的 hook 失败或超时时，下游 hook 直接跳过
+整体耗时取决于最慢的一条依赖链，而不是所有 hook 之和。
+"""
+import os
+import signal
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from backend import metrics
+    from backend.logger import log
+except ImportError:
+    import logging
+    import metrics
+
+    log = logging.getLogger(__name__)
+
+# hook 大多在等待子进程，线程数不必跟随 CPU 核数
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30.0
+
+
+class HookJob:
+    def __init__(self, name, command, depends_on=(), timeout=None, cwd=None):
+        self.name = name
+        self.command = command
+        self.depends_on = tuple(depends_on or ())
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.cwd = cwd
+
+
+class HookResult:
+    __slots__ = ("name", "status", "returncode", "duration", "stderr")
+
+    def __init__(self, name, status, returncode=None, duration=0.0, stderr=""):
+        self.name = name
+        # ok | failed | timeout | skipped
+        self.status = status
+        self.returncode = returncode
+        self.duration = duration
+        self.stderr = stderr
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        proc.kill()
+
+
+def run_hook(job):
+    """在独立进程组中运行一个 hook，返回 HookResult"""
+    start = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            job.command,
+            shell=True,
+            cwd=job.cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+    except OSError as e:
+        return HookResult(job.name, "failed", None, time.monotonic() - start, str(e))
+
+    try:
+        _, stderr = proc.communicate(timeout=job.timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        _, stderr = proc.communicate()
+        return HookResult(
+            job.name, "timeout", proc.returncode, time.monotonic() - start, stderr or ""
+        )
+
+    status = "ok" if proc.returncode == 0 else "failed"
+    return HookResult(
+        job.name, status, proc.returncode, time.monotonic() - start, stderr or ""
+    )
+
+
+def _check_graph(jobs):
+    """丢弃指向本次未运行 hook 的依赖，并在发现环时抛出 ValueError"""
+    names = {job.name for job in jobs}
+    for job in jobs:
+        missing = [d for d in job.depends_on if d not in names]
+        if missing:
+            # 依赖的目标本次未变化 (没有 hook 要跑) 时视为已满足；
+            # 配置中根本不存在的名字已由 render.load_templates 警告并剔除
+            job.depends_on = tuple(d for d in job.depends_on if d in names)
+
+    state = {}
+
+    def visit(name, graph):
+        if state.get(name) == 1:
+            raise ValueError(f"Hook dependency cycle at {name}")
+        if state.get(name) == 2:
+            return
+        state[name] = 1
+        for dep in graph[name]:
+            visit(dep, graph)
+        state[name] = 2
+
+    graph = {job.name: job.depends_on for job in jobs}
+    for name in graph:
+        visit(name, graph)
+
+
+def run_hooks(jobs, max_workers=MAX_WORKERS):
+    """
+    按依赖关系并发执行 hook。返回 {name: HookResult}。
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    _check_graph(jobs)
+
+    results = {}
+    pending = {job.name: job for job in jobs}
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hook") as pool:
+        running = {}
+        while pending or running:
+            for name, job in list(pending.items()):
+                deps = [results.get(d) for d in job.depends_on]
+                if any(r is None for r in deps):
+                    continue
+                del pending[name]
+                failed = [r.name for r in deps if not r.ok]
+                if failed:
+                    results[name] = HookResult(
+                        name, "skipped", stderr=f"dependency failed: {', '.join(failed)}"
+                    )
+                    continue
+                running[pool.submit(run_hook, job)] = name
+
+            if not running:
+                # 剩余的都在等待被跳过的依赖，下一轮会处理
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+
+    _report(results, time.monotonic() - start)
+    return results
+
+
+def _report(results, elapsed):
+    for result in sorted(results.values(), key=lambda r: -r.duration):
+        if result.status != "skipped":
+            metrics.record(f"hook:{result.name}", result.duration * 1000)
+        message = f"[{result.name}] hook {result.status} in {result.duration:.2f}s"
+        if result.ok:
+            log.debug(message)
+            continue
+        detail = result.stderr.strip().splitlines()
+        if detail:
+            message += f": {detail[-1]}"
+        if result.status == "skipped":
+            log.info(message)
+        else:
+            log.error(message)
+    metrics.record("hooks", elapsed * 1000)
+    slowest = max(results.values(), key=lambda r: r.duration)
+    ok = sum(r.ok for r in results.values())
+    log.info(
+        "Ran %d hooks in %.2fs (%d ok, slowest: %s %.2fs)",
+        len(results), elapsed, ok, slowest.name, slowest.duration,
+        extra={"stage": "hooks", "duration_ms": round(elapsed * 1000, 1)},
+    )
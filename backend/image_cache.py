@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+matugen 无法直接读取的壁纸格式 (JXL / AVIF / HEIC) 的解码缓存。
+
+每张图片按 (路径, 大小, mtime, inode) 指纹缓存一份 PNG，
+多张壁纸来回切换不会重复解码；总大小有上限，按最近使用淘汰。
+优先用 Pillow (及其插件) 在进程内解码，不可用时调用 djxl / avifdec / heif-convert。
+"""
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖
+    Image = None
+
+try:
+    from backend import cache
+    from backend.logger import log
+except ImportError:
+    import cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+DECODED_DIR = cache.CACHE_ROOT / "decoded"
+
+DECODED_CACHE = cache.LruDiskCache(
+    DECODED_DIR,
+    max_entries=32,
+    max_bytes=768 * 1024 * 1024,
+    memory_entries=0,
+    suffix=".png",
+)
+
+# 扩展名 -> 命令行解码器 (按顺序尝试)，参数形式均为 <tool> <input> <output.png>
+CONVERTERS = {
+    ".jxl": ("djxl",),
+    ".avif": ("avifdec",),
+    ".heic": ("heif-dec", "heif-convert"),
+    ".heif": ("heif-dec", "heif-convert"),
+}
+NEEDS_DECODE = tuple(CONVERTERS)
+
+_PLUGINS_LOADED = False
+
+
+def needs_decode(image_path):
+    return bool(image_path) and image_path.lower().endswith(NEEDS_DECODE)
+
+
+def load_plugins():
+    """注册可选的 Pillow 解码插件 (缺失时忽略)"""
+    global _PLUGINS_LOADED
+    if _PLUGINS_LOADED:
+        return
+    _PLUGINS_LOADED = True
+    try:
+        import pillow_jxl  # noqa: F401
+    except ImportError:
+        pass
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    try:
+        import pillow_heif
+
+        pillow_heif.register_heif_opener()
+    except ImportError:
+        pass
+
+
+def _decode_pillow(image_path, out_path):
+    if Image is None:
+        return False
+    load_plugins()
+    try:
+        with Image.open(image_path) as img:
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            img.save(out_path, format="PNG", compress_level=1)
+        return True
+    except Exception as e:
+        log.debug(f"Pillow could not decode {image_path}: {e}")
+        return False
+
+
+def _decode_cli(image_path, out_path):
+    ext = os.path.splitext(image_path)[1].lower()
+    for tool in CONVERTERS.get(ext, ()):
+        if not shutil.which(tool):
+            continue
+        res = subprocess.run(
+            [tool, image_path, out_path],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+        )
+        if res.returncode == 0 and os.path.getsize(out_path) > 0:
+            return True
+        log.warning(f"{tool} failed on {image_path}: {res.stderr.strip()}")
+    return False
+
+
+def source_fingerprint(image_path):
+    """
+    图片的指纹；对 ensure_compatible 解码出的 PNG 返回原图的指纹 (即其缓存键)。
+    解码结果被淘汰后重新解码，文件的 mtime / inode 会变，但以此为键的调色板等缓存仍然有效。
+    """
+    path = Path(image_path)
+    if path.parent == DECODED_DIR and path.suffix == ".png" and not path.name.startswith("."):
+        return path.stem
+    return cache.file_fingerprint(image_path)
+
+
+def ensure_compatible(image_path):
+    """
+    返回 matugen / Pillow 可直接读取的图片路径。
+    常见格式原样返回；需要解码的格式返回缓存中的 PNG，解码失败时返回原路径。
+    """
+    if not needs_decode(image_path) or not os.path.exists(image_path):
+        return image_path
+    fingerprint = cache.file_fingerprint(image_path)
+    if not fingerprint:
+        return image_path
+
+    path = DECODED_CACHE.path(fingerprint)
+    if path is not None:
+        return str(path)
+
+    log.info(f"Decoding {image_path} to PNG")
+    tmp = DECODED_CACHE.temp_path()
+    try:
+        if _decode_pillow(image_path, tmp) or _decode_cli(image_path, tmp):
+            path = DECODED_CACHE.adopt(fingerprint, tmp)
+            if path is not None:
+                return str(path)
+        else:
+            log.warning(f"No decoder available for {image_path}")
+    except OSError as e:
+        log.error(f"Failed to decode {image_path}: {e}")
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return image_path
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+基于 ctypes 的最小 inotify 封装 (不依赖第三方库)。
+
+监听的是文件所在目录而不是文件本身：KDE 与本程序都以 rename 方式原子替换文件，
+直接监听文件会在第一次替换后失效。也可以用 add_dir 监听目录中的所有条目。
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 文件写完或被替换
+FILE_CHANGED = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+
+_EVENT = struct.Struct("iIII")
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def is_available():
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class Watcher:
+    """
+    监听若干文件的变化。用法:
+        w = Watcher()
+        w.add_file(path)
+        for path in w.wait():  # 阻塞直到有变化，返回变化的文件路径集合
+            ...
+    """
+
+    def __init__(self):
+        self._libc = _load_libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}  # wd -> 目录
+        self._files = {}  # 目录 -> {文件名}，None 表示目录中的所有条目
+        # select 返回的总次数 (包括被文件名过滤掉的事件)，用于统计唤醒开销
+        self.wakeups = 0
+
+    def _watch(self, directory):
+        if directory in self._files:
+            return
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), FILE_CHANGED | IN_ONLYDIR
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"{os.strerror(err)}: {directory}")
+        self._dirs[wd] = directory
+        self._files[directory] = set()
+
+    def add_file(self, path):
+        """监听文件 (目录不存在时抛出 OSError)"""
+        path = os.path.abspath(os.path.expanduser(str(path)))
+        directory, name = os.path.split(path)
+        self._watch(directory)
+        if self._files[directory] is not None:
+            self._files[directory].add(name)
+
+    def add_dir(self, path):
+        """监听目录中所有条目的创建、删除、改名与写入 (不递归)"""
+        directory = os.path.abspath(os.path.expanduser(str(path)))
+        self._watch(directory)
+        self._files[directory] = None
+
+    def watched_dirs(self):
+        return set(self._files)
+
+    def _read(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # 队列溢出时无法得知具体文件，当作全部变化 (整个目录时返回目录本身)
+                    for directory, names in self._files.items():
+                        if names is None:
+                            changed.add(directory)
+                        else:
+                            changed.update(os.path.join(directory, n) for n in names)
+                    continue
+                if mask & IN_IGNORED:
+                    # 目录被删除或卸载，监听已失效
+                    directory = self._dirs.pop(wd, None)
+                    if directory is not None:
+                        self._files.pop(directory, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                names = self._files.get(directory, ())
+                if names is None or name in names:
+                    changed.add(os.path.join(directory, name))
+
+    def wait(self, timeout=None, settle=0.05):
+        """
+        阻塞等待 (timeout 秒，None 为无限)，返回变化的文件路径集合。
+        收到第一个事件后再等待 settle 秒合并同一次保存产生的多个事件。
+        """
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            self.wakeups += 1
+            if not ready:
+                return set()
+            changed = self._read()
+            while settle:
+                ready, _, _ = select.select([self.fd], [], [], settle)
+                self.wakeups += 1
+                if not ready:
+                    break
+                changed |= self._read()
+            if changed or timeout is not None:
+                return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+服务进程的本地查询接口 (Unix 套接字，位于 $XDG_RUNTIME_DIR)。
+
+协议：每个连接发送一行 JSON 请求 {"cmd": "...", ...}，
+收到一行 JSON 响应 {"ok": true, "result": ...} 或 {"ok": false, "error": "..."}。
+客户端在收到响应前关闭连接表示取消请求。
+"""
+import json
+import os
+import select
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from backend.logger import log
+except ImportError:
+    import logging
+
+    log = logging.getLogger(__name__)
+
+APP_NAME = "MaterialYou-Autothemer"
+SOCKET_PATH = (
+    Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()) / f"{APP_NAME}.sock"
+)
+MAX_REQUEST = 64 * 1024
+# 可取消的请求检查取消事件 / 连接状态的间隔 (秒)
+CANCEL_POLL = 0.05
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST)
+        cancel = threading.Event()
+        done = threading.Event()
+        try:
+            request = json.loads(line)
+            handler = self.server.handlers.get(request.get("cmd"))
+            if handler is None:
+                response = {"ok": False, "error": f"unknown command: {request.get('cmd')}"}
+            else:
+                request["cancel"] = cancel
+                threading.Thread(
+                    target=self._watch_disconnect, args=(cancel, done), daemon=True
+                ).start()
+                response = {"ok": True, "result": handler(request)}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            response = {"ok": False, "error": f"bad request: {e}"}
+        except Exception as e:
+            log.error(f"IPC command failed: {e}")
+            response = {"ok": False, "error": str(e)}
+        finally:
+            done.set()
+        if cancel.is_set():
+            return
+        try:
+            self.wfile.write(json.dumps(response, default=str).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+
+    def _watch_disconnect(self, cancel, done):
+        """客户端在请求完成前关闭连接时设置 cancel"""
+        poller = select.poll()
+        poller.register(self.connection, select.POLLIN | select.POLLHUP)
+        while not done.is_set():
+            if not poller.poll(CANCEL_POLL * 1000):
+                continue
+            try:
+                closed = not self.connection.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                closed = False
+            except OSError:
+                closed = True
+            if closed:
+                cancel.set()
+                return
+            # 请求之后不应再有数据，忽略并继续等待
+            done.wait(CANCEL_POLL)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Server:
+    """
+    handlers: {命令名: handler(request: dict) -> 可 JSON 序列化的结果}
+    request["cancel"] 是 threading.Event，客户端提前断开连接时被设置
+    """
+
+    def __init__(self, handlers, path=SOCKET_PATH):
+        self.path = Path(path)
+        self.handlers = dict(handlers)
+        self._server = None
+
+    def start(self):
+        """在后台线程中开始监听，失败时记录日志并返回 False"""
+        try:
+            # 服务由锁文件保证单实例，残留的套接字文件可以直接删除
+            self.path.unlink(missing_ok=True)
+            old_umask = os.umask(0o177)
+            try:
+                self._server = _Server(str(self.path), _Handler)
+            finally:
+                os.umask(old_umask)
+        except OSError as e:
+            log.warning(f"IPC socket unavailable: {e}")
+            return False
+        self._server.handlers = self.handlers
+        threading.Thread(
+            target=self._server.serve_forever, name="ipc", daemon=True
+        ).start()
+        log.info(f"IPC listening on {self.path}")
+        return True
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self.path.unlink(missing_ok=True)
+
+
+def _read_response(sock, timeout, cancel):
+    """读取一行响应；cancel 被设置时关闭连接 (服务端随之取消) 并抛出 InterruptedError"""
+    if cancel is None:
+        with sock.makefile("rb") as f:
+            return f.readline()
+    deadline = time.monotonic() + timeout
+    sock.settimeout(CANCEL_POLL)
+    chunks = []
+    while not chunks or not chunks[-1].endswith(b"\n"):
+        if cancel.is_set():
+            raise InterruptedError("request cancelled")
+        try:
+            chunk = sock.recv(65536)
+        except TimeoutError:
+            if time.monotonic() >= deadline:
+                raise
+            continue
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def request(cmd, timeout=2.0, socket_path=SOCKET_PATH, cancel=None, **args):
+    """
+    向服务发送命令并返回 result。
+    服务未运行时抛出 OSError，服务返回错误时抛出 RuntimeError。
+    cancel (threading.Event) 被设置后放弃等待并抛出 InterruptedError。
+    """
+    payload = dict(args, cmd=cmd)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        line = _read_response(sock, timeout, cancel)
+    if not line:
+        raise OSError("empty response from service")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error", "unknown error"))
+    return response.get("result")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+[KDE] 配色方案写入。
+
+渲染好的 kcolorscheme 文本只解析一次，据此：
+- 生成带 General/Type 的 MaterialYou.colors 与 MaterialYouAlt.colors
+- 把配色各分组合并进 ~/.config/kdeglobals：逐行就地修改变化的键，
+  其余内容 (注释、顺序、无关分组) 原样保留
+所有文件都通过原子替换写入。
+"""
+from pathlib import Path
+
+try:
+    from backend import cache
+    from backend.logger import log
+except ImportError:
+    import cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+COLOR_SCHEMES_DIR = Path.home() / ".local/share/color-schemes"
+SCHEME_FILE = COLOR_SCHEMES_DIR / "MaterialYou.colors"
+ALT_SCHEME_FILE = COLOR_SCHEMES_DIR / "MaterialYouAlt.colors"
+KDEGLOBALS = Path.home() / ".config/kdeglobals"
+
+# 旧版 config.toml 中由本模块取代的 post_hook
+LEGACY_HOOK = "merge_kde_colors.py"
+
+
+def _section_name(line):
+    # KDE 的分组名可能是多级的，例如 [Colors:Header][Inactive]
+    stripped = line.strip()
+    if stripped.startswith("[") and stripped.endswith("]"):
+        return stripped
+    return None
+
+
+def parse(text):
+    """解析为 [(section, [(key, value), ...]), ...]，保留顺序与大小写"""
+    sections = []
+    current = None
+    for line in text.splitlines():
+        header = _section_name(line)
+        if header:
+            current = (header[1:-1], [])
+            sections.append(current)
+            continue
+        if current is None or "=" not in line or line.lstrip().startswith(("#", ";")):
+            continue
+        key, _, value = line.partition("=")
+        current[1].append((key.strip(), value.strip()))
+    return sections
+
+
+def _set(sections, section, key, value):
+    for name, items in sections:
+        if name != section:
+            continue
+        for i, (k, _) in enumerate(items):
+            if k == key:
+                items[i] = (key, value)
+                return
+        items.append((key, value))
+        return
+    sections.append((section, [(key, value)]))
+
+
+def dump(sections):
+    blocks = []
+    for name, items in sections:
+        lines = [f"[{name}]"] + [f"{k}={v}" for k, v in items]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n"
+
+
+def patch_ini(text, sections):
+    """
+    把 sections 中的键合并进 INI 文本，只改动值不同的行。
+    返回 (新文本, 修改的键数)。
+    """
+    updates = {name: dict(items) for name, items in sections}
+    lines = text.splitlines()
+    out = []
+    changed = 0
+    current = None
+    seen = {}
+
+    def flush(section):
+        # 分组结束时补上缺失的键，插在尾部空行之前
+        nonlocal changed
+        if section not in updates:
+            return
+        missing = [(k, v) for k, v in updates[section].items() if k not in seen[section]]
+        if not missing:
+            return
+        insert_at = len(out)
+        while insert_at > 0 and not out[insert_at - 1].strip():
+            insert_at -= 1
+        out[insert_at:insert_at] = [f"{k}={v}" for k, v in missing]
+        changed += len(missing)
+
+    for line in lines:
+        header = _section_name(line)
+        if header:
+            if current is not None:
+                flush(current)
+            current = header[1:-1]
+            seen.setdefault(current, set())
+            out.append(line)
+            continue
+        if current in updates and "=" in line and not line.lstrip().startswith(("#", ";")):
+            key = line.partition("=")[0].strip()
+            wanted = updates[current].get(key)
+            seen[current].add(key)
+            if wanted is not None and line.partition("=")[2].strip() != wanted:
+                line = f"{key}={wanted}"
+                changed += 1
+        out.append(line)
+    if current is not None:
+        flush(current)
+
+    for name, items in sections:
+        if name in seen:
+            continue
+        if out and out[-1].strip():
+            out.append("")
+        out.append(f"[{name}]")
+        out.extend(f"{k}={v}" for k, v in items)
+        changed += len(items)
+
+    return "\n".join(out) + "\n", changed
+
+
+def finalize(text, mode):
+    """为渲染好的配色补上 General/Type，返回 MaterialYou.colors 的最终内容"""
+    sections = parse(text)
+    _set(sections, "General", "Type", "Dark" if mode == "dark" else "Light")
+    return dump(sections)
+
+
+def write_companions(scheme_text, kdeglobals=KDEGLOBALS):
+    """由 MaterialYou.colors 的内容生成 MaterialYouAlt.colors 并更新 kdeglobals"""
+    sections = parse(scheme_text)
+
+    alt = [(name, list(items)) for name, items in sections]
+    _set(alt, "General", "ColorScheme", "MaterialYouAlt")
+    _set(alt, "General", "Name", "MaterialYouAlt")
+    alt_text = dump(alt)
+    if cache.hash_file(ALT_SCHEME_FILE) != cache.hash_bytes(alt_text):
+        cache.atomic_write(ALT_SCHEME_FILE, alt_text)
+
+    # kdeglobals 中不需要配色方案自身的 Type
+    merged = [
+        (name, [(k, v) for k, v in items if not (name == "General" and k == "Type")])
+        for name, items in sections
+    ]
+    try:
+        with open(kdeglobals, "r", encoding="utf-8") as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = ""
+    patched, changed = patch_ini(current, merged)
+    if changed:
+        cache.atomic_write(kdeglobals, patched)
+    log.info(f"Updated KDE color schemes ({changed} kdeglobals keys changed)")
+
+
+def update_from_file(mode, path=SCHEME_FILE):
+    """matugen 直接写出 MaterialYou.colors 时的兜底路径"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return
+    try:
+        final = finalize(text, mode)
+        if final != text:
+            cache.atomic_write(path, final)
+        write_companions(final)
+    except OSError as e:
+        log.error(f"Failed to update KDE color schemes: {e}")
+
+
+def is_legacy_hook(command):
+    return bool(command) and LEGACY_HOOK in command
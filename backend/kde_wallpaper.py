@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+[KDE] 动态壁纸包解析。
+
+壁纸包的 contents/images(_dark) 中通常有同一张图的多种分辨率。
+这里为每个目录建立索引 (目录 mtime 不变就不再重新列举)，记录每个变体的分辨率，
+并选出不小于目标尺寸的最小变体，避免为了取色去解码 5K 图片。
+
+当前壁纸直接从 plasma-org.kde.plasma.desktop-appletsrc 读取 (按 mtime 缓存)，
+不需要通过 DBus 让 plasmashell 执行脚本。
+"""
+import os
+import re
+import struct
+from pathlib import Path
+
+try:
+    from backend import image_cache
+except ImportError:
+    import image_cache
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".svg") + image_cache.NEEDS_DECODE
+# 例如 1920x1080.png、wallpaper-3840x2160.jpg
+_SIZE_RE = re.compile(r"(\d{3,5})\s*[x×]\s*(\d{3,5})")
+
+APPLETSRC = Path.home() / ".config/plasma-org.kde.plasma.desktop-appletsrc"
+_CONTAINMENT_RE = re.compile(r"^\[Containments\]\[(\d+)\](.*)$")
+
+# 目录路径 -> (mtime_ns, [(width, height, path), ...])
+_INDEX = {}
+# ((mtime_ns, size), 壁纸路径)
+_APPLETSRC_CACHE = None
+
+
+def _png_size(head):
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    return None
+
+
+def _webp_size(head):
+    if head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        w = int.from_bytes(head[24:27], "little") + 1
+        h = int.from_bytes(head[27:30], "little") + 1
+        return w, h
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    return None
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        if kind in (0xD8, 0x01) or 0xD0 <= kind <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        # SOF0..SOF15 (除去 DHT/JPG/DAC)
+        if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+            _, h, w = struct.unpack(">BHH", f.read(5))
+            return w, h
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path):
+    """只读取文件头获取图片尺寸 (PNG / JPEG / WebP)，无法识别时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            size = _png_size(head) or _webp_size(head)
+            if size is None and head[:2] == b"\xff\xd8":
+                size = _jpeg_size(f)
+            return size
+    except (OSError, struct.error):
+        return None
+
+
+def _variant_size(dirpath, name):
+    match = _SIZE_RE.search(name)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return read_image_size(os.path.join(dirpath, name)) or (0, 0)
+
+
+def list_variants(dirpath):
+    """目录中的图片及其分辨率，按目录 mtime 缓存；目录不存在时返回 []"""
+    try:
+        mtime = os.stat(dirpath).st_mtime_ns
+    except OSError:
+        _INDEX.pop(dirpath, None)
+        return []
+    cached = _INDEX.get(dirpath)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    variants = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.name.lower().endswith(IMAGE_EXTS) and entry.is_file():
+                    w, h = _variant_size(dirpath, entry.name)
+                    variants.append((w, h, entry.path))
+    except OSError:
+        return []
+    variants.sort(key=lambda v: v[2])
+    _INDEX[dirpath] = (mtime, variants)
+    return variants
+
+
+def pick_variant(variants, target):
+    """
+    选择两边都不小于 target (w, h) 的最小变体；都不够大时取最大的。
+    分辨率未知的变体只在没有其它选择时使用。
+    """
+    known = [v for v in variants if v[0] and v[1]]
+    if not known:
+        return variants[0][2] if variants else None
+    tw, th = target
+    large_enough = [v for v in known if v[0] >= tw and v[1] >= th]
+    if large_enough:
+        return min(large_enough, key=lambda v: (v[0] * v[1], v[2]))[2]
+    return max(known, key=lambda v: (v[0] * v[1], v[2]))[2]
+
+
+def resolve(path, mode="dark", target=(256, 256)):
+    """解析壁纸包目录为具体图片路径，不是目录时原样返回"""
+    if not path or not os.path.isdir(path):
+        return path
+
+    search_paths = []
+    if mode == "dark":
+        search_paths.append(os.path.join(path, "contents", "images_dark"))
+    search_paths.append(os.path.join(path, "contents", "images"))
+    search_paths.append(path)
+
+    for p in search_paths:
+        variants = list_variants(p)
+        if variants:
+            return pick_variant(variants, target)
+    return path
+
+
+def _parse_appletsrc(text):
+    """返回桌面容器的 org.kde.image 壁纸，优先主屏幕 (lastScreen=0)"""
+    containments = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            match = _CONTAINMENT_RE.match(line)
+            if not match:
+                current = None
+                continue
+            entry = containments.setdefault(int(match.group(1)), {})
+            group = match.group(2)
+            if group == "":
+                current = entry
+            elif group == "[Wallpaper][org.kde.image][General]":
+                current = entry.setdefault("wallpaper", {})
+            else:
+                current = None
+            continue
+        if current is not None and "=" in line:
+            key, _, value = line.partition("=")
+            current[key.strip()] = value.strip()
+
+    candidates = []
+    for cid, entry in containments.items():
+        image = entry.get("wallpaper", {}).get("Image")
+        # 面板等容器没有 activityId
+        if not image or not entry.get("activityId"):
+            continue
+        try:
+            screen = int(entry.get("lastScreen", "0"))
+        except ValueError:
+            screen = 0
+        candidates.append((screen < 0, screen, cid, image))
+    if not candidates:
+        return None
+    image = min(candidates)[3]
+    return image[len("file://"):] if image.startswith("file://") else image
+
+
+def read_appletsrc_wallpaper(path=APPLETSRC):
+    """
+    从 appletsrc 读取当前壁纸 (壁纸包目录或图片路径)。
+    文件不存在或没有找到 org.kde.image 壁纸时返回 None。
+    """
+    global _APPLETSRC_CACHE
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _APPLETSRC_CACHE and _APPLETSRC_CACHE[0] == stamp:
+        return _APPLETSRC_CACHE[1]
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            image = _parse_appletsrc(f.read())
+    except OSError:
+        return None
+    _APPLETSRC_CACHE = (stamp, image)
+    return image
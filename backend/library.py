@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+壁纸库扫描 (后台线程)。
+
+- 用 os.scandir 遍历文件夹 (可选递归)，结果分批交给回调，界面不必等待全部扫描完成
+- 索引 (路径、大小、mtime、分辨率) 保存在状态数据库中。再次打开时，
+  mtime 未变的目录只需一次 stat，其中的文件与子目录直接取自索引
+- 首次扫描完成后用 inotify 监听所有目录，有增删时只重新扫描对应的目录
+"""
+import os
+import threading
+import time
+
+try:
+    from backend import inotify, kde_wallpaper, state, utils
+    from backend.logger import log
+except ImportError:
+    import inotify
+    import kde_wallpaper
+    import logging
+    import state
+    import utils
+
+    log = logging.getLogger(__name__)
+
+
+class LibraryScanner:
+    BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.1  # 秒
+
+    def __init__(
+        self, root, recursive=False, on_added=None, on_removed=None, on_done=None, watch=True
+    ):
+        """
+        on_added(paths) / on_removed(paths) 在扫描线程中调用，
+        首次扫描时全部文件都以 on_added 分批给出；on_done(count) 在首次扫描完成后调用。
+        """
+        self.root = os.path.abspath(os.path.expanduser(str(root)))
+        self.recursive = recursive
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_done = on_done
+        self.watch = watch
+        self._files = {}  # 目录 -> {文件路径: (size, mtime_ns, width, height)}
+        self._dirs = {}  # 目录 -> (mtime_ns, [子目录路径])
+        self._pending = []
+        self._last_flush = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="library", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def paths(self):
+        return [p for files in self._files.values() for p in files]
+
+    def _run(self):
+        try:
+            start = time.monotonic()
+            rescanned = self._scan()
+            if self._stop.is_set():
+                return
+            log.info(
+                "Scanned %s: %d images in %d folders (%d rescanned) in %.2fs",
+                self.root, len(self.paths), len(self._dirs), rescanned,
+                time.monotonic() - start,
+            )
+            if self.on_done:
+                self.on_done(len(self.paths))
+            if self.watch:
+                self._watch_loop()
+        except Exception as e:
+            log.error(f"Library scan failed for {self.root}: {e}")
+
+    # --- 扫描 ---
+
+    def _emit_added(self, paths, force=False):
+        self._pending.extend(paths)
+        now = time.monotonic()
+        if self._pending and (
+            force
+            or len(self._pending) >= self.BATCH_SIZE
+            or now - self._last_flush >= self.BATCH_INTERVAL
+        ):
+            batch, self._pending = self._pending, []
+            self._last_flush = now
+            if self.on_added:
+                self.on_added(batch)
+
+    def _emit_removed(self, paths):
+        if paths and self.on_removed:
+            self.on_removed(list(paths))
+
+    def _list_dir(self, dirpath, old_files):
+        """返回 (文件索引, 子目录列表)；文件大小与 mtime 未变时沿用旧的分辨率"""
+        files = {}
+        subdirs = []
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.path)
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in utils.WALLPAPER_EXTS:
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                old = old_files.get(entry.path)
+                if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                    files[entry.path] = old
+                else:
+                    size = kde_wallpaper.read_image_size(entry.path) or (None, None)
+                    files[entry.path] = (st.st_size, st.st_mtime_ns, *size)
+        subdirs.sort()
+        return files, subdirs
+
+    def _scan(self):
+        """首次扫描：以数据库中的索引为基础，只重新列举 mtime 变化的目录"""
+        index_dirs = state.library_dirs(self.root)
+        index_files = state.library_files(self.root)
+        changed = []
+        stack = [self.root]
+        while stack and not self._stop.is_set():
+            dirpath = stack.pop()
+            if dirpath in self._dirs:
+                continue
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            old = index_dirs.get(dirpath)
+            if old and old[0] == mtime:
+                files, subdirs = index_files.get(dirpath, {}), old[1]
+            else:
+                try:
+                    files, subdirs = self._list_dir(dirpath, index_files.get(dirpath, {}))
+                except OSError as e:
+                    log.warning(f"Cannot scan {dirpath}: {e}")
+                    continue
+                changed.append((dirpath, mtime, subdirs, files))
+            self._files[dirpath] = files
+            self._dirs[dirpath] = (mtime, subdirs)
+            self._emit_added(files)
+            if self.recursive:
+                stack.extend(reversed(subdirs))
+        self._emit_added((), force=True)
+        if self._stop.is_set():
+            return len(changed)
+
+        state.save_library_dirs(changed)
+        if self.recursive:
+            # 递归扫描时没有遇到的目录已被删除
+            gone = [d for d in index_dirs if d not in self._dirs]
+            state.remove_library_dirs(gone)
+        return len(changed)
+
+    # --- 监听 ---
+
+    def _watch_loop(self):
+        if not inotify.is_available():
+            return
+        try:
+            watcher = inotify.Watcher()
+        except OSError as e:
+            log.warning(f"Cannot watch {self.root}: {e}")
+            return
+        try:
+            for dirpath in list(self._dirs):
+                self._add_watch(watcher, dirpath)
+            while not self._stop.is_set():
+                changed = watcher.wait(timeout=0.5, settle=0.2)
+                if changed and not self._stop.is_set():
+                    # 条目所在的目录；队列溢出时给出的是目录本身
+                    dirs = {os.path.dirname(p) for p in changed}
+                    dirs.update(p for p in changed if p in self._dirs)
+                    self._rescan(dirs, watcher)
+        finally:
+            watcher.close()
+
+    def _add_watch(self, watcher, dirpath):
+        try:
+            watcher.add_dir(dirpath)
+        except OSError as e:
+            # 例如超出 fs.inotify.max_user_watches
+            log.warning(f"Cannot watch {dirpath}: {e}")
+
+    def _forget(self, dirpath):
+        """从索引中移除目录及其所有子目录，返回被移除的文件"""
+        removed = []
+        stack = [dirpath]
+        gone = []
+        while stack:
+            d = stack.pop()
+            entry = self._dirs.pop(d, None)
+            if entry is None:
+                continue
+            gone.append(d)
+            removed.extend(self._files.pop(d, {}))
+            stack.extend(entry[1])
+        state.remove_library_dirs(gone)
+        return removed
+
+    def _rescan(self, dirs, watcher):
+        added, removed, changed = [], [], []
+        stack = [d for d in dirs if d in self._dirs]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+                files, subdirs = self._list_dir(dirpath, self._files.get(dirpath, {}))
+            except OSError:
+                removed.extend(self._forget(dirpath))
+                continue
+            old_files = self._files.get(dirpath, {})
+            old_subdirs = self._dirs.get(dirpath, (0, []))[1]
+            added.extend(p for p in files if p not in old_files)
+            removed.extend(p for p in old_files if p not in files)
+            for sub in old_subdirs:
+                if sub not in subdirs:
+                    removed.extend(self._forget(sub))
+            self._files[dirpath] = files
+            self._dirs[dirpath] = (mtime, subdirs)
+            changed.append((dirpath, mtime, subdirs, files))
+            if self.recursive:
+                for sub in subdirs:
+                    if sub not in self._dirs:
+                        # 新目录：登记后扫描其内容
+                        self._dirs[sub] = (0, [])
+                        self._add_watch(watcher, sub)
+                        stack.append(sub)
+        state.save_library_dirs(changed)
+        if removed:
+            log.debug("Library: %d removed", len(removed))
+            self._emit_removed(removed)
+        if added:
+            log.debug("Library: %d added", len(added))
+            self._emit_added(added, force=True)
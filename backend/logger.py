@@ -1,18 +1,91 @@
+import atexit
+import json
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 # Define constants for log paths
 APP_NAME = "MaterialYou-Autothemer"
 LOG_DIR = Path.home() / ".cache" / APP_NAME / "logs"
 LOG_FILE = LOG_DIR / "backend.log"
+JSON_LOG_FILE = LOG_DIR / "backend.jsonl"
+
+# MATERIALYOU_LOG_FORMAT=json: the log file is written as JSON lines
+LOG_FORMAT = os.environ.get("MATERIALYOU_LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.environ.get("MATERIALYOU_LOG_LEVEL", "DEBUG").upper()
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields passed via `extra=` are kept."""
+
+    FIELDS = ("stage", "duration_ms", "stages", "generation", "count")
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "module": record.module,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops repeats of the same warning/error (same call site and message) for
+    `interval` seconds, then reports how many were suppressed.
+    """
+
+    def __init__(self, interval=60.0, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        key = (record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > 1024:
+                self._seen = {
+                    k: v for k, v in self._seen.items() if now - v[0] < self.interval
+                }
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed} similar messages)"
+            record.args = None
+        return True
 
 
 def setup_logger(name=APP_NAME):
     """
-    Configures and returns a logger instance with console and file handlers.
+    Configures and returns a logger instance.
+    Records are put on a queue and written to the console / file by a
+    background QueueListener, so callers never block on disk I/O.
     """
+    global _listener
+
     # Ensure log directory exists
     try:
         LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -20,7 +93,7 @@ def setup_logger(name=APP_NAME):
         print(f"Failed to create log directory: {e}", file=sys.stderr)
 
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.DEBUG))
 
     # Prevent adding handlers multiple times if setup_logger is called repeatedly
     if logger.hasHandlers():
@@ -32,24 +105,40 @@ def setup_logger(name=APP_NAME):
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    handlers = []
+
     # Console Handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # File Handler (Rotating)
     # Max size 5MB, keep 3 backups
     try:
+        json_lines = LOG_FORMAT == "json"
         file_handler = RotatingFileHandler(
-            LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+            JSON_LOG_FILE if json_lines else LOG_FILE,
+            maxBytes=5 * 1024 * 1024,
+            backupCount=3,
+            encoding="utf-8",
         )
         file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        file_handler.setFormatter(JsonFormatter() if json_lines else formatter)
+        handlers.append(file_handler)
     except Exception as e:
         print(f"Failed to setup file logging: {e}", file=sys.stderr)
 
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush queued records on exit
+    atexit.register(_listener.stop)
+
     return logger
 
 
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+生成流程各阶段的耗时统计。
+
+代码中用 span("阶段名") 包住耗时操作，每个阶段保留最近 WINDOW 个样本，
+查询时计算 p50 / p95 / max。服务进程通过 ipc 套接字提供查询
+(MaterialYou-Service --stats)；服务未运行时改用 state 数据库中记录的历史运行。
+
+MATERIALYOU_LATENCY_BUDGET_MS: 一次完整换色的耗时预算 (毫秒)，超出时记录警告。
+"""
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from backend.logger import log
+except ImportError:
+    import logging
+
+    log = logging.getLogger(__name__)
+
+WINDOW = 500
+# 整个流程的总耗时记录在这个名字下
+PIPELINE = "pipeline"
+
+try:
+    BUDGET_MS = float(os.environ.get("MATERIALYOU_LATENCY_BUDGET_MS", "0"))
+except ValueError:
+    BUDGET_MS = 0.0
+
+_lock = threading.Lock()
+_samples = {}  # 阶段名 -> deque[毫秒]
+_last = {}  # 最近一次完成的 generation 的各阶段耗时
+# generation: 当前线程所属的 Generation；prefix: 后台任务的 span 名前缀
+_local = threading.local()
+
+
+class Generation:
+    """一次更新中记录到的所有 span (同名累加)"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = {}
+        self.total_ms = 0.0
+
+    def slowest(self):
+        stages = {k: v for k, v in self.spans.items() if k != PIPELINE}
+        return max(stages.items(), key=lambda kv: kv[1]) if stages else (None, 0.0)
+
+
+def record(name, duration_ms):
+    duration_ms = round(duration_ms, 1)
+    prefix = getattr(_local, "prefix", None)
+    if prefix:
+        name = prefix + name
+    gen = None if prefix else getattr(_local, "generation", None)
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=WINDOW)
+        samples.append(duration_ms)
+        if gen is not None:
+            gen.spans[name] = round(gen.spans.get(name, 0.0) + duration_ms, 1)
+
+
+@contextlib.contextmanager
+def span(name):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, (time.monotonic() - start) * 1000)
+
+
+@contextlib.contextmanager
+def background(prefix):
+    """当前线程中的 span 加上 prefix 单独统计，不计入同时进行的 generation"""
+    old = getattr(_local, "prefix", None)
+    _local.prefix = prefix
+    try:
+        yield
+    finally:
+        _local.prefix = old
+
+
+def current():
+    """当前线程所属的 Generation，不在 generation() 中时返回 None"""
+    return getattr(_local, "generation", None)
+
+
+@contextlib.contextmanager
+def attach(gen):
+    """
+    把当前线程中记录的 span 归入 gen (例如在主循环中替调度线程完成的工作)。
+    其它线程 (IPC 预览等) 记录的 span 不会混入正在进行的 generation。
+    """
+    old = getattr(_local, "generation", None)
+    _local.generation = gen
+    try:
+        yield gen
+    finally:
+        _local.generation = old
+
+
+@contextlib.contextmanager
+def generation():
+    """收集本次更新中在当前线程 (以及 attach 到它的线程) 记录的所有 span"""
+    global _last
+    gen = Generation()
+    start = time.monotonic()
+    try:
+        with attach(gen):
+            yield gen
+    finally:
+        gen.total_ms = round((time.monotonic() - start) * 1000, 1)
+        with _lock:
+            _last = dict(gen.spans)
+
+
+def check_budget(gen):
+    """总耗时超出预算时记录警告，返回是否在预算内"""
+    if not BUDGET_MS or gen.total_ms <= BUDGET_MS:
+        return True
+    stage, ms = gen.slowest()
+    log.warning(
+        "Recolor took %.0f ms, over the %.0f ms budget (slowest stage: %s %.0f ms)",
+        gen.total_ms, BUDGET_MS, stage, ms,
+        extra={"stage": PIPELINE, "duration_ms": gen.total_ms, "stages": gen.spans},
+    )
+    return False
+
+
+def percentile(sorted_values, q):
+    """nearest-rank 百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100.0 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(samples):
+    """{阶段: [毫秒]} -> {阶段: {count, p50, p95, max}}"""
+    stats = {}
+    for name, values in samples.items():
+        values = sorted(values)
+        if not values:
+            continue
+        stats[name] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": values[-1],
+        }
+    return stats
+
+
+def snapshot():
+    with _lock:
+        samples = {name: list(values) for name, values in _samples.items()}
+        last = dict(_last)
+    return {
+        "source": "service",
+        "window": WINDOW,
+        "budget_ms": BUDGET_MS,
+        "stages": summarize(samples),
+        "last": last,
+    }
+
+
+def from_runs(runs):
+    """用 state.recent_runs() 的记录生成与 snapshot() 相同结构的统计"""
+    samples = {}
+    for run in runs:
+        samples.setdefault(PIPELINE, []).append(run["total_ms"])
+        for name, ms in run["stages"].items():
+            if name != PIPELINE:
+                samples.setdefault(name, []).append(ms)
+    return {
+        "source": "history",
+        "window": len(runs),
+        "budget_ms": BUDGET_MS,
+        "stages": summarize(samples),
+        "last": runs[0]["stages"] if runs else {},
+    }
+
+
+def format_stats(stats):
+    """以表格形式输出统计，总耗时在最前，其余按 p95 从大到小排列"""
+    stages = stats.get("stages", {})
+    if not stages:
+        return "No timings recorded yet."
+    order = sorted(stages, key=lambda n: (n != PIPELINE, -stages[n]["p95"], n))
+    width = max(len(n) for n in order)
+    lines = [
+        f"{'stage':<{width}}  {'count':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'max ms':>9}"
+    ]
+    for name in order:
+        s = stages[name]
+        lines.append(
+            f"{name:<{width}}  {s['count']:>6}  {s['p50']:>9.1f}  "
+            f"{s['p95']:>9.1f}  {s['max']:>9.1f}"
+        )
+    budget = stats.get("budget_ms")
+    if budget:
+        p95 = stages.get(PIPELINE, {}).get("p95", 0.0)
+        verdict = "within" if p95 <= budget else "OVER"
+        lines.append(f"\nBudget: {budget:.0f} ms, pipeline p95 {p95:.1f} ms ({verdict})")
+    return "\n".join(lines)
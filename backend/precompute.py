@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+批量预计算整个壁纸文件夹的调色板，结果写入调色板缓存：
+    MaterialYou-Service precompute <folder> [--modes dark,light] [--flavors all]
+
+- 每张图片一个任务，在进程池中并行执行 (默认使用全部 CPU 核心)，
+  任务内依次计算各风格：第一个风格从图片取色，之后的风格复用缓存的源色
+- 调色板 JSON 同时包含深浅两套颜色，一种模式命中缓存即可满足另一种模式
+- 已缓存的组合直接跳过，重复运行只计算新增或修改过的图片
+"""
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from backend import hct, utils
+    from backend.logger import log
+except ImportError:
+    import hct
+    import logging
+    import utils
+
+    log = logging.getLogger(__name__)
+
+MODES = ("dark", "light")
+FLAVORS = hct.SCHEME_VARIANTS
+
+
+def parse_list(value, choices, name):
+    """逗号分隔的列表，"all" 表示全部；含有未知项时抛出 ValueError"""
+    if value.strip() == "all":
+        return list(choices)
+    items = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [v for v in items if v not in choices]
+    if unknown or not items:
+        raise ValueError(
+            f"invalid {name}: {', '.join(unknown) or value!r} "
+            f"(choose from {', '.join(choices)} or all)"
+        )
+    return list(dict.fromkeys(items))
+
+
+def find_images(folder, recursive=False):
+    if not recursive:
+        return utils.list_wallpapers(folder)
+    images = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        images.extend(
+            os.path.join(dirpath, f)
+            for f in filenames
+            if os.path.splitext(f)[1].lower() in utils.WALLPAPER_EXTS
+        )
+    return sorted(images)
+
+
+def _precompute_image(image, combos):
+    """在工作进程中执行，返回 (已计算, 已缓存, 失败) 数量"""
+    computed = cached = failed = 0
+    for mode, flavor in combos:
+        try:
+            # 与应用时相同的图片 (解码后的 PNG、壁纸包变体)，预计算的正是引擎会读取的缓存键
+            wall = utils.wallpaper_for_apply(image, mode)
+            if utils.get_cached_palette(wall, mode, flavor) is not None:
+                cached += 1
+            elif utils.run_matugen(wall, mode, flavor, dry_run=True):
+                computed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            log.error(f"Precompute failed for {image} ({mode}, {flavor}): {e}")
+            failed += 1
+    return computed, cached, failed
+
+
+class _Progress:
+    """进度输出到 stderr：终端中原地刷新，否则每秒最多输出一行"""
+
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.tty = stream.isatty()
+        self.start = time.monotonic()
+        self._last = 0.0
+
+    def update(self, done, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < (0.1 if self.tty else 1.0):
+            return
+        self._last = now
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else 0.0
+        line = (
+            f"[{done:>{len(str(self.total))}}/{self.total}] "
+            f"{100.0 * done / max(self.total, 1):5.1f}%  {rate:6.1f} img/s  eta {eta:4.0f}s"
+        )
+        if self.tty:
+            self.stream.write("\r" + line + ("\n" if done == self.total else ""))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+
+def precompute(folder, modes, flavors, workers=None, recursive=False, progress=True):
+    """预计算 folder 中所有壁纸的调色板，返回统计信息 dict"""
+    utils.init_resources()
+    images = find_images(folder, recursive)
+    combos = [(mode, flavor) for flavor in flavors for mode in modes]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(images) or 1))
+    totals = {"computed": 0, "cached": 0, "failed": 0}
+
+    # 每张图片每个风格一条调色板，另加一条源色
+    needed = len(images) * (len(flavors) + 1)
+    if needed > utils.PALETTE_CACHE.max_entries:
+        log.warning(
+            f"{needed} palettes exceed the cache capacity "
+            f"({utils.PALETTE_CACHE.max_entries}); older entries will be evicted."
+        )
+
+    start = time.monotonic()
+    bar = _Progress(len(images)) if progress and images else None
+    if images:
+        # 服务进程中已有日志线程，fork 不安全
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {pool.submit(_precompute_image, image, combos): image for image in images}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    computed, cached, failed = future.result()
+                except Exception as e:
+                    log.error(f"Precompute worker failed for {futures[future]}: {e}")
+                    computed, cached, failed = 0, 0, len(combos)
+                totals["computed"] += computed
+                totals["cached"] += cached
+                totals["failed"] += failed
+                if bar:
+                    bar.update(done, force=done == len(images))
+
+    elapsed = time.monotonic() - start
+    return dict(
+        totals,
+        images=len(images),
+        modes=list(modes),
+        flavors=list(flavors),
+        workers=workers,
+        elapsed_s=round(elapsed, 3),
+        images_per_s=round(len(images) / elapsed, 2) if elapsed > 0 else 0.0,
+        palettes_per_s=round(totals["computed"] / elapsed, 2) if elapsed > 0 else 0.0,
+    )
+
+
+def format_summary(stats):
+    return "\n".join(
+        (
+            f"Precomputed {stats['images']} images "
+            f"({len(stats['modes'])} modes x {len(stats['flavors'])} flavors) "
+            f"in {stats['elapsed_s']:.1f}s with {stats['workers']} workers",
+            f"  palettes computed: {stats['computed']}, already cached: {stats['cached']}, "
+            f"failed: {stats['failed']}",
+            f"  throughput: {stats['images_per_s']:.1f} images/s, "
+            f"{stats['palettes_per_s']:.1f} palettes/s",
+        )
+    )
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+GUI 预览任务池 (不依赖 Qt)。
+
+- 最新优先：每次 request() 得到一个递增序号，只有最新的请求会收到结果
+- 协作式取消：不再需要的任务设置 cancel 事件，compute 负责尽快返回并结束子进程
+- 预取：选中图片相邻的壁纸以低优先级预先计算，结果保存在内存中，
+  方向键浏览时直接命中；预取任务最多占用 workers - 1 个线程，始终留一个给当前选择
+"""
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from backend.logger import log
+except ImportError:
+    import logging
+
+    log = logging.getLogger(__name__)
+
+FOREGROUND = 0
+
+
+class _Job:
+    __slots__ = ("key", "priority", "order", "seq", "state", "cancel")
+
+    def __init__(self, key, priority, order, seq=None):
+        self.key = key
+        self.priority = priority
+        self.order = order
+        self.seq = seq  # 需要把结果交付给的请求序号，预取任务为 None
+        self.state = "queued"  # queued / running
+        self.cancel = threading.Event()
+
+
+class PreviewPool:
+    def __init__(self, compute, deliver, workers=2, memo_size=128):
+        """
+        compute(path, mode, flavor, cancel) -> 调色板 JSON 或 None，在工作线程中调用
+        deliver(seq, result) 在工作线程 (或命中缓存时在调用 request 的线程) 中调用
+        """
+        self.compute = compute
+        self.deliver = deliver
+        self.workers = max(2, workers)
+        self.memo_size = memo_size
+        self.latest = 0
+        self._memo = OrderedDict()
+        self._jobs = {}  # key -> _Job
+        self._running_prefetch = 0
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"preview-{i}", daemon=True).start()
+
+    @staticmethod
+    def _key(path, mode, flavor):
+        # 文件被替换后不再命中旧结果
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        return (path, mode, flavor, stamp)
+
+    def request(self, path, mode, flavor, neighbors=()):
+        """
+        请求 path 的预览，并预取 neighbors (按优先级排列)。返回本次请求的序号。
+        不在本次请求与预取范围内的任务都会被取消。
+        """
+        key = self._key(path, mode, flavor)
+        wanted = [self._key(p, mode, flavor) for p in neighbors if p != path]
+        with self._cond:
+            self.latest += 1
+            seq = self.latest
+            keep = {key, *wanted}
+            for job_key, job in list(self._jobs.items()):
+                if job_key not in keep:
+                    job.cancel.set()
+                    del self._jobs[job_key]
+                elif job.seq is not None and job_key != key:
+                    # 之前选中的图片仍在预取范围内：降级为预取，继续计算
+                    job.seq = None
+                    self._set_priority(job, 1 + wanted.index(job_key))
+
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+            elif key in self._jobs:
+                job = self._jobs[key]
+                job.seq = seq
+                self._set_priority(job, FOREGROUND)
+            else:
+                self._jobs[key] = _Job(key, FOREGROUND, next(self._order), seq)
+
+            for distance, job_key in enumerate(wanted, 1):
+                if job_key not in self._memo and job_key not in self._jobs:
+                    self._jobs[job_key] = _Job(job_key, distance, next(self._order))
+            self._cond.notify_all()
+
+        if cached is not None:
+            self.deliver(seq, cached)
+        return seq
+
+    def _set_priority(self, job, priority):
+        """调整优先级；正在运行的任务在前台与预取之间切换时同步更新预取计数"""
+        if job.state == "running":
+            self._running_prefetch += (priority != FOREGROUND) - (job.priority != FOREGROUND)
+        job.priority = priority
+
+    def cancel_all(self):
+        with self._cond:
+            for job in self._jobs.values():
+                job.cancel.set()
+            self._jobs.clear()
+
+    def shutdown(self):
+        """取消所有任务 (正在运行的 matugen 会被终止) 并结束工作线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.cancel_all()
+
+    def _next_job(self):
+        with self._cond:
+            while not self._closed:
+                queued = [j for j in self._jobs.values() if j.state == "queued"]
+                if queued:
+                    job = min(queued, key=lambda j: (j.priority, j.order))
+                    prefetch = job.priority != FOREGROUND
+                    if not prefetch or self._running_prefetch < self.workers - 1:
+                        job.state = "running"
+                        self._running_prefetch += prefetch
+                        return job
+                self._cond.wait()
+            return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            path, mode, flavor, _ = job.key
+            try:
+                result = self.compute(path, mode, flavor, job.cancel)
+            except Exception as e:
+                log.error(f"Preview failed for {path}: {e}")
+                result = None
+
+            with self._cond:
+                # 运行期间可能被降级或升级，按当前优先级扣除
+                self._running_prefetch -= job.priority != FOREGROUND
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                if result and not job.cancel.is_set():
+                    self._memo[job.key] = result
+                    while len(self._memo) > self.memo_size:
+                        self._memo.popitem(last=False)
+                seq = job.seq
+                deliver = seq is not None and seq == self.latest and not job.cancel.is_set()
+                self._cond.notify_all()
+            if deliver:
+                self.deliver(seq, result)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+取色用的缩略代理图。
+
+取色只需要几千个像素，没必要每次都完整解码 8K 壁纸：
+首次遇到某张图片时生成一张边长不超过 PROXY_SIZE 的 PNG 并缓存，
+之后的取色 (matugen / 进程内引擎) 都读这张小图。
+
+检查代理图与原图的取色结果是否一致:
+    python3 -m backend.proxy verify <image> [<image> ...]
+"""
+import io
+import json
+import os
+import sys
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖，缺失时直接使用原图
+    Image = None
+
+try:
+    from backend import cache, hct, image_cache
+    from backend.logger import log
+except ImportError:
+    import cache
+    import hct
+    import image_cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+PROXY_SIZE = 256
+PROXY_DIR = cache.CACHE_ROOT / "proxies"
+# 代理图与原图取色结果不一致的图片，记录后始终使用原图
+EXCLUDE_FILE = PROXY_DIR / "exclude.json"
+# 源色在 CAM16-UCS 中的最大允许偏差
+EQUIVALENCE_THRESHOLD = 3.0
+
+PROXY_CACHE = cache.LruDiskCache(
+    PROXY_DIR,
+    max_entries=1024,
+    max_bytes=128 * 1024 * 1024,
+    memory_entries=0,
+    suffix=".png",
+)
+
+_EXCLUDED = None
+
+
+def is_available():
+    return Image is not None
+
+
+def _excluded():
+    global _EXCLUDED
+    if _EXCLUDED is None:
+        try:
+            with open(EXCLUDE_FILE, "r") as f:
+                _EXCLUDED = set(json.load(f))
+        except (OSError, ValueError):
+            _EXCLUDED = set()
+    return _EXCLUDED
+
+
+def is_excluded(fingerprint):
+    return fingerprint in _excluded()
+
+
+def _set_excluded(fingerprint, excluded):
+    items = _excluded()
+    if excluded:
+        items.add(fingerprint)
+    else:
+        items.discard(fingerprint)
+    try:
+        cache.atomic_write(EXCLUDE_FILE, json.dumps(sorted(items)))
+    except OSError as e:
+        log.warning(f"Failed to save proxy exclusions: {e}")
+
+
+def _proxy_key(fingerprint):
+    return f"{fingerprint}-{PROXY_SIZE}"
+
+
+def _render_proxy(image_path):
+    with Image.open(image_path) as img:
+        width, height = img.size
+        if max(width, height) <= PROXY_SIZE:
+            return None
+        # JPEG 以 1/2^n 分辨率解码 (DCT scaling)，不会分配整幅位图
+        img.draft("RGB", (PROXY_SIZE, PROXY_SIZE))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.thumbnail((PROXY_SIZE, PROXY_SIZE), Image.Resampling.BOX)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def get_proxy(image_path):
+    """
+    返回用于取色的代理图路径。
+    图片本身已足够小、Pillow 不可用或代理图被判定不等价时返回原路径。
+    """
+    if Image is None or not image_path:
+        return image_path
+    fingerprint = image_cache.source_fingerprint(image_path)
+    if not fingerprint or fingerprint in _excluded():
+        return image_path
+
+    key = _proxy_key(fingerprint)
+    path = PROXY_CACHE.path(key)
+    if path is not None:
+        return str(path)
+
+    try:
+        data = _render_proxy(image_path)
+    except Exception as e:
+        log.warning(f"Failed to create proxy for {image_path}: {e}")
+        return image_path
+    if data is None:
+        return image_path
+    if not PROXY_CACHE.put(key, data):
+        return image_path
+    log.debug("Created %dpx proxy for %s", PROXY_SIZE, image_path)
+    return str(PROXY_CACHE.path(key) or image_path)
+
+
+def _source_argb(json_str):
+    colors = json.loads(json_str).get("colors", {})
+    value = colors.get("source_color") or colors.get("primary")
+    if isinstance(value, dict):
+        value = value.get("default") or next(iter(value.values()))
+    return hct.argb_from_hex(value)
+
+
+def palette_distance(json_a, json_b):
+    """两份 matugen JSON 源色之间的 CAM16-UCS 距离"""
+    ucs = []
+    for data in (json_a, json_b):
+        cam = hct.cam16_from_argb(_source_argb(data))
+        ucs.append(cam[5:])
+    return sum((a - b) ** 2 for a, b in zip(*ucs)) ** 0.5
+
+
+def verify(image_path, mode="dark", flavor="tonal-spot"):
+    """
+    分别以原图和代理图运行 matugen 并比较源色；
+    不等价时把图片加入排除列表，以后都使用原图取色。返回距离。
+    """
+    try:
+        from backend import utils
+    except ImportError:
+        import utils
+
+    fingerprint = image_cache.source_fingerprint(image_path)
+    if fingerprint:
+        _excluded().discard(fingerprint)
+    proxy = get_proxy(image_path)
+    if proxy == image_path:
+        return 0.0
+    full = utils.run_matugen(image_path, mode, flavor, dry_run=True, use_proxy=False)
+    small = utils.run_matugen(proxy, mode, flavor, dry_run=True, use_proxy=False)
+    if not full or not small:
+        return None
+    distance = palette_distance(full, small)
+    _set_excluded(fingerprint, distance > EQUIVALENCE_THRESHOLD)
+    return distance
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "verify":
+        print("Usage: python3 -m backend.proxy verify <image> [<image> ...]")
+        sys.exit(1)
+    failed = 0
+    for path in sys.argv[2:]:
+        distance = verify(os.path.abspath(path))
+        if distance is None:
+            print(f"{path}: matugen failed")
+            failed += 1
+            continue
+        ok = distance <= EQUIVALENCE_THRESHOLD
+        failed += not ok
+        print(f"{path}: ΔE={distance:.2f} {'ok' if ok else 'MISMATCH (using full resolution)'}")
+    sys.exit(1 if failed else 0)
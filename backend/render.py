@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+进程内模板渲染。
+
+根据已缓存的调色板 JSON 直接渲染 matugen config.toml 中的模板，
+无需重新从图片取色。支持本项目模板用到的 matugen 语法子集：
+    {{colors.<name>.<default|light|dark>.<format>}}、{{mode}}、{{image}}
+    过滤器 lower_case / upper_case / replace
+    <* for name, value in colors *> ... <* endfor *>
+遇到不支持的语法时抛出 TemplateError，调用方应退回 matugen 完整运行。
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    from backend import cache, hooks, kde_colors, metrics
+    from backend.logger import log
+except ImportError:
+    import cache
+    import hooks
+    import kde_colors
+    import logging
+    import metrics
+
+    log = logging.getLogger(__name__)
+
+
+class TemplateError(Exception):
+    pass
+
+
+# 本模块能够处理的 [templates.*] 键
+SUPPORTED_TEMPLATE_KEYS = {"input_path", "output_path", "post_hook", "pre_hook"}
+# 仅本程序使用的扩展键：hook 依赖的其它模板名、hook 超时秒数 (matugen 会忽略它们)
+EXTENSION_TEMPLATE_KEYS = {"depends_on", "hook_timeout"}
+
+_TOKEN_RE = re.compile(r"\{\{(.*?)\}\}|<\*(.*?)\*>", re.S)
+_FOR_RE = re.compile(r"for\s+(\w+)\s*,\s*(\w+)\s+in\s+([\w.]+)$")
+_STRING_ARG_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+_TEMPLATE_CACHE = {}
+_CONFIG_CACHE = {}
+
+
+# --- 调色板 ---
+
+
+class Color:
+    """一个颜色在模板中的所有可用格式"""
+
+    __slots__ = ("red", "green", "blue")
+
+    def __init__(self, hex_value):
+        value = hex_value.strip().lstrip("#")
+        if len(value) == 3:
+            value = "".join(ch * 2 for ch in value)
+        self.red = int(value[0:2], 16)
+        self.green = int(value[2:4], 16)
+        self.blue = int(value[4:6], 16)
+
+    def field(self, name):
+        if name == "hex":
+            return f"#{self.red:02x}{self.green:02x}{self.blue:02x}"
+        if name == "hex_stripped":
+            return f"{self.red:02x}{self.green:02x}{self.blue:02x}"
+        if name == "red":
+            return str(self.red)
+        if name == "green":
+            return str(self.green)
+        if name == "blue":
+            return str(self.blue)
+        if name == "alpha":
+            return "255"
+        if name == "rgb":
+            return f"rgb({self.red}, {self.green}, {self.blue})"
+        raise TemplateError(f"Unsupported color format: {name}")
+
+
+def normalize_palette(data, mode):
+    """
+    把 matugen 不同版本的 JSON 结构统一为 {name: {"light", "dark", "default"}}。
+    - 新版: colors.<name>.<light|dark|default>
+    - 旧版: colors.<light|dark>.<name>
+    """
+    colors = data.get("colors", data)
+    if not isinstance(colors, dict) or not colors:
+        raise TemplateError("Palette has no colors")
+
+    if isinstance(colors.get("dark"), dict) and isinstance(colors.get("light"), dict):
+        names = set(colors["dark"]) | set(colors["light"])
+        result = {}
+        for name in names:
+            dark = colors["dark"].get(name) or colors["light"].get(name)
+            light = colors["light"].get(name) or dark
+            result[name] = {"dark": dark, "light": light}
+    else:
+        result = {}
+        for name, value in colors.items():
+            if isinstance(value, str):
+                result[name] = {"dark": value, "light": value, "default": value}
+            elif isinstance(value, dict):
+                dark = value.get("dark") or value.get("default")
+                light = value.get("light") or value.get("default")
+                if dark and light:
+                    result[name] = {"dark": dark, "light": light}
+
+    for entry in result.values():
+        entry["default"] = entry["dark"] if mode == "dark" else entry["light"]
+    return result
+
+
+def palette_for_mode(data, mode):
+    """调色板 JSON 同时包含深浅两套颜色，切换模式只需要重新选择 default"""
+    colors = normalize_palette(data, mode)
+    converted = dict(data)
+    converted["colors"] = colors
+    converted["mode"] = mode
+    return converted
+
+
+def build_context(data, mode, image_path):
+    colors = {
+        name: {variant: Color(value) for variant, value in entry.items()}
+        for name, entry in normalize_palette(data, mode).items()
+    }
+    return {"colors": colors, "mode": mode, "image": str(image_path or "")}
+
+
+# --- 模板引擎 ---
+
+
+def _parse(text):
+    """解析为节点列表: str | ("expr", src) | ("for", key, value, iterable, body)"""
+    pos = 0
+    root = []
+    stack = [(None, root)]
+    for match in _TOKEN_RE.finditer(text):
+        if match.start() > pos:
+            stack[-1][1].append(text[pos:match.start()])
+        pos = match.end()
+        expr, block = match.group(1), match.group(2)
+        if expr is not None:
+            stack[-1][1].append(("expr", expr.strip()))
+            continue
+        block = block.strip()
+        if block == "endfor":
+            if len(stack) == 1:
+                raise TemplateError("Unexpected endfor")
+            node, _ = stack.pop()
+            stack[-1][1].append(node)
+            continue
+        loop = _FOR_RE.match(block)
+        if not loop:
+            raise TemplateError(f"Unsupported block: {block}")
+        body = []
+        stack.append((("for", loop.group(1), loop.group(2), loop.group(3), body), body))
+    if len(stack) != 1:
+        raise TemplateError("Unclosed for block")
+    if pos < len(text):
+        root.append(text[pos:])
+    return root
+
+
+def _lookup(path, scope):
+    parts = path.split(".")
+    value = scope.get(parts[0]) if isinstance(scope, dict) else None
+    if value is None:
+        raise TemplateError(f"Unknown variable: {parts[0]}")
+    for part in parts[1:]:
+        if isinstance(value, Color):
+            value = value.field(part)
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            raise TemplateError(f"Unknown attribute: {path}")
+    if isinstance(value, (dict, Color)):
+        raise TemplateError(f"Incomplete expression: {path}")
+    return str(value)
+
+
+def _apply_filter(value, spec):
+    name, _, args = spec.partition(":")
+    name = name.strip()
+    if name == "lower_case":
+        return value.lower()
+    if name == "upper_case":
+        return value.upper()
+    if name == "replace":
+        strings = [s.encode().decode("unicode_escape") for s in _STRING_ARG_RE.findall(args)]
+        if len(strings) != 2:
+            raise TemplateError(f"Invalid replace filter: {spec}")
+        return value.replace(strings[0], strings[1])
+    raise TemplateError(f"Unsupported filter: {name}")
+
+
+def _evaluate(expr, scope):
+    parts = [p.strip() for p in expr.split("|")]
+    value = _lookup(parts[0], scope)
+    for spec in parts[1:]:
+        value = _apply_filter(value, spec)
+    return value
+
+
+def _render_nodes(nodes, scope, out):
+    for node in nodes:
+        if isinstance(node, str):
+            out.append(node)
+        elif node[0] == "expr":
+            out.append(_evaluate(node[1], scope))
+        else:
+            _, key_name, value_name, iterable, body = node
+            items = scope.get(iterable)
+            if not isinstance(items, dict):
+                raise TemplateError(f"Cannot iterate over {iterable}")
+            for key in sorted(items):
+                inner = dict(scope)
+                inner[key_name] = key
+                inner[value_name] = items[key]
+                _render_nodes(body, inner, out)
+
+
+def render_template(text, context):
+    out = []
+    _render_nodes(_parse(text), context, out)
+    return "".join(out)
+
+
+def _template_nodes(path):
+    """按 mtime 缓存模板解析结果"""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _TEMPLATE_CACHE.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        nodes = _parse(f.read())
+    _TEMPLATE_CACHE[path] = (stamp, nodes)
+    return nodes
+
+
+# --- config.toml ---
+
+
+class Template:
+    def __init__(
+        self, name, input_path, output_path, post_hook=None, pre_hook=None,
+        depends_on=(), hook_timeout=None,
+    ):
+        self.name = name
+        self.input_path = input_path
+        self.output_path = output_path
+        self.post_hook = post_hook
+        self.pre_hook = pre_hook
+        self.depends_on = depends_on
+        self.hook_timeout = hook_timeout
+
+
+def _resolve(path, base_dir):
+    path = Path(os.path.expanduser(str(path)))
+    return path if path.is_absolute() else (base_dir / path).resolve()
+
+
+def _as_list(value):
+    if not value:
+        return ()
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+def load_templates(config_path):
+    """
+    解析 matugen config.toml 中的模板列表 (按 mtime 缓存)。
+    含有不支持的配置时抛出 TemplateError。
+    """
+    if tomllib is None:
+        raise TemplateError("No TOML parser available")
+    config_path = Path(config_path)
+    st = os.stat(config_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _CONFIG_CACHE.get(str(config_path))
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with open(config_path, "rb") as f:
+        data = tomllib.load(f)
+
+    # 自定义颜色 / 关键字等会改变模板上下文，交给 matugen 处理
+    general = data.get("config") or {}
+    if any(k in general for k in ("custom_colors", "custom_keywords")):
+        raise TemplateError("Custom colors/keywords are not supported")
+
+    base_dir = config_path.parent
+    templates = []
+    for name, spec in (data.get("templates") or {}).items():
+        unknown = set(spec) - SUPPORTED_TEMPLATE_KEYS - EXTENSION_TEMPLATE_KEYS
+        if unknown:
+            raise TemplateError(f"Template {name} uses unsupported keys: {sorted(unknown)}")
+        post_hook = spec.get("post_hook")
+        if kde_colors.is_legacy_hook(post_hook):
+            # 旧配置中的 merge_kde_colors.py 已由 kde_colors 在进程内完成
+            post_hook = None
+        templates.append(
+            Template(
+                name,
+                _resolve(spec["input_path"], base_dir),
+                _resolve(spec["output_path"], base_dir),
+                post_hook,
+                spec.get("pre_hook"),
+                _as_list(spec.get("depends_on")),
+                spec.get("hook_timeout"),
+            )
+        )
+    _check_dependencies(templates)
+    _CONFIG_CACHE[str(config_path)] = (stamp, templates)
+    return templates
+
+
+def _check_dependencies(templates):
+    """depends_on 指向配置中不存在的模板时给出警告，避免拼写错误悄悄丢掉顺序约束"""
+    names = {t.name for t in templates}
+    for template in templates:
+        unknown = [d for d in template.depends_on if d not in names]
+        if unknown:
+            log.warning(
+                "Template %s depends on unknown templates %s; ignoring them",
+                template.name, unknown,
+            )
+            template.depends_on = tuple(d for d in template.depends_on if d in names)
+
+
+# --- 输出清单 ---
+
+# 记录每个输出文件上次写入的内容哈希与 stat，用于跳过未变化的输出及其 hook
+MANIFEST_FILE = cache.CACHE_ROOT / "outputs.json"
+# 输出未变化时，失败的 post_hook 最多再重试的次数；内容变化后重新计数
+HOOK_RETRIES = 2
+
+_MANIFEST = None
+
+
+def _load_manifest():
+    global _MANIFEST
+    if _MANIFEST is None:
+        try:
+            with open(MANIFEST_FILE, "r") as f:
+                _MANIFEST = json.load(f)
+        except (OSError, ValueError):
+            _MANIFEST = {}
+    return _MANIFEST
+
+
+def _save_manifest():
+    try:
+        cache.atomic_write(MANIFEST_FILE, json.dumps(_load_manifest(), indent=1))
+    except OSError as e:
+        log.warning(f"Failed to save output manifest: {e}")
+
+
+def _stat_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _is_unchanged(path, digest):
+    """磁盘上的文件与即将写入的内容一致时返回 True"""
+    manifest = _load_manifest()
+    stamp = _stat_stamp(path)
+    if stamp is None:
+        return False
+    entry = manifest.get(str(path))
+    if entry and entry.get("stamp") == stamp:
+        return entry.get("hash") == digest
+    # 清单缺失或文件被外部修改过：读取实际内容比较一次
+    if cache.hash_file(path) == digest:
+        manifest[str(path)] = {"hash": digest, "stamp": stamp}
+        return True
+    return False
+
+
+def _record_output(path, digest, hook_failures=0):
+    """hook_failures: post_hook 连续失败的次数 (内容摘要照常记录，不影响跳过判断)"""
+    entry = {"hash": digest, "stamp": _stat_stamp(path)}
+    if hook_failures:
+        entry["hook_failures"] = hook_failures
+    _load_manifest()[str(path)] = entry
+
+
+def _should_retry_hook(template):
+    """输出未变化，但上次的 post_hook 失败且尚未用完重试次数"""
+    if not template.post_hook:
+        return False
+    entry = _load_manifest().get(str(template.output_path)) or {}
+    return 0 < entry.get("hook_failures", 0) <= HOOK_RETRIES
+
+
+class RenderSummary:
+    def __init__(self, full_run=False):
+        # full_run: 由 matugen 完整运行写出，无法得知哪些输出变化
+        self.full_run = full_run
+        self.written = []
+        self.skipped = []
+        self.failed = []
+        self.hooks_run = 0
+        self.hooks_skipped = 0
+
+    @property
+    def changed(self):
+        return self.full_run or bool(self.written)
+
+    def __str__(self):
+        return (
+            f"{len(self.written)} written, {len(self.skipped)} unchanged, "
+            f"{len(self.failed)} failed; hooks: {self.hooks_run} run, "
+            f"{self.hooks_skipped} skipped"
+        )
+
+
+# --- 渲染输出 ---
+
+
+def _hook_job(template, command, context):
+    try:
+        command = render_template(command, context)
+    except TemplateError as e:
+        log.error(f"[{template.name}] Failed to render hook: {e}")
+        return None
+    return hooks.HookJob(
+        template.name,
+        command,
+        depends_on=template.depends_on,
+        timeout=template.hook_timeout,
+    )
+
+
+def _run_hooks(templates, attr, context):
+    jobs = []
+    for template in templates:
+        command = getattr(template, attr)
+        if command:
+            job = _hook_job(template, command, context)
+            if job:
+                jobs.append(job)
+    return hooks.run_hooks(jobs)
+
+
+class PreparedRender:
+    """已在内存中渲染完成、尚未写入的全部输出 (见 prepare_outputs / commit_outputs)"""
+
+    def __init__(self, rendered, context, config_path, stamps):
+        self.rendered = rendered  # [(Template, bytes)]
+        self.context = context
+        self.config_path = config_path
+        self.stamps = stamps
+
+    def is_current(self):
+        """config.toml 与模板文件自渲染后都没有变化"""
+        return self.stamps == _source_stamps(self.config_path, [t for t, _ in self.rendered])
+
+
+def _source_stamps(config_path, templates):
+    return [_stat_stamp(config_path)] + [_stat_stamp(t.input_path) for t in templates]
+
+
+def prepare_outputs(data, image_path, mode, config_path):
+    """
+    用调色板 JSON 在内存中渲染 config.toml 中的全部模板，不写任何文件。
+    任一模板不受支持时返回 None，否则返回 PreparedRender。
+    """
+    try:
+        with metrics.span("render"):
+            templates = load_templates(config_path)
+            stamps = _source_stamps(config_path, templates)
+            context = build_context(data, mode, image_path)
+            rendered = []
+            for template in templates:
+                out = []
+                _render_nodes(_template_nodes(str(template.input_path)), context, out)
+                text = "".join(out)
+                if template.output_path == kde_colors.SCHEME_FILE:
+                    text = kde_colors.finalize(text, mode)
+                rendered.append((template, text.encode("utf-8")))
+    except (TemplateError, OSError, KeyError, ValueError) as e:
+        log.info(f"In-process rendering unavailable, falling back to matugen: {e}")
+        return None
+    return PreparedRender(rendered, context, config_path, stamps)
+
+
+def commit_outputs(prepared):
+    """
+    写入 prepare_outputs 渲染好的输出。
+    内容与磁盘一致的输出不重写，其 hook 也不执行；其余 hook 交给 hooks 模块并行执行。
+    返回 RenderSummary。
+    """
+    context = prepared.context
+    summary = RenderSummary()
+    changed = []
+    retry = []  # 输出未变化，只重试上次失败的 post_hook
+    for template, content in prepared.rendered:
+        digest = cache.hash_bytes(content)
+        if _is_unchanged(template.output_path, digest):
+            summary.skipped.append(template.name)
+            if _should_retry_hook(template):
+                summary.hooks_skipped += bool(template.pre_hook)
+                retry.append((template, digest))
+            else:
+                summary.hooks_skipped += bool(template.pre_hook) + bool(template.post_hook)
+        else:
+            changed.append((template, content, digest))
+
+    try:
+        pre_results = _run_hooks([t for t, _, _ in changed], "pre_hook", context)
+        written = []
+        for template, content, digest in changed:
+            try:
+                cache.atomic_write(template.output_path, content)
+            except OSError as e:
+                log.error(f"[{template.name}] Failed to write {template.output_path}: {e}")
+                summary.failed.append(template.name)
+                continue
+            summary.written.append(template.name)
+            written.append((template, digest))
+            if template.output_path == kde_colors.SCHEME_FILE:
+                try:
+                    with metrics.span("kde_colors"):
+                        kde_colors.write_companions(content.decode("utf-8"))
+                except OSError as e:
+                    log.error(f"[{template.name}] Failed to update KDE color schemes: {e}")
+        post_results = _run_hooks([t for t, _ in written + retry], "post_hook", context)
+        manifest = _load_manifest()
+        retried = {t.name for t, _ in retry}
+        for template, digest in written + retry:
+            # post_hook 失败 (例如 Firefox 未运行时的 pywalfox) 时记下失败次数，
+            # 之后输出不变时最多再重试 HOOK_RETRIES 次，不会每次都重写输出
+            result = post_results.get(template.name)
+            failures = 0
+            if result is not None and not result.ok:
+                entry = manifest.get(str(template.output_path)) or {}
+                failures = 1 + (entry.get("hook_failures", 0) if template.name in retried else 0)
+            _record_output(template.output_path, digest, failures)
+    except ValueError as e:  # hook 依赖成环
+        log.error(f"Invalid hook configuration: {e}")
+        _save_manifest()
+        return summary
+    summary.hooks_run = len(pre_results) + len(post_results)
+
+    _save_manifest()
+    log.info("Rendered %d templates: %s", len(prepared.rendered), summary)
+    return summary
+
+
+def render_outputs(data, image_path, mode, config_path):
+    """
+    用调色板 JSON 渲染并写入 config.toml 中的全部模板。
+    全部模板先在内存中渲染完成再写入，任一模板不受支持时不写任何文件并返回 None；
+    否则返回 RenderSummary。
+    """
+    prepared = prepare_outputs(data, image_path, mode, config_path)
+    if prepared is None:
+        return None
+    return commit_outputs(prepared)
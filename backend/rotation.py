@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+壁纸轮换 (config.conf: rotationInterval 分钟，0 表示关闭；rotationShuffle 随机顺序)。
+
+- 轮换顺序是确定的：按路径顺序，或按持久化的随机种子打乱后的顺序，
+  因此始终知道接下来的 PREWARM 张壁纸
+- 壁纸列表来自 library.LibraryScanner：沿用数据库中的壁纸库索引，之后由 inotify 增量更新，
+  不会在每次查询时重新遍历文件夹
+- 预热在单独的子进程中以 SCHED_IDLE 优先级 (不可用时 nice 19) 提前完成这些壁纸的解码、
+  取色并在内存中渲染全部模板 (见 render.prepare_outputs)，结果交回服务进程；
+  服务进程自身的线程不降低优先级，避免低优先级线程持有 GIL 时拖慢调度与 IPC
+- 到点时由引擎的调度线程执行切换：写入预渲染的输出、设置壁纸、刷新 UI，
+  壁纸与主题同时变化；预热未完成时退回完整流程
+"""
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from backend import library, metrics, render, state, utils
+    from backend.logger import log
+except ImportError:
+    import library
+    import logging
+    import metrics
+    import render
+    import state
+    import utils
+
+    log = logging.getLogger(__name__)
+
+# 提前预热的壁纸数
+PREWARM = 3
+# 轮换开启时计时线程重新检查的最长间隔 (秒)；关闭时两个线程都只在配置变化时醒来
+IDLE_CHECK = 60.0
+STATE_KEY = "rotation"
+
+
+def lower_process_priority():
+    """
+    预热进程的初始化函数：把进程 (任务在其主线程中执行) 设为空闲调度，
+    其中启动的 matugen 也会继承。只用于独立的子进程，不要在服务进程中调用。
+    """
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+        return
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def _prepare(path, mode, flavor, config_path):
+    """在预热进程中执行：解码、取色并渲染 path，返回 (实际使用的图片, PreparedRender 或 None)"""
+    wall = utils.wallpaper_for_apply(path, mode)
+    palette = utils.run_matugen(wall, mode, flavor, dry_run=True, config_path=config_path)
+    if not palette:
+        return wall, None
+    try:
+        return wall, render.prepare_outputs(json.loads(palette), wall, mode, config_path)
+    except ValueError:
+        return wall, None
+
+
+class Rotation:
+    def __init__(self, engine, prewarm=PREWARM):
+        """engine 需要提供 scheduler (切换请求交给引擎的调度线程执行)"""
+        self.engine = engine
+        self.prewarm = prewarm
+        saved = state.get_value(STATE_KEY) or {}
+        self.last = saved.get("last")  # 最近一次轮换到的壁纸 (原始路径)
+        self.seed = saved.get("seed")
+        if not self.seed:
+            # 随机顺序在重启后保持不变
+            self.seed = random.randrange(1, 1 << 31)
+            state.set_value(STATE_KEY, {"last": self.last, "seed": self.seed})
+        self.next_at = None  # time.time() 时间戳
+        self._interval = 0
+        self._staged = OrderedDict()  # (壁纸, 模式, 风格) -> (实际使用的图片, PreparedRender)
+        self._lock = threading.Lock()
+        self._scanner = None
+        self._images = None  # 扫描完成后的壁纸列表 (按路径排序)
+        self._shuffled = None  # (所依据的 _images, 打乱后的列表)
+        self._wake = threading.Event()  # 唤醒计时线程
+        self._prewarm_wake = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._timer_loop, name="rotation", daemon=True).start()
+        threading.Thread(target=self._prewarm_loop, name="prewarm", daemon=True).start()
+        return self
+
+    # --- 顺序 ---
+
+    def _library(self, config):
+        """返回壁纸列表；文件夹或递归设置变化时重新开始扫描，扫描完成前返回空列表"""
+        folder = os.path.abspath(os.path.expanduser(config.wallpaper_folder))
+        with self._lock:
+            scanner = self._scanner
+            if scanner is not None and (scanner.root, scanner.recursive) == (
+                folder, config.recursive_scan
+            ):
+                return self._images or []
+            if scanner is not None:
+                scanner.stop()
+            self._scanner = None
+            self._images = None
+            if not os.path.isdir(folder):
+                return []
+
+            def changed(*_):
+                self._library_changed(scanner)
+
+            def added(paths):
+                # 首次扫描中分批给出的文件在 on_done 时一并处理
+                if self._images is not None:
+                    changed()
+
+            scanner = library.LibraryScanner(
+                folder, config.recursive_scan,
+                on_added=added, on_removed=changed, on_done=changed,
+            )
+            # 先登记再启动，扫描很快完成时回调也能认出这个扫描器
+            self._scanner = scanner
+            scanner.start()
+        return []
+
+    def _library_changed(self, scanner):
+        """在扫描线程中调用，此时读取 scanner.paths 是安全的"""
+        if scanner is self._scanner:
+            self._images = sorted(scanner.paths)
+            self._prewarm_wake.set()
+
+    def playlist(self, config):
+        images = self._library(config)
+        if not config.rotation_shuffle:
+            return images
+        shuffled = self._shuffled
+        if shuffled is None or shuffled[0] is not images:
+            order = list(images)
+            random.Random(self.seed).shuffle(order)
+            self._shuffled = shuffled = (images, order)
+        return shuffled[1]
+
+    def upcoming(self, config, count):
+        """last 之后的 count 张壁纸 (循环)"""
+        images = self.playlist(config)
+        if not images:
+            return []
+        try:
+            start = images.index(self.last) + 1
+        except ValueError:
+            start = 0
+        count = min(count, len(images))
+        return [images[(start + i) % len(images)] for i in range(count)]
+
+    def skip(self):
+        """立即切换到下一张 (IPC 命令 rotate)，返回目标壁纸"""
+        upcoming = self.upcoming(utils.load_config(), 1)
+        if upcoming:
+            self.engine.scheduler.request("rotation", rotate=upcoming[0])
+            if self.next_at is not None:
+                self.next_at = time.time() + self._interval
+        return upcoming[0] if upcoming else None
+
+    def status(self):
+        config = utils.load_config()
+        with self._lock:
+            staged = len(self._staged)
+        return {
+            "interval_min": config.rotation_interval,
+            "shuffle": config.rotation_shuffle,
+            "last": self.last,
+            "next_at": self.next_at,
+            "upcoming": self.upcoming(config, self.prewarm),
+            "staged": staged,
+        }
+
+    # --- 计时 ---
+
+    def _timer_loop(self):
+        while True:
+            config = utils.load_config()
+            interval = config.rotation_interval * 60
+            if interval != self._interval:
+                # 开启轮换或间隔改变：从现在起重新计时
+                self._interval = interval
+                self.next_at = time.time() + interval if interval > 0 else None
+                self._prewarm_wake.set()
+            if interval <= 0:
+                # 轮换关闭：阻塞到 config_changed()
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            remaining = self.next_at - time.time()
+            if remaining > 0:
+                # 配置变化或 skip() 时提前醒来重新计算
+                self._wake.wait(min(remaining, IDLE_CHECK))
+                self._wake.clear()
+                continue
+            upcoming = self.upcoming(config, 1)
+            self.next_at = time.time() + interval
+            if upcoming:
+                self.engine.scheduler.request("rotation", rotate=upcoming[0])
+
+    # --- 预热 ---
+
+    def _prewarm_loop(self):
+        while True:
+            # 由计时线程 (开启轮换)、切换完成、配置或壁纸库变化唤醒
+            self._prewarm_wake.wait()
+            self._prewarm_wake.clear()
+            config = utils.load_config()
+            if config.rotation_interval <= 0:
+                continue
+            try:
+                with metrics.background("prewarm:"):
+                    self._prewarm(config)
+            except Exception as e:
+                log.error(f"Rotation prewarm failed: {e}")
+
+    def _prewarm(self, config):
+        mode, flavor = config.color_mode, config.flavor
+        wanted = [(path, mode, flavor) for path in self.upcoming(config, self.prewarm)]
+        with self._lock:
+            for key in list(self._staged):
+                if key not in wanted:
+                    del self._staged[key]
+            todo = [
+                key for key in wanted
+                if key not in self._staged or not self._staged[key][1].is_current()
+            ]
+        if not todo:
+            return
+        # 每轮新建进程，空闲时不常驻；服务进程中已有日志线程，fork 不安全
+        with ProcessPoolExecutor(
+            1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=lower_process_priority,
+        ) as pool:
+            futures = [
+                (key, pool.submit(_prepare, *key, utils.MATUGEN_CONFIG_PATH)) for key in todo
+            ]
+            for key, future in futures:
+                with metrics.span("prepare"):
+                    wall, prepared = future.result()
+                if prepared is None:
+                    continue
+                with self._lock:
+                    self._staged[key] = (wall, prepared)
+                log.debug(f"Prewarmed rotation target {key[0]}")
+
+    def take(self, path, wall, mode, flavor):
+        """取出 path 预渲染好的输出；没有、图片不同或已过期时返回 None"""
+        with self._lock:
+            staged = self._staged.pop((path, mode, flavor), None)
+        if staged is None or staged[0] != wall or not staged[1].is_current():
+            return None
+        return staged[1]
+
+    def switched(self, path):
+        """切换完成后记录位置，并开始预热新的后续壁纸"""
+        self.last = path
+        state.set_value(STATE_KEY, {"last": path, "seed": self.seed})
+        self._prewarm_wake.set()
+
+    def config_changed(self):
+        """配置变化后重新计算下次切换时间与预热目标"""
+        self._wake.set()
+        self._prewarm_wake.set()
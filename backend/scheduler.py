@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+更新调度器：位于事件源与 update() 之间。
+
+- 去抖：一串连续事件在安静 delay 秒后只触发一次任务
+- 串行：任务在独立的工作线程中执行，同一时间最多一个
+- 最新优先：任务执行期间到达的请求合并为一次，只构建最新的目标状态
+"""
+import threading
+import time
+
+try:
+    from backend.logger import log
+except ImportError:
+    import logging
+
+    log = logging.getLogger(__name__)
+
+
+class UpdateScheduler:
+    def __init__(self, job, delay=0.15, name="update"):
+        """job(state: dict) 在工作线程中执行，state 为合并后的最新请求参数"""
+        self.job = job
+        self.delay = delay
+        self.name = name
+        self.generation = 0
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._state = {}
+        self._reasons = []
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def request(self, reason="", **state):
+        """
+        登记一次更新请求；同名参数以最后一次为准，
+        布尔提示 (force、wallpaper 等) 取或，合并时不会丢失已登记的 True
+        """
+        with self._cond:
+            for key, value in state.items():
+                if isinstance(value, bool):
+                    value = value or self._state.get(key) is True
+                self._state[key] = value
+            self._reasons.append(reason)
+            self._deadline = time.monotonic() + self.delay
+            self._cond.notify()
+
+    def wait_idle(self, timeout=None):
+        """等待所有已登记的请求处理完毕，超时返回 False"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._deadline is not None or self._busy:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _take(self):
+        with self._cond:
+            while True:
+                if self._deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                state, reasons = self._state, self._reasons
+                self._state, self._reasons = {}, []
+                self._deadline = None
+                self._busy = True
+                return state, reasons
+
+    def _run(self):
+        while True:
+            state, reasons = self._take()
+            self.generation += 1
+            start = time.monotonic()
+            try:
+                self.job(state)
+            except Exception as e:
+                log.error(f"[{self.name}] Job failed: {e}")
+            sources = ", ".join(sorted({r for r in reasons if r})) or "-"
+            duration = time.monotonic() - start
+            log.info(
+                "[%s] Generation %d done in %.2fs, coalesced %d events (%s)",
+                self.name, self.generation, duration, len(reasons), sources,
+                extra={
+                    "stage": self.name,
+                    "generation": self.generation,
+                    "count": len(reasons),
+                    "duration_ms": round(duration * 1000, 1),
+                },
+            )
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
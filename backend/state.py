@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+持久化状态 (SQLite, WAL 模式)。
+
+GUI 与后台服务是两个进程，都会读写这里：
+    kv               当前壁纸、最近一次应用的配置等单值状态
+    wallpaper_history 应用过的壁纸历史
+    palettes         调色板缓存条目的元数据 (缓存内容本身仍在 palettes/ 目录)
+    runs             每次生成主题的各阶段耗时
+    library_dirs / library_files  壁纸库索引 (见 library.py)
+    library_colors   壁纸源色的 CAM16-UCS 坐标 (见 color_index.py)
+数据库出错时只记录日志，不影响主流程。
+"""
+import contextlib
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from backend import cache
+    from backend.logger import log
+except ImportError:
+    import cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+DB_PATH = cache.CACHE_ROOT / "state.db"
+# 旧版本使用的 JSON 状态文件，首次打开数据库时导入
+LEGACY_STATE_FILE = cache.CACHE_ROOT / "state.json"
+
+HISTORY_LIMIT = 500
+RUNS_LIMIT = 1000
+
+SCHEMA_VERSION = 3
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wallpaper_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    mode TEXT,
+    flavor TEXT,
+    source_color TEXT,
+    applied_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_applied ON wallpaper_history (applied_at);
+CREATE INDEX IF NOT EXISTS idx_history_path ON wallpaper_history (path);
+CREATE TABLE IF NOT EXISTS palettes (
+    key TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    mode TEXT,
+    flavor TEXT,
+    source_color TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_palettes_image ON palettes (image);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    total_ms REAL NOT NULL,
+    stages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started);
+CREATE TABLE IF NOT EXISTS library_dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS library_files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_library_files_dir ON library_files (dir);
+CREATE TABLE IF NOT EXISTS library_colors (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    hue REAL NOT NULL,
+    chroma REAL NOT NULL,
+    jstar REAL NOT NULL,
+    astar REAL NOT NULL,
+    bstar REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(DB_PATH), timeout=5.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        _import_legacy(conn)
+    _local.conn = conn
+    return conn
+
+
+def _import_legacy(conn):
+    try:
+        with open(LEGACY_STATE_FILE, "r") as f:
+            path = json.load(f).get("current_wallpaper")
+    except (OSError, ValueError, AttributeError):
+        return
+    if path:
+        _set(conn, "current_wallpaper", path)
+    try:
+        os.unlink(LEGACY_STATE_FILE)
+    except OSError:
+        pass
+
+
+def _safe(default=None):
+    """数据库操作出错时记录日志并返回 default (可调用时返回其调用结果)"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except (sqlite3.Error, OSError) as e:
+                # OSError: 创建数据库目录失败 (只读 / 磁盘已满等)
+                log.warning(f"State database error in {func.__name__}: {e}")
+                return default() if callable(default) else default
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def _transaction(conn):
+    # 连接处于自动提交模式，多条语句需要显式事务
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _set(conn, key, value):
+    conn.execute(
+        "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+        (key, json.dumps(value), time.time()),
+    )
+
+
+# --- 单值状态 ---
+
+
+@_safe()
+def set_value(key, value):
+    _set(_connect(), key, value)
+
+
+@_safe()
+def get_value(key, default=None):
+    row = _connect().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return json.loads(row["value"]) if row else default
+
+
+def set_current_wallpaper(path):
+    set_value("current_wallpaper", str(path))
+
+
+def current_wallpaper():
+    """最近处理过的壁纸路径，文件已不存在时返回 None"""
+    path = get_value("current_wallpaper")
+    return path if path and os.path.exists(path) else None
+
+
+# --- 壁纸历史 ---
+
+
+@_safe()
+def record_apply(path, mode, flavor, source_color=None, config=None):
+    """记录一次成功应用的主题，同时保存当时的配置"""
+    conn = _connect()
+    now = time.time()
+    with _transaction(conn):
+        conn.execute(
+            "INSERT INTO wallpaper_history (path, mode, flavor, source_color, applied_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (str(path), mode, flavor, source_color, now),
+        )
+        if config is not None:
+            _set(conn, "last_applied_config", config)
+        conn.execute(
+            "DELETE FROM wallpaper_history WHERE id <= "
+            "(SELECT id FROM wallpaper_history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (HISTORY_LIMIT,),
+        )
+
+
+@_safe(default=list)
+def history(limit=50, distinct=True):
+    """最近应用过的壁纸，新的在前"""
+    conn = _connect()
+    if distinct:
+        rows = conn.execute(
+            "SELECT path, mode, flavor, source_color, MAX(applied_at) AS applied_at "
+            "FROM wallpaper_history GROUP BY path ORDER BY applied_at DESC LIMIT ?",
+            (limit,),
+        )
+    else:
+        rows = conn.execute(
+            "SELECT path, mode, flavor, source_color, applied_at "
+            "FROM wallpaper_history ORDER BY id DESC LIMIT ?",
+            (limit,),
+        )
+    return [dict(row) for row in rows]
+
+
+def last_applied_config():
+    return get_value("last_applied_config")
+
+
+# --- 调色板元数据 ---
+
+
+@_safe()
+def record_palette(key, image, mode, flavor, source_color=None):
+    _connect().execute(
+        "INSERT OR REPLACE INTO palettes (key, image, mode, flavor, source_color, created) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, str(image), mode, flavor, source_color, time.time()),
+    )
+
+
+@_safe()
+def forget_palettes(keys):
+    """调色板缓存淘汰条目后删除对应的元数据，表的大小随缓存一起受限"""
+    conn = _connect()
+    with _transaction(conn):
+        conn.executemany("DELETE FROM palettes WHERE key = ?", [(k,) for k in keys])
+
+
+@_safe(default=list)
+def palettes_for(image):
+    rows = _connect().execute(
+        "SELECT key, mode, flavor, source_color, created FROM palettes WHERE image = ?",
+        (str(image),),
+    )
+    return [dict(row) for row in rows]
+
+
+# --- 运行耗时 ---
+
+
+@_safe()
+def record_run(stages, total_ms, started=None):
+    """stages: {阶段名: 毫秒}"""
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "INSERT INTO runs (started, total_ms, stages) VALUES (?, ?, ?)",
+            (started or time.time(), total_ms, json.dumps(stages)),
+        )
+        conn.execute(
+            "DELETE FROM runs WHERE id <= "
+            "(SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (RUNS_LIMIT,),
+        )
+
+
+@_safe(default=list)
+def recent_runs(limit=20):
+    rows = _connect().execute(
+        "SELECT started, total_ms, stages FROM runs ORDER BY id DESC LIMIT ?", (limit,)
+    )
+    return [
+        {"started": r["started"], "total_ms": r["total_ms"], "stages": json.loads(r["stages"])}
+        for r in rows
+    ]
+
+
+# --- 壁纸库索引 ---
+
+
+def _subtree(column, root):
+    # root 本身以及其下所有路径 ("/" 的下一个字符是 "0")
+    root = root.rstrip("/") or "/"
+    prefix = root if root.endswith("/") else root + "/"
+    return (
+        f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+        (root, prefix, prefix[:-1] + "0"),
+    )
+
+
+@_safe(default=dict)
+def library_dirs(root):
+    """{目录: (mtime_ns, [子目录路径])}，包括 root 下所有已索引的子目录"""
+    where, args = _subtree("path", root)
+    rows = _connect().execute(
+        f"SELECT path, mtime_ns, subdirs FROM library_dirs WHERE {where}", args
+    )
+    return {r["path"]: (r["mtime_ns"], json.loads(r["subdirs"])) for r in rows}
+
+
+@_safe(default=dict)
+def library_files(root):
+    """{目录: {文件路径: (size, mtime_ns, width, height)}}"""
+    where, args = _subtree("dir", root)
+    rows = _connect().execute(
+        f"SELECT path, dir, size, mtime_ns, width, height FROM library_files WHERE {where}",
+        args,
+    )
+    result = {}
+    for r in rows:
+        result.setdefault(r["dir"], {})[r["path"]] = (
+            r["size"], r["mtime_ns"], r["width"], r["height"]
+        )
+    return result
+
+
+@_safe()
+def save_library_dirs(entries):
+    """
+    整体替换这些目录的索引。
+    entries: [(目录, mtime_ns, [子目录路径], {文件路径: (size, mtime_ns, width, height)})]
+    """
+    conn = _connect()
+    with _transaction(conn):
+        for dirpath, mtime_ns, subdirs, files in entries:
+            conn.execute(
+                "INSERT OR REPLACE INTO library_dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                (dirpath, mtime_ns, json.dumps(subdirs)),
+            )
+            conn.execute("DELETE FROM library_files WHERE dir = ?", (dirpath,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO library_files "
+                "(path, dir, size, mtime_ns, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+                [(path, dirpath, *info) for path, info in files.items()],
+            )
+
+
+@_safe()
+def remove_library_dirs(paths):
+    conn = _connect()
+    with _transaction(conn):
+        for dirpath in paths:
+            conn.execute("DELETE FROM library_dirs WHERE path = ?", (dirpath,))
+            conn.execute("DELETE FROM library_files WHERE dir = ?", (dirpath,))
+
+
+# --- 壁纸颜色索引 ---
+
+COLOR_COLUMNS = ("size", "mtime_ns", "source", "hue", "chroma", "jstar", "astar", "bstar")
+
+
+@_safe(default=dict)
+def library_colors(root):
+    """{文件路径: (size, mtime_ns, source, hue, chroma, jstar, astar, bstar)}"""
+    where, args = _subtree("path", root)
+    rows = _connect().execute(
+        f"SELECT path, {', '.join(COLOR_COLUMNS)} FROM library_colors WHERE {where}", args
+    )
+    return {r["path"]: tuple(r[c] for c in COLOR_COLUMNS) for r in rows}
+
+
+@_safe()
+def save_library_colors(entries):
+    """entries: {文件路径: (size, mtime_ns, source, hue, chroma, jstar, astar, bstar)}"""
+    conn = _connect()
+    with _transaction(conn):
+        conn.executemany(
+            f"INSERT OR REPLACE INTO library_colors (path, {', '.join(COLOR_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(COLOR_COLUMNS))})",
+            [(path, *entry) for path, entry in entries.items()],
+        )
+
+
+@_safe()
+def remove_library_colors(paths):
+    conn = _connect()
+    with _transaction(conn):
+        conn.executemany("DELETE FROM library_colors WHERE path = ?", [(p,) for p in paths])
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+壁纸网格用的缩略图，遵循 freedesktop 缩略图规范
+(~/.cache/thumbnails/normal|large|...，与文件管理器共享)。
+
+- 已有的缩略图只读 PNG 文本块校验 (Thumb::URI 与 Thumb::MTime 与原图一致) 后直接复用
+- 缺失的缩略图在进程池中生成：Pillow 解码，JPEG 用 draft 按 1/2 ~ 1/8 缩小解码；
+  JXL / AVIF / HEIC 没有 Pillow 插件时先经 image_cache 转码
+- 无法解码的图片按规范记录在 fail/ 目录中，文件未变时不再重试
+"""
+import hashlib
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from urllib.parse import quote
+
+try:
+    from PIL import Image, ImageOps, PngImagePlugin
+except ImportError:  # 可选依赖，缺失时只复用已有的缩略图
+    Image = None
+
+try:
+    from backend import image_cache
+    from backend.logger import log
+except ImportError:
+    import image_cache
+    import logging
+
+    log = logging.getLogger(__name__)
+
+APP_NAME = "MaterialYou-Autothemer"
+THUMBNAIL_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "thumbnails"
+FAIL_DIR = THUMBNAIL_DIR / "fail" / APP_NAME
+# 规范定义的尺寸 (最长边像素数)，按从小到大排列
+SIZES = {"normal": 128, "large": 256, "x-large": 512, "xx-large": 1024}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# 与 GLib g_filename_to_uri 保持一致的保留字符，保证与文件管理器算出同一个文件名
+_URI_SAFE = "/!$&'()*+,:=@"
+
+
+def is_available():
+    """能否生成新的缩略图"""
+    return Image is not None
+
+
+def size_for(pixels):
+    """能覆盖 pixels 的最小规范尺寸"""
+    for name, size in SIZES.items():
+        if pixels <= size:
+            return name
+    return "xx-large"
+
+
+def file_uri(path):
+    return "file://" + quote(os.path.abspath(path), safe=_URI_SAFE)
+
+
+def thumbnail_path(uri, size="large"):
+    name = hashlib.md5(uri.encode("utf-8")).hexdigest() + ".png"
+    return THUMBNAIL_DIR / size / name
+
+
+def _fail_path(uri):
+    return FAIL_DIR / thumbnail_path(uri).name
+
+
+def _png_text(path):
+    """读取 PNG 的 tEXt 块 (跳过图像数据)，不是 PNG 或无法读取时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            if f.read(8) != PNG_SIGNATURE:
+                return None
+            text = {}
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                length, kind = struct.unpack(">I4s", header)
+                if kind == b"IEND":
+                    break
+                if kind == b"tEXt":
+                    key, _, value = f.read(length).partition(b"\0")
+                    text[key.decode("latin-1")] = value.decode("latin-1")
+                    f.seek(4, os.SEEK_CUR)
+                else:
+                    f.seek(length + 4, os.SEEK_CUR)
+            return text
+    except (OSError, struct.error):
+        return None
+
+
+def _is_valid(thumb, uri, mtime):
+    text = _png_text(thumb)
+    if not text or text.get("Thumb::URI") != uri:
+        return False
+    try:
+        return int(float(text.get("Thumb::MTime", ""))) == int(mtime)
+    except ValueError:
+        return False
+
+
+def lookup(path, size="large"):
+    """
+    返回 path 的有效缩略图路径，没有时返回 None。
+    规范允许用更大尺寸的缩略图代替，因此也会依次查找更大的尺寸。
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    uri = file_uri(path)
+    names = list(SIZES)
+    for name in names[names.index(size):]:
+        thumb = thumbnail_path(uri, name)
+        if _is_valid(thumb, uri, mtime):
+            return str(thumb)
+    return None
+
+
+def has_failed(path):
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return False
+    uri = file_uri(path)
+    return _is_valid(_fail_path(uri), uri, mtime)
+
+
+def _save(img, dest, info):
+    """按规范写入：目录 0700，文件 0600，先写临时文件再 rename"""
+    dest.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    fd, tmp = tempfile.mkstemp(prefix=f".{dest.name}.", dir=str(dest.parent))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, format="PNG", pnginfo=info, compress_level=3)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _open(path):
+    image_cache.load_plugins()
+    try:
+        return Image.open(path)
+    except Exception:
+        if not image_cache.needs_decode(path):
+            raise
+    # 没有对应的 Pillow 插件：使用转码缓存中的 PNG
+    decoded = image_cache.ensure_compatible(path)
+    if decoded == path:
+        raise OSError(f"no decoder available for {path}")
+    return Image.open(decoded)
+
+
+def generate(path, size="large"):
+    """
+    在当前进程中生成缩略图，返回缩略图路径；图片无法解码时记录失败并返回 None。
+    """
+    if Image is None:
+        return None
+    st = os.stat(path)
+    uri = file_uri(path)
+    pixels = SIZES[size]
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Thumb::URI", uri)
+    info.add_text("Thumb::MTime", str(int(st.st_mtime)))
+    info.add_text("Thumb::Size", str(st.st_size))
+    info.add_text("Software", APP_NAME)
+    try:
+        with _open(path) as img:
+            width, height = img.size
+            # JPEG 直接以缩小的比例解码，8K 壁纸只需解码约 1/64 的像素
+            img.draft("RGB", (pixels, pixels))
+            thumb = ImageOps.exif_transpose(img)
+            thumb.thumbnail((pixels, pixels))
+            if thumb.mode not in ("RGB", "RGBA"):
+                thumb = thumb.convert("RGBA" if "A" in thumb.getbands() else "RGB")
+    except Exception as e:
+        log.warning(f"Cannot create thumbnail for {path}: {e}")
+        _save(Image.new("RGBA", (1, 1)), _fail_path(uri), info)
+        return None
+    info.add_text("Thumb::Image::Width", str(width))
+    info.add_text("Thumb::Image::Height", str(height))
+    dest = thumbnail_path(uri, size)
+    _save(thumb, dest, info)
+    return str(dest)
+
+
+class Thumbnailer:
+    """
+    后台生成缩略图。request() 返回 Future，结果为缩略图路径 (无法生成时为 None)。
+    同一张图片的并发请求共享同一个生成任务；所有请求都取消后尚未开始的任务也会取消。
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self._executor = None
+        self._jobs = {}  # (path, size) -> (进程池 Future, 等待中的 Future 集合)
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            # GUI 进程中有 Qt 线程，fork 不安全
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def request(self, path, size="large"):
+        future = Future()
+        thumb = lookup(path, size)
+        if thumb or not is_available() or has_failed(path):
+            future.set_result(thumb)
+            return future
+
+        key = (path, size)
+        submitted = None
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                try:
+                    submitted = self._pool().submit(generate, path, size)
+                except RuntimeError as e:  # 已关闭
+                    log.debug(f"Thumbnailer unavailable: {e}")
+                    future.set_result(None)
+                    return future
+                job = self._jobs[key] = (submitted, set())
+            job[1].add(future)
+        # 回调可能立即执行并获取锁，必须在锁外注册
+        if submitted is not None:
+            submitted.add_done_callback(lambda f: self._finish(key, f))
+        future.add_done_callback(lambda f: self._abandon(key, f))
+        return future
+
+    def _finish(self, key, pool_future):
+        with self._lock:
+            job = self._jobs.pop(key, None)
+        waiters = job[1] if job else ()
+        try:
+            result = None if pool_future.cancelled() else pool_future.result()
+        except BrokenProcessPool as e:
+            # 工作进程异常退出：丢弃进程池，下次请求时重建
+            log.warning(f"Thumbnail worker failed for {key[0]}: {e}")
+            with self._lock:
+                self._executor = None
+            result = None
+        except Exception as e:
+            log.warning(f"Thumbnail worker failed for {key[0]}: {e}")
+            result = None
+        for waiter in list(waiters):
+            try:
+                waiter.set_result(result)
+            except InvalidStateError:  # 已取消
+                pass
+
+    def _abandon(self, key, future):
+        if not future.cancelled():
+            return
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job[1].discard(future)
+            unwanted = not job[1]
+        if unwanted:
+            # 尚未开始的任务会被取消，并由 _finish 移除
+            job[0].cancel()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            jobs, self._jobs = self._jobs, {}
+        for _, waiters in jobs.values():
+            for waiter in waiters:
+                waiter.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 import configparser
 import fcntl
+import io
 import json
 import os
 import shutil
 import subprocess
 import sys
-import tempfile
+from dataclasses import dataclass, fields
 from pathlib import Path
 
 try:
@@ -17,6 +18,29 @@ except ImportError:
     log = logging.getLogger(__name__)
     logging.basicConfig(level=logging.INFO)
 
+try:
+    from backend import (
+        cache,
+        desktop,
+        image_cache,
+        kde_colors,
+        kde_wallpaper,
+        metrics,
+        proxy,
+        render,
+        state,
+    )
+except ImportError:
+    import cache
+    import desktop
+    import image_cache
+    import kde_colors
+    import kde_wallpaper
+    import metrics
+    import proxy
+    import render
+    import state
+
 # --- 基础配置 ---
 APP_NAME = "MaterialYou-Autothemer"
 
@@ -25,15 +49,29 @@ APP_NAME = "MaterialYou-Autothemer"
 CONFIG_DIR = Path.home() / ".config" / APP_NAME
 CONFIG_FILE = CONFIG_DIR / "config.conf"
 CACHE_DIR = Path.home() / ".cache" / APP_NAME
-STATE_FILE = CACHE_DIR / "state.json"
 LOCK_FILE = CACHE_DIR / "service.lock"
-TEMP_WALLPAPER = Path(tempfile.gettempdir()) / "matugen-temp-wallpaper.png"
+PALETTE_CACHE_DIR = CACHE_DIR / "palettes"
 
 # Matugen 配置路径 (用户希望放在 .config 下以便修改)
 MATUGEN_CONFIG_DIR = CONFIG_DIR / "matugen"
 MATUGEN_CONFIG_PATH = MATUGEN_CONFIG_DIR / "config.toml"
 
-_DESKTOP_ENV_CACHE = None
+# 预览取色引擎: auto (安装了 numpy/Pillow 时使用进程内引擎) / builtin / matugen
+PREVIEW_ENGINE = os.environ.get("MATERIALYOU_PREVIEW_ENGINE", "auto").lower()
+
+_MATUGEN_VERSION_CACHE = {}
+_CONFIG_DIGEST_CACHE = {}
+_CONFIG_CACHE = None  # (config.conf 的 stat 签名, AppConfig)
+
+# 调色板缓存：(图片指纹, 模式, 风格, matugen 版本, config.toml 哈希) -> matugen JSON
+PALETTE_CACHE = cache.LruDiskCache(
+    PALETTE_CACHE_DIR,
+    max_entries=16384,
+    max_bytes=128 * 1024 * 1024,
+    memory_entries=128,
+    suffix=".json",
+    on_evict=state.forget_palettes,
+)
 
 
 def init_resources():
@@ -200,83 +238,8 @@ def acquire_lock():
 
 
 def get_desktop_env(force_refresh=False):
-    global _DESKTOP_ENV_CACHE
-    if force_refresh or _DESKTOP_ENV_CACHE is None:
-        tokens = []
-        for key in ("XDG_CURRENT_DESKTOP", "XDG_SESSION_DESKTOP", "DESKTOP_SESSION", "GDMSESSION"):
-            value = os.environ.get(key)
-            if not value:
-                continue
-            for part in value.replace(";", ":").split(":"):
-                part = part.strip().lower()
-                if part and part not in tokens:
-                    tokens.append(part)
-
-        if not tokens:
-            for token in _detect_desktop_from_dbus():
-                if token not in tokens:
-                    tokens.append(token)
-
-        if not tokens:
-            for token in _detect_desktop_from_processes():
-                if token not in tokens:
-                    tokens.append(token)
-
-        if not tokens:
-            if os.environ.get("KDE_FULL_SESSION") == "true" or shutil.which("plasmashell"):
-                tokens.append("kde")
-            elif os.environ.get("GNOME_DESKTOP_SESSION_ID") or shutil.which("gsettings"):
-                tokens.append("gnome")
-
-        if tokens:
-            _DESKTOP_ENV_CACHE = tuple(tokens)
-        else:
-            _DESKTOP_ENV_CACHE = tuple()
-
-    return _DESKTOP_ENV_CACHE
-
-
-def _detect_desktop_from_dbus():
-    """
-    通过 DBus session bus 名称检测桌面环境 (GNOME/KDE)
-    """
-    try:
-        import dbus  # type: ignore
-    except Exception:
-        return []
-
-    try:
-        names = dbus.SessionBus().list_names()
-    except Exception:
-        return []
-
-    tokens = []
-    if any(name.startswith("org.gnome.") or name == "org.gnome.Shell" for name in names):
-        tokens.append("gnome")
-    if any(name.startswith("org.kde.") or name == "org.kde.KWin" for name in names):
-        tokens.append("kde")
-    return tokens
-
-
-def _detect_desktop_from_processes():
-    """
-    通过正在运行的进程检测桌面环境 (GNOME/KDE)
-    """
-    try:
-        output = subprocess.check_output(
-            ["ps", "-eo", "comm"],
-            text=True,
-            stderr=subprocess.DEVNULL,
-        ).lower()
-    except Exception:
-        return []
-
-    tokens = []
-    if any(proc in output for proc in ("gnome-shell", "gnome-session-binary", "mutter")):
-        tokens.append("gnome")
-    if any(proc in output for proc in ("plasmashell", "kwin_x11", "kwin_wayland", "ksmserver")):
-        tokens.append("kde")
-    return tokens
+    """[通用] 桌面环境标识元组，见 desktop.py"""
+    return desktop.detect(force_refresh=force_refresh)
 
 
 def is_gnome_session():
@@ -301,98 +264,131 @@ def is_kde_session():
     return session in ("kde", "plasma") or session.startswith("plasma-")
 
 
-def read_config():
-    """读取用户配置"""
-    mode = "dark"
-    flavor = "tonal-spot"
-    wallpaper_folder = str(Path.home() / "Pictures")
+@dataclass(frozen=True)
+class AppConfig:
+    """config.conf [General] 的类型化视图"""
+
+    color_mode: str = "dark"
+    flavor: str = "tonal-spot"
+    wallpaper_folder: str = str(Path.home() / "Pictures")
+    current_wallpaper: str = ""
+    recursive_scan: bool = False  # 壁纸文件夹是否包含子文件夹
+    rotation_interval: int = 0  # 壁纸轮换间隔 (分钟)，0 表示关闭
+    rotation_shuffle: bool = False  # 随机顺序轮换
+
+    def diff(self, other):
+        """与 other 相比发生变化的字段名集合；other 为 None 时视为全部变化"""
+        if other is None:
+            return {f.name for f in fields(self)}
+        return {f.name for f in fields(self) if getattr(self, f.name) != getattr(other, f.name)}
+
+
+def load_config():
+    """读取用户配置，config.conf 的 stat 签名不变时直接返回缓存的 AppConfig"""
+    global _CONFIG_CACHE
+    try:
+        st = os.stat(CONFIG_FILE)
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        signature = None
+    if _CONFIG_CACHE is not None and _CONFIG_CACHE[0] == signature:
+        return _CONFIG_CACHE[1]
+
+    defaults = AppConfig()
+    values = {}
     try:
         config = configparser.ConfigParser()
         config.read(CONFIG_FILE)
         if "General" in config:
-            mode = config["General"].get("colorMode", "dark").replace('"', "")
-            flavor = config["General"].get("flavor", "tonal-spot").replace('"', "")
-            wallpaper_folder = (
-                config["General"]
-                .get("wallpaperFolder", str(Path.home() / "Pictures"))
-                .replace('"', "")
-            )
+            general = config["General"]
+            values = {
+                "color_mode": general.get("colorMode", defaults.color_mode),
+                "flavor": general.get("flavor", defaults.flavor),
+                "wallpaper_folder": general.get("wallpaperFolder", defaults.wallpaper_folder),
+                "current_wallpaper": general.get("currentWallpaper", ""),
+            }
+            values = {k: v.replace('"', "") for k, v in values.items()}
+            values["recursive_scan"] = general.getboolean("recursiveScan", fallback=False)
+            values["rotation_interval"] = max(0, general.getint("rotationInterval", fallback=0))
+            values["rotation_shuffle"] = general.getboolean("rotationShuffle", fallback=False)
     except Exception as e:
         log.warning(f"Failed to read config: {e}")
-    return mode, flavor, wallpaper_folder
+    result = AppConfig(**values)
+    _CONFIG_CACHE = (signature, result)
+    return result
+
+
+def read_config():
+    """读取用户配置 (mode, flavor, wallpaper_folder)"""
+    config = load_config()
+    return config.color_mode, config.flavor, config.wallpaper_folder
+
+
+def update_config(values, section="General", on_write=None):
+    """
+    把 values 合并写入 config.conf，值没有变化时不写文件。
+    写入成功返回新文件的 stat 签名 (mtime_ns, size, inode)，未写入返回 None。
+    on_write(signature) 在新文件替换 config.conf 之前调用，
+    调用方可以在文件事件到达之前登记这次写入。
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    if not config.has_section(section):
+        config.add_section(section)
+    if all(config[section].get(k) == str(v) for k, v in values.items()):
+        return None
+    for key, value in values.items():
+        config[section][key] = str(value)
+    buf = io.StringIO()
+    config.write(buf)
+    signature = None
+
+    def before_replace(st):
+        nonlocal signature
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if on_write is not None:
+            on_write(signature)
+
+    cache.atomic_write(CONFIG_FILE, buf.getvalue(), before_replace=before_replace)
+    return signature
 
 
 def save_state(wallpaper_path):
-    """保存当前处理好的壁纸路径到缓存，供前端快速读取"""
-    try:
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        with open(STATE_FILE, "w") as f:
-            json.dump({"current_wallpaper": str(wallpaper_path)}, f)
-    except Exception as e:
-        log.warning(f"Failed to save state: {e}")
+    """保存当前处理好的壁纸路径，供前端快速读取"""
+    state.set_current_wallpaper(wallpaper_path)
 
 
 def get_cached_wallpaper():
     """尝试读取缓存的壁纸路径"""
-    try:
-        if STATE_FILE.exists():
-            with open(STATE_FILE, "r") as f:
-                data = json.load(f)
-                path = data.get("current_wallpaper", "")
-                if path and os.path.exists(path):
-                    return path
-    except:
-        pass
-    return None
+    return state.current_wallpaper()
+
+
+WALLPAPER_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".jxl", ".avif", ".heic", ".heif"}
+
+
+def list_wallpapers(folder):
+    """[通用] 列出文件夹中的壁纸 (不递归)，按路径排序"""
+    return sorted(
+        os.path.join(folder, f)
+        for f in os.listdir(folder)
+        if os.path.splitext(f)[1].lower() in WALLPAPER_EXTS
+    )
 
 
 def resolve_kde_wallpaper(path, mode="dark"):
-    """[KDE] 解析动态壁纸包"""
-    if not path or not os.path.isdir(path):
-        return path
-
-    search_paths = []
-    if mode == "dark":
-        search_paths.append(os.path.join(path, "contents", "images_dark"))
-    search_paths.append(os.path.join(path, "contents", "images"))
-    search_paths.append(path)
-
-    valid_exts = (".png", ".jpg", ".jpeg", ".webp", ".jxl", ".svg")
-    for p in search_paths:
-        if os.path.exists(p) and os.path.isdir(p):
-            try:
-                files = os.listdir(p)
-                images = [f for f in files if f.lower().endswith(valid_exts)]
-                if images:
-                    images.sort()
-                    return os.path.join(p, images[0])
-            except OSError:
-                continue
-    return path
+    """[KDE] 解析动态壁纸包，选取不小于取色尺寸的最小分辨率变体"""
+    return kde_wallpaper.resolve(path, mode, target=(proxy.PROXY_SIZE, proxy.PROXY_SIZE))
 
 
 def ensure_compatible_image(image_path):
-    """[通用] JXL 转换与缓存"""
-    if not image_path or not os.path.exists(image_path):
-        return image_path
-    if not image_path.lower().endswith(".jxl"):
-        return image_path
+    """[通用] JXL / AVIF / HEIC 解码与缓存"""
+    with metrics.span("decode"):
+        return image_cache.ensure_compatible(image_path)
 
-    if not shutil.which("djxl"):
-        log.warning("JXL wallpaper detected but 'djxl' not found.")
-        return image_path
 
-    try:
-        # 仅当源文件更新时才转换
-        if not TEMP_WALLPAPER.exists() or os.path.getmtime(
-            image_path
-        ) > os.path.getmtime(TEMP_WALLPAPER):
-            log.info(f"Converting JXL to PNG: {image_path}")
-            subprocess.run(["djxl", image_path, str(TEMP_WALLPAPER)], check=True)
-        return str(TEMP_WALLPAPER)
-    except Exception as e:
-        log.error(f"JXL conversion failed: {e}")
-        return image_path
+def wallpaper_for_apply(path, mode="dark"):
+    """[通用] 壁纸设置为 path 后，生成主题实际使用的图片 (壁纸包变体、解码后的 PNG)"""
+    return ensure_compatible_image(resolve_kde_wallpaper(path, mode))
 
 
 def get_current_wallpaper(mode="dark"):
@@ -411,7 +407,11 @@ def get_current_wallpaper(mode="dark"):
             raw_path = settings.get_string(key).replace("file://", "").strip("'")
 
         elif is_kde_session():
-            # 使用 python-dbus 替代外部命令
+            # 优先直接读取 appletsrc，读不到时才让 plasmashell 执行脚本
+            image = kde_wallpaper.read_appletsrc_wallpaper()
+            if image:
+                return wallpaper_for_apply(image, mode)
+
             import dbus
 
             bus = dbus.SessionBus()
@@ -439,89 +439,305 @@ def get_current_wallpaper(mode="dark"):
     return ensure_compatible_image(raw_path)
 
 
-def run_matugen(
-    image_path, mode, flavor, dry_run=False, config_path=MATUGEN_CONFIG_PATH
-):
-    """[通用] 运行 Matugen"""
-    if not image_path or not os.path.exists(image_path):
-        return None
+def get_matugen_version(matugen_bin=None):
+    """获取 matugen 版本字符串，按二进制路径 + mtime 缓存"""
+    matugen_bin = matugen_bin or get_matugen_command()
+    resolved = shutil.which(matugen_bin) or matugen_bin
+    try:
+        stamp = (resolved, os.stat(resolved).st_mtime_ns)
+    except OSError:
+        stamp = (resolved, 0)
+
+    version = _MATUGEN_VERSION_CACHE.get(stamp)
+    if version is None:
+        try:
+            res = subprocess.run(
+                [resolved, "--version"], capture_output=True, text=True, timeout=5
+            )
+            version = res.stdout.strip() or "unknown"
+        except Exception:
+            version = "unknown"
+        _MATUGEN_VERSION_CACHE[stamp] = version
+    return version
 
+
+def _config_digest(config_path):
+    """config.toml 内容哈希，按 mtime/size 缓存避免重复读取"""
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return "missing"
+    stamp = (str(config_path), st.st_mtime_ns, st.st_size)
+    digest = _CONFIG_DIGEST_CACHE.get(stamp)
+    if digest is None:
+        digest = cache.hash_file(config_path)
+        _CONFIG_DIGEST_CACHE.clear()
+        _CONFIG_DIGEST_CACHE[stamp] = digest
+    return digest
+
+
+def palette_cache_key(image_path, mode, flavor, config_path=MATUGEN_CONFIG_PATH):
+    """调色板缓存键，图片不存在时返回 None"""
+    fingerprint = image_cache.source_fingerprint(image_path)
+    if not fingerprint:
+        return None
     type_arg = f"scheme-{flavor}" if not flavor.startswith("scheme-") else flavor
+    raw = "\0".join(
+        (
+            fingerprint,
+            mode,
+            type_arg,
+            get_matugen_version(),
+            _config_digest(config_path),
+            # 代理图被判定不等价后改用原图取色，旧结果随之失效
+            "full" if proxy.is_excluded(fingerprint) else "proxy",
+        )
+    )
+    return cache.hash_bytes(raw)
+
+
+def _source_cache_key(fingerprint):
+    """图片源色缓存键：源色与模式、风格无关，只取决于图片和取色算法"""
+    raw = "\0".join(
+        (
+            fingerprint,
+            "source",
+            get_matugen_version(),
+            "full" if proxy.is_excluded(fingerprint) else "proxy",
+        )
+    )
+    return cache.hash_bytes(raw)
 
-    matugen_bin = get_matugen_command()
 
-    cmd = [
-        matugen_bin,
-        "image",
-        image_path,
-        "--config",
-        str(config_path),
-        "--mode",
-        mode,
-        "--type",
-        type_arg,
-    ]
+def get_cached_palette(image_path, mode, flavor, config_path=MATUGEN_CONFIG_PATH):
+    """
+    命中调色板缓存时返回 matugen 的 JSON 字符串，否则返回 None。
+    JSON 中同时包含深浅两套颜色，因此另一模式的缓存也可以直接换算使用。
+    """
+    for cached_mode in (mode, "light" if mode == "dark" else "dark"):
+        key = palette_cache_key(image_path, cached_mode, flavor, config_path)
+        if not key:
+            return None
+        data = PALETTE_CACHE.get(key)
+        if data is None:
+            continue
+        if cached_mode == mode:
+            return data.decode("utf-8")
+        try:
+            return json.dumps(render.palette_for_mode(json.loads(data), mode))
+        except (ValueError, render.TemplateError):
+            continue
+    return None
+
 
-    if dry_run:
-        cmd.extend(["--json", "hex", "--dry-run"])
+def get_cached_source(image_path):
+    """返回缓存中图片的源色 (#rrggbb)，未知时返回 None"""
+    fingerprint = image_cache.source_fingerprint(image_path)
+    if not fingerprint:
+        return None
+    data = PALETTE_CACHE.get(_source_cache_key(fingerprint))
+    return data.decode("utf-8") if data is not None else None
 
-    log.debug(f"Running Matugen: {' '.join(cmd)}")
 
+def store_palette(image_path, mode, flavor, json_str, config_path=MATUGEN_CONFIG_PATH):
+    """把 matugen 的 JSON 输出写入调色板缓存，并记录图片源色"""
+    if not json_str:
+        return
     try:
-        res = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        if dry_run:
-            log.debug(f"Matugen output: {res.stdout}")
-            return res.stdout
+        data = json.loads(json_str)
+    except ValueError:
+        log.warning("Matugen output is not valid JSON, not caching palette.")
+        return
+    key = palette_cache_key(image_path, mode, flavor, config_path)
+    if not key:
+        return
+    PALETTE_CACHE.put(key, json_str)
+
+    source = data.get("colors", {}).get("source_color")
+    if isinstance(source, dict):
+        source = source.get("default")
+    if isinstance(source, str) and source.startswith("#"):
+        PALETTE_CACHE.put(
+            _source_cache_key(image_cache.source_fingerprint(image_path)), source
+        )
+    else:
+        source = None
+    state.record_palette(key, image_path, mode, flavor, source)
 
-        # [KDE] Create MaterialYouAlt color scheme
-        if is_kde_session():
-            try:
-                colors_dir = Path.home() / ".local/share/color-schemes"
-                src = colors_dir / "MaterialYou.colors"
-                dst = colors_dir / "MaterialYouAlt.colors"
 
-                if src.exists():
-                    kde_type = "Dark" if mode == "dark" else "Light"
+def preview_palette(
+    image_path, mode, flavor, config_path=MATUGEN_CONFIG_PATH, cancel=None
+):
+    """
+    [预览] 获取调色板 JSON：
+    1. matugen 调色板缓存 (与最终应用结果完全一致)
+    2. 进程内取色引擎 (无需启动进程)
+    3. 退回 matugen --dry-run
+    cancel (threading.Event) 被设置后尽快返回 None，正在运行的 matugen 会被终止。
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None
+
+    cached = get_cached_palette(image_path, mode, flavor, config_path)
+    if cached is not None:
+        return cached
 
-                    # Update original MaterialYou.colors
-                    conf_src = configparser.ConfigParser(interpolation=None)
-                    conf_src.optionxform = str
-                    conf_src.read(src)
+    if cancel is not None and cancel.is_set():
+        return None
 
-                    if not conf_src.has_section("General"):
-                        conf_src.add_section("General")
+    if PREVIEW_ENGINE != "matugen":
+        try:
+            from backend import extractor
+        except ImportError:
+            import extractor
+
+        if extractor.is_available():
+            decoded = image_cache.ensure_compatible(image_path)
+            result = extractor.extract(proxy.get_proxy(decoded), mode, flavor)
+            if result:
+                return result
+        elif PREVIEW_ENGINE == "builtin":
+            log.warning("Built-in preview engine requires numpy and Pillow.")
+
+    if cancel is not None and cancel.is_set():
+        return None
+    return run_matugen(
+        image_path, mode, flavor, dry_run=True, config_path=config_path, cancel=cancel
+    )
 
-                    conf_src.set("General", "Type", kde_type)
 
-                    with open(src, "w") as f:
-                        conf_src.write(f, space_around_delimiters=False)
+def _run_matugen_cmd(cmd, cancel=None):
+    """
+    运行 matugen 命令，成功返回 stdout，失败记录日志并返回 None。
+    cancel (threading.Event) 被设置时终止子进程并返回 None。
+    """
+    log.debug("Running Matugen: %s", cmd)
+    with subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    ) as proc:
+        while True:
+            try:
+                stdout, stderr = proc.communicate(
+                    timeout=None if cancel is None else 0.05
+                )
+                break
+            except subprocess.TimeoutExpired:
+                if cancel.is_set():
+                    proc.kill()
+                    proc.communicate()
+                    log.debug("Matugen cancelled")
+                    return None
+    if proc.returncode != 0:
+        log.error(f"Matugen failed with code {proc.returncode}")
+        log.error(f"STDERR: {stderr}")
+        if stdout:
+            log.error(f"STDOUT: {stdout}")
+        return None
+    return stdout
 
-                    # Create MaterialYouAlt
-                    shutil.copy(src, dst)
 
-                    conf = configparser.ConfigParser(interpolation=None)
-                    conf.optionxform = str
-                    conf.read(dst)
+def _extract_palette(image_path, mode, type_arg, config_path, use_proxy, cancel=None):
+    """
+    获取调色板 JSON (不写任何文件)：
+    缓存 -> 已知源色时 `matugen color` (无需解码图片) -> `matugen image` 取色
+    """
+    flavor = type_arg[len("scheme-"):]
+    common = ["--config", str(config_path), "--mode", mode, "--type", type_arg]
+    common += ["--json", "hex", "--dry-run"]
+    matugen_bin = get_matugen_command()
 
-                    if not conf.has_section("General"):
-                        conf.add_section("General")
+    if use_proxy:
+        cached = get_cached_palette(image_path, mode, flavor, config_path)
+        if cached is not None:
+            log.debug("Palette cache hit: %s (%s, %s)", image_path, mode, flavor)
+            return cached
 
-                    conf.set("General", "ColorScheme", "MaterialYouAlt")
-                    conf.set("General", "Name", "MaterialYouAlt")
+        source = get_cached_source(image_path)
+        if source:
+            output = _run_matugen_cmd(
+                [matugen_bin, "color", "hex", source] + common, cancel
+            )
+            if output:
+                store_palette(image_path, mode, flavor, output, config_path)
+                return output
 
-                    with open(dst, "w") as f:
-                        conf.write(f, space_around_delimiters=False)
+    decoded = image_cache.ensure_compatible(image_path)
+    source_path = proxy.get_proxy(decoded) if use_proxy else decoded
+    output = _run_matugen_cmd([matugen_bin, "image", source_path] + common, cancel)
+    if output:
+        log.debug("Matugen output: %d bytes", len(output))
+        if use_proxy:
+            store_palette(image_path, mode, flavor, output, config_path)
+    return output
 
-                    log.info(
-                        "Updated MaterialYou.colors and created MaterialYouAlt.colors for KDE"
-                    )
-            except Exception as e:
-                log.error(f"Failed to create MaterialYouAlt: {e}")
 
-        return True
-    except subprocess.CalledProcessError as e:
-        log.error(f"Matugen failed with code {e.returncode}")
-        log.error(f"STDERR: {e.stderr}")
-        if e.stdout:
-            log.error(f"STDOUT: {e.stdout}")
+def run_matugen(
+    image_path,
+    mode,
+    flavor,
+    dry_run=False,
+    config_path=MATUGEN_CONFIG_PATH,
+    use_proxy=True,
+    cancel=None,
+):
+    """
+    [通用] 运行 Matugen
+    dry_run 时只返回调色板 JSON，从缩略代理图取色 (见 proxy.py)；
+    use_proxy=False 时直接读取原图且不使用缓存。
+    应用主题时优先用调色板在进程内渲染模板 (见 render.py)，
+    模板不受支持时才让 matugen 完整运行一遍；返回 render.RenderSummary，失败返回 None。
+    cancel (threading.Event) 被设置时终止 matugen 并返回 None。
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None
+
+    type_arg = f"scheme-{flavor}" if not flavor.startswith("scheme-") else flavor
+
+    with metrics.span("extract"):
+        palette = _extract_palette(
+            image_path, mode, type_arg, config_path, use_proxy, cancel
+        )
+    if dry_run:
+        return palette
+    if cancel is not None and cancel.is_set():
         return None
+
+    summary = None
+    if palette:
+        try:
+            summary = render.render_outputs(
+                json.loads(palette), image_path, mode, config_path
+            )
+        except ValueError:
+            summary = None
+
+    if summary is None:
+        cmd = [
+            get_matugen_command(),
+            "image",
+            image_cache.ensure_compatible(image_path),
+            "--config",
+            str(config_path),
+            "--mode",
+            mode,
+            "--type",
+            type_arg,
+            "--json",
+            "hex",
+        ]
+        with metrics.span("matugen"):
+            output = _run_matugen_cmd(cmd)
+        if output is None:
+            return None
+        # 这里是 matugen 对原图的完整运行，结果与代理图取色不等价，不写入调色板缓存
+
+        # matugen 只写出了 MaterialYou.colors，补上 Type / Alt / kdeglobals
+        with metrics.span("kde_colors"):
+            kde_colors.update_from_file(mode)
+        summary = render.RenderSummary(full_run=True)
+
+    return summary
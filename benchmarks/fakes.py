@@ -0,0 +1,124 @@
+"""
+基准测试用的 gi (Gio / GLib) 与 dbus 替身，只实现引擎用到的接口。
+install() 把它们注册到 sys.modules，
+之后 `import gi` / `import dbus` 得到的都是替身。
+"""
+import sys
+import types
+
+
+class Settings:
+    """内存中的 Gio.Settings，同一 schema 的实例共享数据"""
+
+    _stores = {}
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.values = Settings._stores.setdefault(schema, {})
+        self._handlers = []
+
+    @classmethod
+    def new(cls, schema):
+        return cls(schema)
+
+    def get_string(self, key):
+        return self.values.get(key, "")
+
+    def set_string(self, key, value):
+        changed = self.values.get(key) != value
+        self.values[key] = value
+        if changed:
+            for signal, callback in list(self._handlers):
+                if signal in ("changed", f"changed::{key}"):
+                    callback(self, key)
+        return True
+
+    def connect(self, signal, callback):
+        self._handlers.append((signal, callback))
+        return len(self._handlers)
+
+
+class _FileMonitor:
+    def connect(self, signal, callback):
+        return 1
+
+
+class _File:
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def new_for_path(cls, path):
+        return cls(path)
+
+    def monitor_file(self, flags, cancellable):
+        return _FileMonitor()
+
+
+class _MainLoop:
+    def run(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def _idle_add(callback, *args):
+    # 没有主循环，直接同步执行
+    callback(*args)
+    return 0
+
+
+def _make_gi():
+    gio = types.ModuleType("gi.repository.Gio")
+    gio.Settings = Settings
+    gio.File = _File
+    gio.FileMonitorFlags = types.SimpleNamespace(NONE=0)
+    gio.FileMonitorEvent = types.SimpleNamespace(CHANGES_DONE_HINT=1, CHANGED=0)
+
+    glib = types.ModuleType("gi.repository.GLib")
+    glib.MainLoop = _MainLoop
+    glib.idle_add = _idle_add
+
+    repository = types.ModuleType("gi.repository")
+    repository.Gio = gio
+    repository.GLib = glib
+
+    gi = types.ModuleType("gi")
+    gi.require_version = lambda namespace, version: None
+    gi.repository = repository
+    return {
+        "gi": gi,
+        "gi.repository": repository,
+        "gi.repository.Gio": gio,
+        "gi.repository.GLib": glib,
+    }
+
+
+class _PlasmaShell:
+    """evaluateScript 返回 wallpaper 属性 (由基准测试设置)"""
+
+    wallpaper = ""
+
+    def evaluateScript(self, script):
+        return self.wallpaper
+
+
+class _SessionBus:
+    def get_object(self, name, path):
+        return types.SimpleNamespace(name=name, path=path)
+
+
+def _make_dbus():
+    dbus = types.ModuleType("dbus")
+    dbus.SessionBus = _SessionBus
+    dbus.Interface = lambda obj, interface: plasma
+    return {"dbus": dbus}
+
+
+plasma = _PlasmaShell()
+
+
+def install():
+    sys.modules.update(_make_gi())
+    sys.modules.update(_make_dbus())
@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+端到端基准测试 (无需桌面环境)。
+
+所有数据都放在临时 HOME 中，matugen 使用 stub_matugen.py
+(系统中有真正的 matugen 时额外测一组)，GNOME 的 Gio/GLib 与 KDE 的 DBus 使用 fakes.py 中的替身。
+
+    python benchmarks/run.py                  # 运行并与 benchmarks/baseline.json 比较
+    python benchmarks/run.py --save-baseline  # 把本次结果保存为基线
+    python benchmarks/run.py --quick -k kde   # 少量重复，只运行名称包含 kde 的项目
+
+结果写入 benchmarks/results/latest.json；
+相对基线的中位数变慢超过 --threshold 时以状态 1 退出。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BENCH_DIR.parent
+RESULTS_FILE = BENCH_DIR / "results" / "latest.json"
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+# 低于这个差值 (毫秒) 的变化视为噪声
+NOISE_FLOOR_MS = 1.0
+
+REAL_MATUGEN = shutil.which("matugen")
+
+
+def _setup_environment(root):
+    """在导入 backend 之前调用：backend 的各个路径在导入时由 HOME 决定"""
+    home = root / "home"
+    bin_dir = root / "bin"
+    runtime = root / "run"
+    for d in (home, bin_dir, runtime):
+        d.mkdir(parents=True, exist_ok=True)
+    runtime.chmod(0o700)
+
+    _write_script(
+        bin_dir / "matugen",
+        f'exec "{sys.executable}" "{BENCH_DIR / "stub_matugen.py"}" "$@"',
+    )
+    # KDE 刷新命令与 JXL 解码器 (测试用的 .jxl 文件内容其实是 PNG)
+    _write_script(bin_dir / "plasma-apply-colorscheme", "exit 0")
+    _write_script(bin_dir / "djxl", 'cp "$1" "$2"')
+
+    os.environ.update(
+        {
+            "HOME": str(home),
+            "XDG_RUNTIME_DIR": str(runtime),
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "XDG_CURRENT_DESKTOP": "GNOME",
+            "MATERIALYOU_LOG_LEVEL": "WARNING",
+        }
+    )
+    for key in (
+        "XDG_SESSION_DESKTOP", "DESKTOP_SESSION", "GDMSESSION", "KDE_FULL_SESSION",
+        "XDG_CACHE_HOME",
+    ):
+        os.environ.pop(key, None)
+    return home
+
+
+def _write_script(path, body):
+    path.write_text(f"#!/bin/sh\n{body}\n")
+    path.chmod(0o755)
+
+
+def write_png(path, width, height, seed=0):
+    """不依赖 Pillow 生成一张渐变 PNG"""
+    base = bytearray(width * 3)
+    base[0::3] = bytes((x * 255 // width + seed) % 256 for x in range(width))
+    base[2::3] = bytes([seed % 256]) * width
+    rows = []
+    for y in range(height):
+        row = bytearray(base)
+        row[1::3] = bytes([y * 255 // height]) * width
+        rows.append(b"\0" + row)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", header))
+        f.write(_png_chunk(b"IDAT", zlib.compress(b"".join(rows), 1)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def _png_chunk(kind, data):
+    body = kind + data
+    return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+
+class Suite:
+    def __init__(self, quick=False, pattern=None):
+        self.quick = quick
+        self.pattern = pattern
+        self.results = {}
+
+    def run(self, name, func, prepare=None, repeat=20, warmup=1):
+        """prepare() 在每次计时前调用且不计入耗时"""
+        if self.pattern and self.pattern not in name:
+            return
+        if self.quick:
+            repeat = max(3, repeat // 4)
+        for _ in range(warmup):
+            if prepare:
+                prepare()
+            func()
+        timings = []
+        for _ in range(repeat):
+            if prepare:
+                prepare()
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        result = {
+            "runs": repeat,
+            "median_ms": round(statistics.median(timings), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "min_ms": round(timings[0], 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        }
+        self.results[name] = result
+        print(
+            f"  {name:<40} median {result['median_ms']:>10.3f} ms"
+            f"   min {result['min_ms']:>10.3f} ms"
+        )
+
+    def skip(self, name, reason):
+        if not self.pattern or self.pattern in name:
+            print(f"  {name:<40} skipped ({reason})")
+
+
+def _alternating(values):
+    """每次调用依次返回下一个值"""
+    state = {"i": -1}
+
+    def next_value():
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+
+    return next_value
+
+
+def bench_matugen(suite, utils, images):
+    img = images["large"]
+    suite.run(
+        "run_matugen.extract.cold",
+        lambda: utils.run_matugen(img, "dark", "tonal-spot", dry_run=True, use_proxy=False),
+        repeat=10,
+    )
+    utils.run_matugen(img, "dark", "tonal-spot", dry_run=True)
+    suite.run(
+        "run_matugen.extract.cached",
+        lambda: utils.run_matugen(img, "dark", "tonal-spot", dry_run=True),
+        repeat=50,
+    )
+
+    # 完整应用：两张壁纸交替，保证每次都有输出需要重写 (调色板已缓存)
+    walls = _alternating([images["large"], images["small"]])
+    for wall in (images["large"], images["small"]):
+        utils.run_matugen(wall, "dark", "tonal-spot", dry_run=True)
+    suite.run(
+        "run_matugen.apply",
+        lambda: utils.run_matugen(walls(), "dark", "tonal-spot"),
+        repeat=10,
+    )
+    suite.run(
+        "run_matugen.apply.unchanged",
+        lambda: utils.run_matugen(img, "dark", "tonal-spot"),
+        prepare=lambda: utils.run_matugen(img, "dark", "tonal-spot"),
+        repeat=10,
+    )
+
+    if not REAL_MATUGEN:
+        suite.skip("run_matugen.extract.real", "matugen not installed")
+        return
+    stub_path = os.environ["PATH"]
+
+    def real():
+        os.environ["PATH"] = os.pathsep.join(stub_path.split(os.pathsep)[1:])
+        try:
+            utils.run_matugen(img, "dark", "tonal-spot", dry_run=True, use_proxy=False)
+        finally:
+            os.environ["PATH"] = stub_path
+
+    suite.run("run_matugen.extract.real", real, repeat=5)
+
+
+def bench_images(suite, utils, image_cache, cache, images):
+    jpeg = images["large"]
+    suite.run(
+        "ensure_compatible_image.passthrough",
+        lambda: utils.ensure_compatible_image(jpeg),
+        repeat=200,
+    )
+
+    jxl = images["jxl"]
+
+    def drop_decoded():
+        fingerprint = cache.file_fingerprint(jxl)
+        if fingerprint:
+            image_cache.DECODED_CACHE.discard(fingerprint)
+
+    suite.run(
+        "ensure_compatible_image.jxl.cold",
+        lambda: utils.ensure_compatible_image(jxl),
+        prepare=drop_decoded,
+        repeat=10,
+    )
+    suite.run(
+        "ensure_compatible_image.jxl.cached",
+        lambda: utils.ensure_compatible_image(jxl),
+        repeat=200,
+    )
+
+
+def bench_thumbnails(suite, thumbnails, images):
+    if not thumbnails.is_available():
+        suite.skip("thumbnails", "Pillow not installed")
+        return
+    img = images["large"]
+
+    def drop_thumbnail():
+        thumbnails.thumbnail_path(thumbnails.file_uri(img)).unlink(missing_ok=True)
+
+    suite.run(
+        "thumbnails.generate",
+        lambda: thumbnails.generate(img),
+        prepare=drop_thumbnail,
+        repeat=10,
+    )
+    suite.run("thumbnails.lookup", lambda: thumbnails.lookup(img), repeat=200)
+
+
+def bench_color_index(suite, color_index):
+    index = color_index.ColorIndex()
+    rng = random.Random(4)
+    for i in range(10000):
+        index._entries[f"/wallpapers/{i:05d}.jpg"] = color_index.color_entry(
+            "#%06x" % rng.randrange(1 << 24)
+        )
+    paths = sorted(index._entries)
+    suite.run(
+        "color_index.nearest.10000",
+        lambda: index.nearest("#336699", k=48, paths=paths),
+        repeat=50,
+    )
+    suite.run("color_index.sort_hue.10000", lambda: index.sort(paths, "hue"), repeat=20)
+
+
+def _make_wallpaper_package(root, name, named_variants):
+    """生成 contents/images(_dark) 中带多个分辨率变体的壁纸包"""
+    package = root / name
+    sizes = [
+        (640, 480),
+        (1280, 720),
+        (1920, 1080),
+        (2560, 1440),
+        (3840, 2160),
+        (5120, 2880),
+    ]
+    for sub in ("images", "images_dark"):
+        directory = package / "contents" / sub
+        directory.mkdir(parents=True, exist_ok=True)
+        for w, h in sizes:
+            if named_variants:
+                (directory / f"{w}x{h}.png").write_bytes(b"")
+            else:
+                # 文件名没有分辨率，只能读取文件头 (只写入 PNG 头部即可)
+                header = struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)
+                (directory / f"variant-{w}.png").write_bytes(
+                    b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+                )
+    return str(package)
+
+
+def bench_kde_wallpaper(suite, utils, kde_wallpaper, root):
+    for label, named in (("named", True), ("headers", False)):
+        package = _make_wallpaper_package(root, f"pkg-{label}", named)
+        suite.run(
+            f"resolve_kde_wallpaper.{label}.cold",
+            lambda: utils.resolve_kde_wallpaper(package, "dark"),
+            prepare=kde_wallpaper._INDEX.clear,
+            repeat=50,
+        )
+        suite.run(
+            f"resolve_kde_wallpaper.{label}.cached",
+            lambda: utils.resolve_kde_wallpaper(package, "dark"),
+            repeat=200,
+        )
+
+
+def bench_config(suite, utils):
+    utils.update_config({"colorMode": "dark", "flavor": "tonal-spot"})
+
+    def drop_cache():
+        utils._CONFIG_CACHE = None
+
+    suite.run("read_config.cold", utils.read_config, prepare=drop_cache, repeat=200)
+    suite.run("read_config.cached", utils.read_config, repeat=500)
+
+
+def bench_scan(suite, utils, root):
+    counts = (10, 1000) if suite.quick else (10, 1000, 10000)
+    exts = (".jpg", ".png", ".webp", ".txt")
+    for count in counts:
+        folder = root / f"scan-{count}"
+        folder.mkdir(exist_ok=True)
+        for i in range(count):
+            (folder / f"wall-{i:05d}{exts[i % len(exts)]}").touch()
+        suite.run(
+            f"scan_wallpapers.{count}",
+            lambda folder=str(folder): utils.list_wallpapers(folder),
+            repeat=20 if count < 10000 else 5,
+        )
+
+
+def _use_desktop(utils, name):
+    os.environ["XDG_CURRENT_DESKTOP"] = name
+    utils.get_desktop_env(force_refresh=True)
+
+
+def bench_gnome(suite, utils, bridge, fakes, images):
+    _use_desktop(utils, "GNOME")
+    engine = bridge.GnomeEngine()
+    background = fakes.Settings.new("org.gnome.desktop.background")
+    walls = _alternating([images["large"], images["small"]])
+
+    def cycle():
+        uri = "file://" + walls()
+        background.set_string("picture-uri", uri)
+        background.set_string("picture-uri-dark", uri)
+        # 直接调用调度器的任务，不计入去抖延迟
+        engine.update({"mode": "dark", "wallpaper": uri})
+
+    suite.run("engine.gnome.update", cycle, repeat=10)
+
+
+def bench_rotation(suite, utils, bridge, root, images):
+    """轮换切换：使用预热时渲染好的输出 vs. 切换时才渲染 (调色板均已缓存)"""
+    _use_desktop(utils, "GNOME")
+    folder = root / "rotation"
+    folder.mkdir(exist_ok=True)
+    for i, name in enumerate(("large", "small")):
+        shutil.copy(images[name], folder / f"wall-{i}.png")
+    utils.update_config({"wallpaperFolder": str(folder), "rotationInterval": 30})
+    engine = bridge.GnomeEngine()
+    rotation = engine.rotation
+    # 壁纸列表由后台扫描得到
+    deadline = time.monotonic() + 10
+    while not rotation.playlist(utils.load_config()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    def switch():
+        engine.run_rotation(rotation.upcoming(utils.load_config(), 1)[0])
+
+    suite.run(
+        "rotation.switch.prewarmed",
+        switch,
+        prepare=lambda: rotation._prewarm(utils.load_config()),
+        repeat=10,
+    )
+    suite.run("rotation.switch.cold", switch, prepare=rotation._staged.clear, repeat=10)
+    utils.update_config({"rotationInterval": 0})
+
+
+def bench_kde(suite, utils, bridge, kde_wallpaper, images):
+    _use_desktop(utils, "KDE")
+    appletsrc = Path(kde_wallpaper.APPLETSRC)
+    appletsrc.parent.mkdir(parents=True, exist_ok=True)
+    engine = bridge.KdeEngine()
+    walls = _alternating([images["large"], images["small"]])
+
+    def cycle():
+        appletsrc.write_text(
+            "[Containments][1]\nactivityId=bench\nlastScreen=0\n\n"
+            "[Containments][1][Wallpaper][org.kde.image][General]\n"
+            f"Image=file://{walls()}\n"
+        )
+        engine.check({"wallpaper": True})
+
+    # refresh_ui 中包含固定的 0.5 秒等待
+    suite.run("engine.kde.check", cycle, repeat=6)
+
+
+def _prepare_matugen_config(utils):
+    """释放默认配置，并把 hook 换成 `true`：保留 hook 调度开销，但不触碰真实的应用"""
+    utils.init_resources()
+    config = utils.MATUGEN_CONFIG_PATH
+    lines = []
+    for line in config.read_text().splitlines():
+        key = line.split("=", 1)[0].strip()
+        if key in ("post_hook", "pre_hook"):
+            line = f"{key} = 'true'"
+        lines.append(line)
+    config.write_text("\n".join(lines) + "\n")
+
+
+def collect(args, root):
+    home = _setup_environment(root)
+    sys.path.insert(0, str(PROJECT_DIR))
+    sys.path.insert(0, str(BENCH_DIR))
+
+    import fakes
+
+    fakes.install()
+
+    from backend import (
+        bridge, cache, color_index, image_cache, kde_wallpaper, thumbnails, utils,
+    )
+
+    _prepare_matugen_config(utils)
+
+    data = root / "data"
+    data.mkdir()
+    images = {
+        "large": str(data / "large.png"),
+        "small": str(data / "small.png"),
+        "jxl": str(data / "photo.jxl"),
+    }
+    write_png(images["large"], 1920, 1080, seed=1)
+    write_png(images["small"], 640, 360, seed=2)
+    write_png(images["jxl"], 1920, 1080, seed=3)
+
+    suite = Suite(quick=args.quick, pattern=args.filter)
+    print(f"Benchmarking in {home}")
+    bench_matugen(suite, utils, images)
+    bench_images(suite, utils, image_cache, cache, images)
+    bench_thumbnails(suite, thumbnails, images)
+    bench_kde_wallpaper(suite, utils, kde_wallpaper, data)
+    bench_config(suite, utils)
+    bench_scan(suite, utils, data)
+    bench_color_index(suite, color_index)
+    bench_gnome(suite, utils, bridge, fakes, images)
+    bench_rotation(suite, utils, bridge, data, images)
+    bench_kde(suite, utils, bridge, kde_wallpaper, images)
+    return suite.results
+
+
+def _git_revision():
+    try:
+        res = subprocess.run(
+            ["git", "-C", str(PROJECT_DIR), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+        )
+        return res.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, results, threshold):
+    """打印与基线的对比，返回变慢的项目列表"""
+    base = baseline.get("benchmarks", {})
+    regressions = []
+    print(f"\nCompared with baseline {baseline.get('meta', {}).get('revision') or '?'}:")
+    for name, current in results.items():
+        old = base.get(name)
+        if not old:
+            print(f"  {name:<40} (new)")
+            continue
+        ratio = current["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        delta = current["median_ms"] - old["median_ms"]
+        flag = ""
+        if ratio > 1 + threshold and delta > NOISE_FLOOR_MS:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold and -delta > NOISE_FLOOR_MS:
+            flag = "  faster"
+        print(
+            f"  {name:<40} {old['median_ms']:>10.3f} -> {current['median_ms']:>10.3f} ms"
+            f" ({ratio:5.2f}x){flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Material You Autothemer benchmarks")
+    parser.add_argument(
+        "--quick", action="store_true", help="fewer repetitions, skip the 10k-file scan"
+    )
+    parser.add_argument(
+        "-k", "--filter", help="only run benchmarks whose name contains this"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=RESULTS_FILE, help="where to write the JSON results"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=BASELINE_FILE, help="baseline JSON to compare against"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store these results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="relative slowdown reported as a regression (default 0.15)",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the temporary HOME for inspection"
+    )
+    args = parser.parse_args(argv)
+
+    root = Path(tempfile.mkdtemp(prefix="materialyou-bench-"))
+    try:
+        results = collect(args, root)
+    finally:
+        if args.keep:
+            print(f"Kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "real_matugen": REAL_MATUGEN,
+        },
+        "benchmarks": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("No baseline yet; run with --save-baseline to create one.")
+        return 0
+    regressions = compare(json.loads(args.baseline.read_text()), results, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+确定性的 matugen 替身，只支持本项目用到的调用方式：
+    matugen image <path> ... --mode <m> --type <t> --json hex [--dry-run]
+    matugen color hex <#rrggbb> ...
+    matugen --version
+源色取自图片内容的哈希 (会完整读取文件)，
+调色板由 backend.hct 计算，结果可复现。
+"""
+import hashlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import hct  # noqa: E402
+
+
+def main(argv):
+    if "--version" in argv:
+        print("matugen 0.0.0-benchmark-stub")
+        return 0
+    mode = argv[argv.index("--mode") + 1]
+    flavor = argv[argv.index("--type") + 1]
+    if argv[0] == "color":
+        source = hct.argb_from_hex(argv[2])
+        image = None
+    else:
+        image = argv[1]
+        with open(image, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        source = 0xFF000000 | int(digest[:6], 16)
+    data = hct.scheme_colors(source, flavor, mode)
+    data["image"] = image
+    print(json.dumps(data))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -76,6 +76,27 @@ def build_binaries():
         "--hidden-import=backend.utils",
         "--hidden-import=backend.logger",
         "--hidden-import=backend.bridge",
+        "--hidden-import=backend.cache",
+        "--hidden-import=backend.hct",
+        "--hidden-import=backend.extractor",
+        "--hidden-import=backend.proxy",
+        "--hidden-import=backend.render",
+        "--hidden-import=backend.hooks",
+        "--hidden-import=backend.kde_colors",
+        "--hidden-import=backend.image_cache",
+        "--hidden-import=backend.kde_wallpaper",
+        "--hidden-import=backend.desktop",
+        "--hidden-import=backend.inotify",
+        "--hidden-import=backend.scheduler",
+        "--hidden-import=backend.state",
+        "--hidden-import=backend.metrics",
+        "--hidden-import=backend.ipc",
+        "--hidden-import=backend.preview_pool",
+        "--hidden-import=backend.library",
+        "--hidden-import=backend.thumbnails",
+        "--hidden-import=backend.precompute",
+        "--hidden-import=backend.color_index",
+        "--hidden-import=backend.rotation",
         "--hidden-import=dbus",
         "--hidden-import=_dbus_bindings",
         "--hidden-import=_dbus_glib_bindings",
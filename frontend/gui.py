@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import multiprocessing
 import os
 import signal
 import sys
@@ -12,7 +13,7 @@ if not getattr(sys, "frozen", False):
         sys.path.insert(0, project_root)
 
 try:
-    from backend import utils
+    from backend import color_index, ipc, library, preview_pool, state, thumbnails, utils
     from backend.bridge import GnomeEngine, KdeEngine
     from backend.logger import log
 except ImportError:
@@ -26,40 +27,188 @@ def run_gui():
     """
     # Lazy import PySide6 to avoid overhead in service mode
     try:
-        from PySide6.QtCore import Property, QObject, QThread, QUrl, Signal, Slot
+        from PySide6.QtCore import (
+            Property,
+            QAbstractListModel,
+            QModelIndex,
+            QObject,
+            QThreadPool,
+            QUrl,
+            Qt,
+            Signal,
+            Slot,
+        )
+        from PySide6.QtGui import QImage, QImageReader
         from PySide6.QtQml import QQmlApplicationEngine
+        from PySide6.QtQuick import (
+            QQuickAsyncImageProvider,
+            QQuickImageResponse,
+            QQuickTextureFactory,
+        )
         from PySide6.QtWidgets import QApplication
     except ImportError:
         log.error("PySide6 not found. Cannot start GUI.")
         sys.exit(1)
 
-    import configparser
+    import bisect
     import json
+    import queue
+    import threading
+    from urllib.parse import unquote
 
     # Ensure configuration files exist in ~/.config
     utils.init_resources()
 
     APP_NAME = "MaterialYou-Autothemer"
     MATUGEN_CONFIG = utils.MATUGEN_CONFIG_PATH
-    CONFIG_FILE = utils.CONFIG_FILE
 
-    class PreviewWorker(QThread):
-        resultReady = Signal(str)
-
-        def __init__(self, wallpaper, mode, flavor):
-            super().__init__()
-            self.args = (wallpaper, mode, flavor)
-
-        def run(self):
-            # 调用 utils 中的通用方法
-            json_str = utils.run_matugen(
-                self.args[0],
-                self.args[1],
-                self.args[2],
-                dry_run=True,
-                config_path=MATUGEN_CONFIG,
+    # 预取选中壁纸前后各 PREFETCH_RADIUS 张
+    PREFETCH_RADIUS = 2
+    # 按颜色查找时显示的壁纸数
+    SIMILAR_LIMIT = 48
+
+    def compute_preview(wallpaper, mode, flavor, cancel):
+        """在预览线程池中执行"""
+        # 优先让后台服务计算 (缓存已预热)，服务未运行时在本进程中计算
+        try:
+            return ipc.request(
+                "preview", timeout=30, cancel=cancel, path=wallpaper, mode=mode, flavor=flavor
             )
-            self.resultReady.emit(json_str if json_str else "{}")
+        except InterruptedError:
+            # 任务已被取消；连接关闭后服务端也会停止计算
+            return None
+        except (OSError, RuntimeError, ValueError) as e:
+            log.debug(f"Service preview unavailable, computing locally: {e}")
+        # 缓存 -> 进程内取色 -> matugen (取消时终止 matugen)
+        return utils.preview_palette(
+            wallpaper, mode, flavor, config_path=MATUGEN_CONFIG, cancel=cancel
+        )
+
+    class ThumbnailResponse(QQuickImageResponse):
+        def __init__(self, path, requested_size):
+            super().__init__()
+            self._path = path
+            self._requested_size = requested_size
+            self._image = QImage()
+            self._future = None
+            self._cancelled = False
+
+        def textureFactory(self):
+            return QQuickTextureFactory.textureFactoryForImage(self._image)
+
+        def cancel(self):
+            # 委托滚出视野时由 QML 调用，之后响应对象会被删除；尚未开始的生成任务随之取消
+            self._cancelled = True
+            if self._future is not None:
+                self._future.cancel()
+
+        def start(self, future):
+            self._future = future
+            future.add_done_callback(self._on_done)
+
+        def _on_done(self, future):
+            if self._cancelled:
+                return
+            thumb = future.result()
+            if thumb:
+                self._image = QImage(thumb)
+                self.finished.emit()
+            else:
+                # 无法生成缩略图 (例如缺少 Pillow)：由 Qt 按目标尺寸解码原图
+                QThreadPool.globalInstance().start(self._read_original)
+
+        def _read_original(self):
+            reader = QImageReader(self._path)
+            reader.setAutoTransform(True)
+            size = reader.size()
+            if size.isValid() and self._requested_size.isValid():
+                reader.setScaledSize(
+                    size.scaled(self._requested_size, Qt.KeepAspectRatioByExpanding)
+                )
+            self._image = reader.read()
+            if not self._cancelled:
+                self.finished.emit()
+
+    class ThumbnailProvider(QQuickAsyncImageProvider):
+        """image://thumbnails/<URL 编码的路径>，缩略图与文件管理器共享"""
+
+        def __init__(self):
+            super().__init__()
+            self.thumbnailer = thumbnails.Thumbnailer()
+
+        def requestImageResponse(self, image_id, requested_size):
+            path = unquote(image_id)
+            pixels = max(requested_size.width(), requested_size.height(), 1)
+            response = ThumbnailResponse(path, requested_size)
+            response.start(self.thumbnailer.request(path, thumbnails.size_for(pixels)))
+            return response
+
+    class WallpaperModel(QAbstractListModel):
+        """网格中的壁纸列表；扫描结果以插入 / 删除行的方式更新，不重建整个网格"""
+
+        PathRole = Qt.UserRole + 1
+
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self.paths = []
+
+        def rowCount(self, parent=QModelIndex()):
+            return 0 if parent.isValid() else len(self.paths)
+
+        def data(self, index, role=Qt.DisplayRole):
+            if index.isValid() and role in (self.PathRole, Qt.DisplayRole):
+                return self.paths[index.row()]
+            return None
+
+        def roleNames(self):
+            return {self.PathRole: b"path"}
+
+        @Slot(str, result=int)
+        def indexOf(self, path):
+            """供网格同步键盘光标；不在列表中时返回 -1"""
+            try:
+                return self.paths.index(path)
+            except ValueError:
+                return -1
+
+        def reset(self, paths):
+            self.beginResetModel()
+            self.paths = list(paths)
+            self.endResetModel()
+
+        def insert_sorted(self, paths):
+            """把 paths 插入按路径排序的列表，落在同一位置的新条目合并为一次插入"""
+            runs = []  # [位置, [路径]]
+            for path in sorted(paths):
+                pos = bisect.bisect_left(self.paths, path)
+                if runs and runs[-1][0] == pos:
+                    runs[-1][1].append(path)
+                else:
+                    runs.append([pos, [path]])
+            # 从后往前插入，前面的位置保持有效
+            for pos, run in reversed(runs):
+                self.beginInsertRows(QModelIndex(), pos, pos + len(run) - 1)
+                self.paths[pos:pos] = run
+                self.endInsertRows()
+
+        def append(self, paths):
+            if paths:
+                first = len(self.paths)
+                self.beginInsertRows(QModelIndex(), first, first + len(paths) - 1)
+                self.paths.extend(paths)
+                self.endInsertRows()
+
+        def remove(self, paths):
+            gone = set(paths)
+            rows = [i for i, p in enumerate(self.paths) if p in gone]
+            # 连续的行合并为一次删除，从后往前
+            while rows:
+                last = first = rows.pop()
+                while rows and rows[-1] == first - 1:
+                    first = rows.pop()
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.paths[first:last + 1]
+                self.endRemoveRows()
 
     class Backend(QObject):
         def __init__(self, parent=None):
@@ -68,11 +217,33 @@ def run_gui():
             self._flavor = "tonal-spot"
             self._preview_colors = []
             self._wallpaper_folder = str(Path.home() / "Pictures")
-            self._wallpaper_list = []
+            self._library = set()  # 扫描结果
+            # 网格中显示的列表 (可能按颜色排序或筛选)；_name_view 表示其中是按路径排序的全部壁纸
+            self.wallpaper_model = WallpaperModel(self)
+            self._name_view = True
+            self._color_sort = "name"
+            self._color_query = ""
+            self._recursive_scan = False
+            self._scanner = None
+            self._scan_id = 0
             self._current_wallpaper = ""
             self._preview_theme = {}
-
-            self.worker = None
+            # 最近应用过的壁纸 (来自状态数据库)
+            self._history = self._load_history()
+
+            # 结果从线程池经 previewReady 信号回到主线程
+            self.previewReady.connect(self.on_preview_ready)
+            self.libraryAdded.connect(self.on_library_added)
+            self.libraryRemoved.connect(self.on_library_removed)
+            self.colorIndexChanged.connect(self.update_view)
+            # 颜色索引在后台线程中载入与校验
+            self.color_index = color_index.ColorIndex()
+            self._index_queue = queue.Queue()
+            threading.Thread(target=self._index_worker, name="color-index", daemon=True).start()
+            self.preview_pool = preview_pool.PreviewPool(
+                compute_preview,
+                lambda seq, result: self.previewReady.emit(seq, result or "{}"),
+            )
             self.load_config()
 
             # Initialize wallpaper
@@ -87,9 +258,16 @@ def run_gui():
         flavorChanged = Signal(str)
         previewColorsChanged = Signal(list)
         wallpaperFolderChanged = Signal(str)
-        wallpaperListChanged = Signal(list)
         currentWallpaperChanged = Signal(str)
         previewThemeChanged = Signal(dict)
+        historyChanged = Signal(list)
+        previewReady = Signal(int, str)
+        libraryAdded = Signal(int, list)
+        libraryRemoved = Signal(int, list)
+        recursiveScanChanged = Signal(bool)
+        colorSortChanged = Signal(str)
+        colorQueryChanged = Signal(str)
+        colorIndexChanged = Signal()
 
         @Property(str, notify=colorModeChanged)
         def colorMode(self):
@@ -129,9 +307,48 @@ def run_gui():
                 self.wallpaperFolderChanged.emit(path)
                 self.scan_wallpapers()
 
-        @Property(list, notify=wallpaperListChanged)
-        def wallpaperList(self):
-            return self._wallpaper_list
+        @Property(QObject, constant=True)
+        def wallpaperModel(self):
+            return self.wallpaper_model
+
+        @Property(bool, notify=recursiveScanChanged)
+        def recursiveScan(self):
+            return self._recursive_scan
+
+        @recursiveScan.setter
+        def recursiveScan(self, val):
+            if self._recursive_scan != val:
+                self._recursive_scan = val
+                self.recursiveScanChanged.emit(val)
+                utils.update_config({"recursiveScan": "true" if val else "false"})
+                self.scan_wallpapers()
+
+        @Property(str, notify=colorSortChanged)
+        def colorSort(self):
+            return self._color_sort
+
+        @colorSort.setter
+        def colorSort(self, val):
+            if self._color_sort != val and val in color_index.SORT_KEYS:
+                self._color_sort = val
+                self.colorSortChanged.emit(val)
+                self.update_view()
+
+        @Property(str, notify=colorQueryChanged)
+        def colorQuery(self):
+            return self._color_query
+
+        @Slot(str)
+        def findSimilar(self, color):
+            """只显示源色与 color 最接近的壁纸"""
+            if color != self._color_query:
+                self._color_query = color
+                self.colorQueryChanged.emit(color)
+                self.update_view()
+
+        @Slot()
+        def clearColorSearch(self):
+            self.findSimilar("")
 
         @Property(str, notify=currentWallpaperChanged)
         def currentWallpaper(self):
@@ -149,20 +366,105 @@ def run_gui():
         def previewTheme(self):
             return self._preview_theme
 
+        @Property(list, notify=historyChanged)
+        def wallpaperHistory(self):
+            return self._history
+
+        @Slot()
+        def refresh_history(self):
+            history = self._load_history()
+            if history != self._history:
+                self._history = history
+                self.historyChanged.emit(history)
+
+        @staticmethod
+        def _load_history():
+            # 已被删除或移走的壁纸不再显示
+            return [h["path"] for h in state.history(limit=30) if os.path.isfile(h["path"])]
+
         def scan_wallpapers(self):
-            self._wallpaper_list = []
-            if os.path.isdir(self._wallpaper_folder):
-                valid_exts = {".png", ".jpg", ".jpeg", ".webp", ".jxl"}
+            """在后台线程中扫描 (见 library.py)，结果分批加入列表"""
+            self.stop_scan()
+            self._scan_id += 1
+            self._library = set()
+            self.wallpaper_model.reset([])
+            self._name_view = True
+            self.update_view()
+            if not os.path.isdir(self._wallpaper_folder):
+                return
+            scan_id = self._scan_id
+            self._index_queue.put(("load", self._wallpaper_folder))
+            self._scanner = library.LibraryScanner(
+                self._wallpaper_folder,
+                recursive=self._recursive_scan,
+                on_added=lambda paths: self.libraryAdded.emit(scan_id, paths),
+                on_removed=lambda paths: self.libraryRemoved.emit(scan_id, paths),
+            ).start()
+
+        def stop_scan(self):
+            if self._scanner is not None:
+                self._scanner.stop()
+                self._scanner = None
+
+        def on_library_added(self, scan_id, paths):
+            # 忽略已被替换的扫描发来的结果
+            if scan_id != self._scan_id:
+                return
+            added = [p for p in paths if p not in self._library]
+            self._library.update(added)
+            self._index_queue.put(("refresh", paths))
+            if not added or self._color_query:
+                # 相似颜色的结果在颜色索引更新后由 update_view 重新计算
+                return
+            if self._name_view:
+                self.wallpaper_model.insert_sorted(added)
+            else:
+                # 新壁纸还没有颜色信息，排在最后；索引更新后重新排序
+                self.wallpaper_model.append(sorted(added))
+
+        def on_library_removed(self, scan_id, paths):
+            if scan_id != self._scan_id:
+                return
+            self._library.difference_update(paths)
+            self.color_index.remove(paths)
+            self.wallpaper_model.remove(paths)
+
+        def _index_worker(self):
+            while True:
+                action, arg = self._index_queue.get()
                 try:
-                    for f in os.listdir(self._wallpaper_folder):
-                        if os.path.splitext(f)[1].lower() in valid_exts:
-                            self._wallpaper_list.append(
-                                os.path.join(self._wallpaper_folder, f)
-                            )
-                    self._wallpaper_list.sort()
+                    if action == "load":
+                        changed = self.color_index.load(arg)
+                    else:
+                        changed = self.color_index.refresh(arg)
                 except Exception as e:
-                    log.error(f"Error scanning wallpapers: {e}")
-            self.wallpaperListChanged.emit(self._wallpaper_list)
+                    log.error(f"Color index update failed: {e}")
+                    continue
+                if changed:
+                    self.colorIndexChanged.emit()
+
+        @Slot()
+        def update_view(self):
+            """根据颜色查找 / 排序方式重新生成网格中的列表"""
+            name_view = False
+            if self._color_query:
+                try:
+                    matches = self.color_index.nearest(
+                        self._color_query, k=SIMILAR_LIMIT, paths=self._library
+                    )
+                    view = [p for p, _ in matches]
+                except ValueError:
+                    view, name_view = sorted(self._library), True
+            elif self._color_sort == "name":
+                # 按路径排序的列表由扫描结果增量维护，颜色索引变化不影响它
+                if self._name_view:
+                    return
+                view, name_view = sorted(self._library), True
+            else:
+                view = self.color_index.sort(sorted(self._library), self._color_sort)
+            self._name_view = name_view
+            if view != self.wallpaper_model.paths:
+                self.wallpaper_model.reset(view)
 
         def get_wallpaper(self):
             if self._current_wallpaper and os.path.exists(self._current_wallpaper):
@@ -184,13 +486,31 @@ def run_gui():
                 f"Updating preview: mode={self._color_mode}, flavor={self._flavor}"
             )
 
-            if self.worker and self.worker.isRunning():
-                self.worker.terminate()
-                self.worker.wait()
+            # 旧的请求由任务池取消，不再强行终止线程
+            self.preview_pool.request(
+                wallpaper,
+                self._color_mode,
+                self._flavor,
+                neighbors=self.neighbors(wallpaper),
+            )
 
-            self.worker = PreviewWorker(wallpaper, self._color_mode, self._flavor)
-            self.worker.resultReady.connect(self.handle_result)
-            self.worker.start()
+        def neighbors(self, wallpaper):
+            """列表中与 wallpaper 相邻的壁纸，近的在前"""
+            try:
+                index = self.wallpaper_model.paths.index(wallpaper)
+            except ValueError:
+                return []
+            result = []
+            for distance in range(1, PREFETCH_RADIUS + 1):
+                for i in (index + distance, index - distance):
+                    if 0 <= i < len(self.wallpaper_model.paths):
+                        result.append(self.wallpaper_model.paths[i])
+            return result
+
+        def on_preview_ready(self, seq, json_str):
+            # 排队中的信号可能已经过时，只显示最新请求的结果
+            if seq == self.preview_pool.latest:
+                self.handle_result(json_str)
 
         def handle_result(self, json_str):
             try:
@@ -219,6 +539,16 @@ def run_gui():
                 self._preview_colors = preview_list
                 self.previewColorsChanged.emit(preview_list)
 
+                # 顺带记录这张壁纸的源色，供按颜色查找 / 排序使用
+                wallpaper = self.get_wallpaper()
+                if (
+                    c.get("source_color")
+                    and wallpaper in self._library
+                    and self.color_index.add(wallpaper, get_hex("source_color"))
+                    and (self._color_query or self._color_sort != "name")
+                ):
+                    self.update_view()
+
                 # Extract full theme for UI
                 theme_colors = {}
                 keys = [
@@ -261,16 +591,20 @@ def run_gui():
         @Slot()
         def apply_theme(self):
             try:
-                utils.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-                config = configparser.ConfigParser()
-                config["General"] = {
+                settings = {
                     "colorMode": self._color_mode,
                     "flavor": self._flavor,
                     "wallpaperFolder": self._wallpaper_folder,
                 }
-                with open(CONFIG_FILE, "w") as f:
-                    config.write(f)
-                log.info("Configuration saved.")
+                try:
+                    # 服务保存配置并立即安排更新
+                    ipc.request("apply", **settings)
+                    log.info("Configuration sent to the service.")
+                except (OSError, RuntimeError, ValueError):
+                    utils.CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+                    # 合并写入，保留 recursiveScan 等其它设置
+                    utils.update_config(settings)
+                    log.info("Configuration saved.")
 
                 # Apply wallpaper if selected
                 if self._current_wallpaper:
@@ -295,6 +629,7 @@ def run_gui():
 
         def load_config(self):
             self._color_mode, self._flavor, self._wallpaper_folder = utils.read_config()
+            self._recursive_scan = utils.load_config().recursive_scan
 
     # --- Start GUI ---
     app = QApplication(sys.argv)
@@ -302,12 +637,18 @@ def run_gui():
     app.setApplicationName("Matugen Controller")
 
     backend = Backend(app)
+    app.aboutToQuit.connect(backend.preview_pool.shutdown)
+    app.aboutToQuit.connect(backend.stop_scan)
 
     # --- Auto-start Background Service ---
     # 确保后台服务已安装并运行
     utils.ensure_service_running()
 
+    thumbnail_provider = ThumbnailProvider()
+    app.aboutToQuit.connect(thumbnail_provider.thumbnailer.shutdown)
+
     engine = QQmlApplicationEngine()
+    engine.addImageProvider("thumbnails", thumbnail_provider)
     engine.rootContext().setContextProperty("pythonBackend", backend)
 
     # 适配 QML 路径 (源码 vs 打包)
@@ -325,4 +666,6 @@ def run_gui():
 
 
 if __name__ == "__main__":
+    # 缩略图进程池使用 spawn，打包后的程序需要由此进入子进程
+    multiprocessing.freeze_support()
     run_gui()
@@ -20,6 +20,9 @@ ApplicationWindow {
     property string currentFlavor: pythonBackend ? pythonBackend.flavor : "tonal-spot"
     property var themeColors: (pythonBackend && pythonBackend.previewTheme && Object.keys(pythonBackend.previewTheme).length > 0) ? pythonBackend.previewTheme : null
 
+    // The service records applied wallpapers; pick them up when returning to the window
+    onActiveChanged: if (active && pythonBackend) pythonBackend.refresh_history()
+
     // Helper to safely get color
     function getColor(key, fallback) {
         if (themeColors && themeColors[key]) return themeColors[key];
@@ -255,6 +258,95 @@ ApplicationWindow {
                                     onClicked: folderDialog.open()
                                 }
                             }
+
+                            CheckBox {
+                                text: "Include subfolders"
+                                checked: pythonBackend ? pythonBackend.recursiveScan : false
+                                Material.accent: Material.primary
+                                contentItem: Text {
+                                    text: parent.text
+                                    font: parent.font
+                                    leftPadding: parent.indicator.width + parent.spacing
+                                    color: getColor("on_surface", "#000000")
+                                    verticalAlignment: Text.AlignVCenter
+                                }
+                                onToggled: if(pythonBackend) pythonBackend.recursiveScan = checked
+                            }
+
+                            // Color sorting and "similar color" filter (click a palette swatch)
+                            RowLayout {
+                                Layout.fillWidth: true
+                                spacing: 8
+
+                                Label {
+                                    text: "Sort by"
+                                    color: getColor("on_surface", "#000000")
+                                    opacity: 0.8
+                                }
+                                ComboBox {
+                                    id: sortBox
+                                    model: ["name", "hue", "chroma"]
+                                    currentIndex: pythonBackend ? Math.max(0, model.indexOf(pythonBackend.colorSort)) : 0
+                                    Material.accent: Material.primary
+                                    onActivated: if(pythonBackend) pythonBackend.colorSort = currentText
+                                }
+                                Item { Layout.fillWidth: true }
+                                Button {
+                                    visible: pythonBackend ? pythonBackend.colorQuery !== "" : false
+                                    flat: true
+                                    text: "Similar colors  ✕"
+                                    contentItem: RowLayout {
+                                        spacing: 6
+                                        Rectangle {
+                                            width: 14
+                                            height: 14
+                                            radius: 7
+                                            color: pythonBackend && pythonBackend.colorQuery ? pythonBackend.colorQuery : "transparent"
+                                            border.color: Qt.alpha(getColor("outline", "#000000"), 0.3)
+                                        }
+                                        Text {
+                                            text: "Similar colors  ✕"
+                                            color: getColor("on_surface", "#000000")
+                                        }
+                                    }
+                                    onClicked: if(pythonBackend) pythonBackend.clearColorSearch()
+                                }
+                            }
+                        }
+
+                        // Recently applied wallpapers (state database history)
+                        ListView {
+                            id: historyList
+                            Layout.fillWidth: true
+                            Layout.preferredHeight: 56
+                            visible: count > 0
+                            orientation: ListView.Horizontal
+                            spacing: 6
+                            clip: true
+                            model: pythonBackend ? pythonBackend.wallpaperHistory : []
+                            delegate: Rectangle {
+                                width: 72
+                                height: historyList.height
+                                radius: 6
+                                color: "transparent"
+                                border.color: (pythonBackend && pythonBackend.currentWallpaper === modelData) ? Material.primary : "transparent"
+                                border.width: 2
+
+                                Image {
+                                    anchors.fill: parent
+                                    anchors.margins: 2
+                                    source: "image://thumbnails/" + encodeURIComponent(modelData)
+                                    asynchronous: true
+                                    fillMode: Image.PreserveAspectCrop
+                                    sourceSize.width: 128
+                                    sourceSize.height: 128
+                                }
+                                MouseArea {
+                                    anchors.fill: parent
+                                    cursorShape: Qt.PointingHandCursor
+                                    onClicked: if(pythonBackend) pythonBackend.currentWallpaper = modelData
+                                }
+                            }
                         }
 
                         // Wallpaper Grid
@@ -266,31 +358,75 @@ ApplicationWindow {
                             cellWidth: width / 2
                             cellHeight: cellWidth * 0.75
 
-                            model: pythonBackend ? pythonBackend.wallpaperList : []
+                            // Arrow keys move the selection; currentIndex follows the selected wallpaper
+                            focus: true
+                            currentIndex: -1
+
+                            function syncCurrent() {
+                                if (pythonBackend)
+                                    currentIndex = pythonBackend.wallpaperModel.indexOf(pythonBackend.currentWallpaper)
+                            }
+
+                            // Only explicit key presses select, so model resets never change the wallpaper
+                            Keys.onPressed: (event) => {
+                                const arrows = [Qt.Key_Left, Qt.Key_Right, Qt.Key_Up, Qt.Key_Down]
+                                if (!pythonBackend || count === 0 || arrows.indexOf(event.key) < 0)
+                                    return
+                                if (currentIndex < 0) {
+                                    currentIndex = 0
+                                } else if (event.key === Qt.Key_Left) {
+                                    moveCurrentIndexLeft()
+                                } else if (event.key === Qt.Key_Right) {
+                                    moveCurrentIndexRight()
+                                } else if (event.key === Qt.Key_Up) {
+                                    moveCurrentIndexUp()
+                                } else {
+                                    moveCurrentIndexDown()
+                                }
+                                event.accepted = true
+                                if (currentItem)
+                                    pythonBackend.currentWallpaper = currentItem.wallpaperPath
+                            }
+
+                            onCountChanged: syncCurrent()
+
+                            Connections {
+                                target: pythonBackend
+                                function onCurrentWallpaperChanged(path) { wallGrid.syncCurrent() }
+                            }
+
+                            // List model: scan batches insert rows instead of resetting the grid
+                            model: pythonBackend ? pythonBackend.wallpaperModel : null
                             delegate: Item {
                                 width: wallGrid.cellWidth
                                 height: wallGrid.cellHeight
+                                property string wallpaperPath: model.path
 
                                 Rectangle {
                                     anchors.fill: parent
                                     anchors.margins: 4
                                     color: "transparent"
-                                    border.color: (pythonBackend && pythonBackend.currentWallpaper === modelData) ? Material.primary : "transparent"
+                                    border.color: (pythonBackend && pythonBackend.currentWallpaper === wallpaperPath) ? Material.primary : "transparent"
                                     border.width: 3
                                     radius: 8
 
                                     Image {
                                         anchors.fill: parent
                                         anchors.margins: 3
-                                        source: "file://" + modelData
+                                        // Shared freedesktop thumbnails, generated off the GUI thread
+                                        source: "image://thumbnails/" + encodeURIComponent(wallpaperPath)
+                                        asynchronous: true
                                         fillMode: Image.PreserveAspectCrop
-                                        sourceSize.width: 200
-                                        sourceSize.height: 200
+                                        sourceSize.width: 256
+                                        sourceSize.height: 256
                                         layer.enabled: true
 
                                         MouseArea {
                                             anchors.fill: parent
-                                            onClicked: if(pythonBackend) pythonBackend.currentWallpaper = modelData
+                                            onClicked: {
+                                                wallGrid.forceActiveFocus()
+                                                if(pythonBackend) pythonBackend.currentWallpaper = wallpaperPath
+                                            }
                                             hoverEnabled: true
                                             cursorShape: Qt.PointingHandCursor
                                         }
@@ -360,8 +496,10 @@ ApplicationWindow {
                                                 id: paletteMa
                                                 anchors.fill: parent
                                                 hoverEnabled: true
-                                                onEntered: window.tooltipText = modelData.name + ": " + modelData.color
+                                                cursorShape: Qt.PointingHandCursor
+                                                onEntered: window.tooltipText = modelData.name + ": " + modelData.color + " (click to find similar wallpapers)"
                                                 onExited: window.tooltipText = ""
+                                                onClicked: if(pythonBackend) pythonBackend.findSimilar(modelData.color)
                                                 onPositionChanged: (mouse) => {
                                                     var pos = mapToItem(window.contentItem, mouse.x, mouse.y)
                                                     window.tooltipPos = pos